@@ -11,6 +11,8 @@
 # 
 # Output format:
 #   file_lang1	file_lang2	plaintext_encoded_base64_lang1	plaintext_encoded_base64_lang2
+# or, with --docids:
+#   file_lang1	file_lang2	plaintext_encoded_base64_lang1	plaintext_encoded_base64_lang2	docid_lang1	docid_lang2
 #
 
 import os
@@ -20,7 +22,7 @@ from operator import itemgetter
 import lzma
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/utils")
-from utils.common import open_xz_or_gzip_or_plain
+from utils.common import open_xz_or_gzip_or_plain, get_lines
 
 oparser = argparse.ArgumentParser(description="usage: %prog [options]\nTool that processes a .ridx (reverse index) "
                                               "file (either from a file or from the standard input) and produces a "
@@ -54,6 +56,9 @@ oparser.add_argument("-i", "--iterations", help="Number of iterations to keep lo
 oparser.add_argument("-s", "--nonsymmetric", help="Write document alignments even if they are not backwards aligned ("
                                                   "option incompatible with 'iterations' option)",
                      dest="nonsymmetric", action="store_true")
+oparser.add_argument("--docids", help="Write the ids of both documents (their line numbers in the pre-processing "
+                                      "files) after their texts, so they can be found even if several documents "
+                                      "have the same URL", dest="docids", action="store_true")
 
 options = oparser.parse_args()
 reader = None
@@ -84,14 +89,13 @@ indicesProb = {}
 documents = {}
 documentsFile2 = set()
 
-# Files containing base64 encoded text and url are read and stored in a document map
+# File containing the urls is read and stored in a document map; the base64 encoded text is only read at the end
+# for the documents aligned
 counter = 1
-with open_xz_or_gzip_or_plain(options.text) as text_reader:
-    with open_xz_or_gzip_or_plain(options.url) as url_reader:
-        for text in text_reader:
-            url = next(url_reader, None).strip()
-            documents[counter] = (url, text.strip())  # URL parsed_text_base64
-            counter += 1
+with open_xz_or_gzip_or_plain(options.url) as url_reader:
+    for url in url_reader:
+        documents[counter] = url.strip()
+        counter += 1
 
 if not combine:
     # Reading the .ridx file with the preliminary alignment
@@ -233,14 +237,19 @@ else:
     if options.oridx is not None:
         options.oridx.close()
 
+# Only the text of the aligned documents is read (XZ files are accessed through their block index)
+texts = get_lines(options.text, [i for i in list(indices.keys()) + list(indices.values()) if i in documents])
+
 for k in indices:
     if indices[k] in documents.keys():
         if indices[k] in documentsFile2:  # Write the output keeping the language documents always in the same order
             # (this is done because of the non-symmetric option that causes swaps in the last algorithm)
-            print("{0}\t{1}\t{2}\t{3}".format(documents[k][0], documents[indices[k]][0], documents[k][1],
-                                              documents[indices[k]][1]))
+            print("{0}\t{1}\t{2}\t{3}".format(documents[k], documents[indices[k]], texts[k].strip(),
+                                              texts[indices[k]].strip())
+                  + ("\t{0}\t{1}".format(k, indices[k]) if options.docids else ""))
         else:
-            print("{1}\t{0}\t{3}\t{2}".format(documents[k][0], documents[indices[k]][0], documents[k][1],
-                                              documents[indices[k]][1]))
+            print("{1}\t{0}\t{3}\t{2}".format(documents[k], documents[indices[k]], texts[k].strip(),
+                                              texts[indices[k]].strip())
+                  + ("\t{1}\t{0}".format(k, indices[k]) if options.docids else ""))
         if not options.nonsymmetric:
             del documents[k]
@@ -23,7 +23,11 @@ import base64
 import subprocess
 import re
 from tempfile import NamedTemporaryFile
-from external_processor import ExternalTextProcessor
+
+# In-process tokenisers can be loaded from utils (for example, py:simpletokenisers:tokenise)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/utils")
+from external_processor import text_processor, WORDS, SENTENCES, MorphologicalAnalyser
+from utils.common import IndexedXZFile
 
 
 def run_aligner(filename1, filename2, dic, hunaligndir):
@@ -47,26 +51,35 @@ def run_aligner(filename1, filename2, dic, hunaligndir):
 
 
 def run_analyse(morph, text):
-    panalyse = subprocess.Popen(morph, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-    morph_stdout, error = panalyse.communicate(input=text)
-    if len(error.strip()) == 0:
+    morph_stdout = morph.analyse(text)
+    if morph_stdout is not None:
         tokenized_text = re.sub(r"\^", "", re.sub(r"[/<][^$]*\$", "", morph_stdout))  # Not a good tokenisation
         return tokenized_text
     else:
         return text
 
 
-def extract_encoded_text(encodedtext, tmp_file, tmp_file_origtext, morphanal, sent_tokeniser, word_tokeniser):
-    proc_sent = ExternalTextProcessor(sent_tokeniser.split(' '))
-    proc_word = ExternalTextProcessor(word_tokeniser.split(' '))
+def extract_encoded_text(encodedtext, tmp_file, tmp_file_origtext, morphanal, proc_sent, proc_word):
     content = base64.b64decode(encodedtext).decode("utf-8").replace("\t", " ")
     tokenized_segs = proc_sent.process(content).strip()
     tmp_file_origtext.write(tokenized_segs.encode())
     tokenized_text = proc_word.process(tokenized_segs)
 
     if morphanal is not None:
-        morphanalyser = ["/bin/bash", morphanal]
-        tokenized_text = run_analyse(morphanalyser, tokenized_text)
+        tokenized_text = run_analyse(morphanal, tokenized_text)
+    tmp_file.write(tokenized_text.lower().encode())
+
+
+def extract_tokenised_document(docid, tmp_file, tmp_file_origtext, morphanal):
+    # Same output as extract_encoded_text, from the files written by bitextor-tokenise
+    tokenized_segs = base64.b64decode(sentences_file.get_line(docid)).decode("utf-8")
+    tmp_file_origtext.write(tokenized_segs.encode())
+    tokenized_text = base64.b64decode(tokenised_file.get_line(docid)).decode("utf-8")
+    if tokenized_text:
+        tokenized_text += "\n"
+
+    if morphanal is not None:
+        tokenized_text = run_analyse(morphanal, tokenized_text)
     tmp_file.write(tokenized_text.lower().encode())
 
 
@@ -142,17 +155,46 @@ oparser.add_argument("-d", help="Bilingual dictionary used for aligning and scor
 oparser.add_argument("-t", "--tmp-dir",
                      help="Temporary directory to be used for internal temporary files (/tmp by default)",
                      dest="tmpdir", required=False, default="/tmp")
-oparser.add_argument("--morphanalyser_sl", help="Path to the Apertium's morphological analyser for SL to TL",
-                     dest="morphanal1", default=None)
-oparser.add_argument("--morphanalyser_tl", help="Path to the Apertium's morphological analyser for TL to SL",
-                     dest="morphanal2", default=None)
-oparser.add_argument("--sent-tokeniser_sl", help="Path to the sentence tokeniser for SL", dest="senttok1", default=None)
-oparser.add_argument("--sent-tokeniser_tl", help="Path to the sentence tokeniser for TL", dest="senttok2", default=None)
-oparser.add_argument("--word-tokeniser_sl", help="Path to the word tokeniser for SL", dest="wordtok1", default=None)
-oparser.add_argument("--word-tokeniser_tl", help="Path to the word tokeniser for TL", dest="wordtok2", default=None)
+oparser.add_argument("--morphanalyser_sl", dest="morphanal1", default=None,
+                     help="Path to the Apertium's morphological analyser for SL to TL; a single process is used for all "
+                          "the documents if the script runs the Apertium tools with -z (null-flush mode)")
+oparser.add_argument("--morphanalyser_tl", dest="morphanal2", default=None,
+                     help="Path to the Apertium's morphological analyser for TL to SL; a single process is used for all "
+                          "the documents if the script runs the Apertium tools with -z (null-flush mode)")
+oparser.add_argument("--sent-tokeniser_sl", help="Path to the sentence tokeniser for SL (or py:module:callable[:argument] "
+                                                "for one run in-process)", dest="senttok1", default=None)
+oparser.add_argument("--sent-tokeniser_tl", help="Path to the sentence tokeniser for TL (or py:module:callable[:argument] "
+                                                "for one run in-process)", dest="senttok2", default=None)
+oparser.add_argument("--word-tokeniser_sl", help="Path to the word tokeniser for SL (or py:module:callable[:argument] for "
+                                                "one run in-process)", dest="wordtok1", default=None)
+oparser.add_argument("--word-tokeniser_tl", help="Path to the word tokeniser for TL (or py:module:callable[:argument] for "
+                                                "one run in-process)", dest="wordtok2", default=None)
+oparser.add_argument("--sentences", dest="sentences", default=None,
+                     help="File produced by bitextor-tokenise with the sentences of every document; if it is given "
+                          "with --tokenised, documents are looked up in these files by the ids written by "
+                          "bitextor-align-documents (or document-aligner/build_docs.py) with --docids instead of "
+                          "running the sentence splitters and word tokenisers")
+oparser.add_argument("--tokenised", dest="tokenised", default=None,
+                     help="File produced by bitextor-tokenise with the tokenised sentences of every document")
 
 options = oparser.parse_args()
 
+# Tokenisers are started once and documents are streamed through them
+# Morphological analysers are started once for all the documents in their language
+morphanal1 = MorphologicalAnalyser(options.morphanal1) if options.morphanal1 is not None else None
+morphanal2 = MorphologicalAnalyser(options.morphanal2) if options.morphanal2 is not None else None
+
+tokenised_once = options.sentences is not None and options.tokenised is not None
+if tokenised_once:
+    sentences_file = IndexedXZFile(options.sentences)
+    tokenised_file = IndexedXZFile(options.tokenised)
+    senttok1 = senttok2 = wordtok1 = wordtok2 = None
+else:
+    senttok1 = text_processor(options.senttok1, SENTENCES)
+    senttok2 = text_processor(options.senttok2, SENTENCES)
+    wordtok1 = text_processor(options.wordtok1, WORDS)
+    wordtok2 = text_processor(options.wordtok2, WORDS)
+
 if options.aligned_docs is None:
     reader = sys.stdin
 else:
@@ -175,10 +217,16 @@ for line in reader_list:
     encodedtext1 = fields[2]
     encodedtext2 = fields[3]
 
-    extract_encoded_text(encodedtext1, tmp_file1, tmp_file1_origtext, options.morphanal1, options.senttok1,
-                         options.wordtok1)
-    extract_encoded_text(encodedtext2, tmp_file2, tmp_file2_origtext, options.morphanal2, options.senttok2,
-                         options.wordtok2)
+    if tokenised_once:
+        # Documents are found by id and not by URL, which can be repeated
+        if len(fields) < 6:
+            sys.stderr.write("Aligned documents without document ids: run bitextor-align-documents with --docids\n")
+            sys.exit(1)
+        extract_tokenised_document(int(fields[4]), tmp_file1, tmp_file1_origtext, morphanal1)
+        extract_tokenised_document(int(fields[5]), tmp_file2, tmp_file2_origtext, morphanal2)
+    else:
+        extract_encoded_text(encodedtext1, tmp_file1, tmp_file1_origtext, morphanal1, senttok1, wordtok1)
+        extract_encoded_text(encodedtext2, tmp_file2, tmp_file2_origtext, morphanal2, senttok2, wordtok2)
 
     tmp_file1_name = tmp_file1.name
     tmp_file2_name = tmp_file2.name
@@ -196,3 +244,8 @@ for line in reader_list:
     os.remove(tmp_file1_origtext.name)
     os.remove(tmp_file2.name)
     os.remove(tmp_file2_origtext.name)
+
+for side, morphanalyser in [("SL", morphanal1), ("TL", morphanal2)]:
+    if morphanalyser is not None:
+        sys.stderr.write("Morphological analyser for " + side + ": " + morphanalyser.report() + "\n")
+        morphanalyser.close()
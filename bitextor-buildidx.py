@@ -8,23 +8,104 @@
 # 4. Creating a list with the words corresponding to every language and a list of the documents in which these
 # words appear
 #
-# Output format:
+# Output format (lines sorted by language and word):
 # language      word    num_doc[:inc(num_doc)]*
 #
 # Generates .idx -> index
 #
+# Documents are processed in chunks; the index of every chunk is written to a temporary file, sorted, and all of them
+# are merged at the end, so memory does not grow with the size of the website and chunks can be processed in parallel
+#
 
 import os
 import sys
 import base64
 import argparse
-import subprocess
 import re
+import heapq
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from itertools import groupby
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/utils")
 from unicodepunct import get_unicode_punct
 from utils.common import open_xz_or_gzip_or_plain
-from external_processor import ExternalTextProcessor
+from utils.binidx import BinaryIndexWriter
+from external_processor import text_processor, WORDS, MorphologicalAnalyser
+
+
+def document_words(text, lang):
+    """Returns the list of different words (lowercased and without punctuation at the ends) in a document"""
+    if len(text.strip()) != 0 and lang in morphanalysers:
+        morph_stdout = morphanalysers[lang].analyse(text)
+        if morph_stdout is not None:
+            text = re.sub(r"\^\*?", r"", re.sub(r"[/<][^$]*\$", r"", morph_stdout))
+
+    # Getting the bag of words in the document
+    if options.tokenised is not None:
+        # Paragraph marks written by Moses sentence splitter are not words
+        tokenised_text = "\n".join(line for line in text.split("\n") if line != "<P>")
+    else:
+        proc = None
+        if lang == options.lang1:
+            proc = tokeniser1
+        elif lang == options.lang2:
+            proc = tokeniser2
+        tokenised_text = proc.process(text)
+
+    sorted_uniq_wordlist = set(tokenised_text.lower().split())
+    # Trimming non-aplphanumerics:
+    return [_f for _f in [w.strip(punctuation) for w in sorted_uniq_wordlist] if _f]
+
+
+def index_chunk(chunk):
+    """Indexes a chunk of documents, given as a list of (document number, text in base64, language), and writes the
+    index to a temporary file with a line per language and word, sorted, with the documents in which it appears.
+    Returns the name of the file and the time spent in every document by the morphological analysers"""
+    analysed = {lang: len(morphanalyser.latencies) for lang, morphanalyser in morphanalysers.items()}
+    word_map = {}
+    for docnumber, encoded_text, lang in chunk:
+        text = base64.b64decode(encoded_text.strip()).decode("utf-8")
+        for word in document_words(text, lang):
+            word_map.setdefault((lang, word), []).append(docnumber)
+
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=partial_dir, prefix="chunk.", delete=False) \
+            as partial:
+        for (lang, word), docs in sorted(word_map.items()):
+            partial.write(lang + "\t" + word + "\t" + ":".join(map(str, docs)) + "\n")
+    latencies = {lang: (morphanalyser.latencies[analysed[lang]:], morphanalyser.processor.persistent)
+                 for lang, morphanalyser in morphanalysers.items()}
+    return partial.name, latencies
+
+
+def read_chunks(text_reader, lang_reader, semaphore=None):
+    chunk = []
+    for docnumber, line in enumerate(text_reader):
+        chunk.append((docnumber, line, next(lang_reader, None).strip()))
+        if len(chunk) == options.chunk_size:
+            # When chunks are sent to worker processes, the semaphore bounds the number of chunks read in advance
+            if semaphore is not None:
+                semaphore.acquire()
+                # Indexing failed: the pool stops asking for chunks, so it can be terminated
+                if stop_reading.is_set():
+                    return
+            yield chunk
+            chunk = []
+    if chunk:
+        if semaphore is not None:
+            semaphore.acquire()
+            if stop_reading.is_set():
+                return
+        yield chunk
+
+
+def read_partial_index(file_name):
+    with open(file_name, "r", encoding="utf-8") as partial:
+        for line in partial:
+            lang, word, docs = line.rstrip("\n").split("\t")
+            yield lang, word, docs
 
 
 oparser = argparse.ArgumentParser(
@@ -34,7 +115,11 @@ oparser = argparse.ArgumentParser(
 oparser.add_argument('--text', dest='text',
                      help='File produced by bitextor-warc2preprocess containing the text of all the records in the '
                           'WARC file encoded as base 64 (each line corresponds to a record)',
-                     required=True)
+                     required=False, default=None)
+oparser.add_argument('--tokenised', dest='tokenised',
+                     help='File produced by bitextor-tokenise containing the tokenised sentences of all the records '
+                          'encoded as base 64; if it is given, it is read instead of --text and the word tokenisers '
+                          'are not run', required=False, default=None)
 oparser.add_argument('--lang', dest='lang',
                      help='File produced by bitextor-warc2preprocess containing the language of each of the records '
                           'in the WARC file encoded as base 64 (each line corresponds to a record)',
@@ -42,82 +127,119 @@ oparser.add_argument('--lang', dest='lang',
 oparser.add_argument("-m", "--max-occ",
                      help="Maximum number of occurrences of a word in one language to be kept in the index", type=int,
                      dest="maxo", default=-1)
-oparser.add_argument("--morphanalyser_sl", help="Path to the Apertium's morphological analyser for SL to TL",
-                     dest="morphanal1", default=None)
-oparser.add_argument("--morphanalyser_tl", help="Path to the Apertium's morphological analyser for TL to SL",
-                     dest="morphanal2", default=None)
+oparser.add_argument("--morphanalyser_sl", dest="morphanal1", default=None,
+                     help="Path to the Apertium's morphological analyser for SL to TL; a single process is used for all "
+                          "the documents if the script runs the Apertium tools with -z (null-flush mode)")
+oparser.add_argument("--morphanalyser_tl", dest="morphanal2", default=None,
+                     help="Path to the Apertium's morphological analyser for TL to SL; a single process is used for all "
+                          "the documents if the script runs the Apertium tools with -z (null-flush mode)")
 oparser.add_argument("--lang1", help="Two-characters-code for language 1 in the pair of languages", dest="lang1",
                      required=True)
 oparser.add_argument("--lang2", help="Two-characters-code for language 2 in the pair of languages", dest="lang2",
                      required=True)
-oparser.add_argument("--wordtokeniser1", help="Word tokeniser script for language 1", dest="wordtokeniser1",
-                     required=True)
-oparser.add_argument("--wordtokeniser2", help="Word tokeniser script for language 2", dest="wordtokeniser2",
-                     required=True)
+oparser.add_argument("--wordtokeniser1", help="Word tokeniser script for language 1, or py:module:callable[:argument] "
+                                              "for a tokeniser run in-process", dest="wordtokeniser1", default=None)
+oparser.add_argument("--wordtokeniser2", help="Word tokeniser script for language 2, or py:module:callable[:argument] "
+                                              "for a tokeniser run in-process", dest="wordtokeniser2", default=None)
+oparser.add_argument("--workers", help="Number of processes used to tokenise the documents and index them; the output "
+                                       "is the same regardless of this value", dest="workers", type=int, default=1)
+oparser.add_argument("--chunk-size", help="Number of documents indexed in memory before writing their index to a "
+                                          "temporary file (10000 by default)", dest="chunk_size", type=int,
+                     default=10000)
+oparser.add_argument("--binary-output", help="Write the index in binary format (read faster by bitextor-idx2ridx) to "
+                                             "this file instead of writing it as text to the standard output",
+                     dest="binary_output", default=None)
+oparser.add_argument("--tmp-dir", help="Directory for the temporary files (the system default if not given)",
+                     dest="tmpdir", default=None)
 
 options = oparser.parse_args()
-
-docnumber = 0
-word_map = {}
+if options.tokenised is None and (options.text is None or options.wordtokeniser1 is None or
+                                  options.wordtokeniser2 is None):
+    oparser.error("either --tokenised or --text, --wordtokeniser1 and --wordtokeniser2 are required")
 
 punctuation = get_unicode_punct()
 
-with open_xz_or_gzip_or_plain(options.text) as text_reader:
-    with open_xz_or_gzip_or_plain(options.lang) as lang_reader:
-
-        for line in text_reader:
-            ##################
-            # Parsing the text:
-            ##################
-            text = base64.b64decode(line.strip()).decode("utf-8")
-            lang = next(lang_reader, None).strip()
-            proc = None
-
-            if len(text.strip()) != 0 and options.morphanal1 is not None and lang == options.lang1:
-                morphanalyser = ["/bin/bash", options.morphanal1]
-                spmorph = subprocess.Popen(morphanalyser, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                           stdin=subprocess.PIPE)
-                morph_stdout, error = spmorph.communicate(input=text)
-                if len(error.strip()) == 0:
-                    text = re.sub(r"\^\*?", r"", re.sub(r"[/<][^$]*\$", r"", morph_stdout.decode("utf-8")))
-
-            if len(text.strip()) != 0 and options.morphanal2 is not None and lang == options.lang2:
-                morphanalyser = ["/bin/bash", options.morphanal2]
-                tpmorph = subprocess.Popen(morphanalyser, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                           stdin=subprocess.PIPE)
-                morph_stdout, error = tpmorph.communicate(input=text)
-                if len(error.strip()) == 0:
-                    text = re.sub(r"\^\*?", r"", re.sub(r"[/<][^$]*\$", r"", morph_stdout.decode("utf-8")))
-
-            # Getting the bag of words in the document
-            if lang == options.lang1:
-                proc = ExternalTextProcessor(options.wordtokeniser1.split(' '))
-            elif lang == options.lang2:
-                proc = ExternalTextProcessor(options.wordtokeniser2.split(' '))
-
-            sorted_uniq_wordlist = set(proc.process(text).lower().split())
-            # Trimming non-aplphanumerics:
-            clean_sorted_uniq_wordlist = [_f for _f in [w.strip(punctuation) for w in sorted_uniq_wordlist] if _f]
-            sorted_uniq_wordlist = clean_sorted_uniq_wordlist
-
-            for word in sorted_uniq_wordlist:
-                if lang in word_map:
-                    if word in word_map[lang]:
-                        word_map[lang][word].append(docnumber)
-                    else:
-                        word_map[lang][word] = []
-                        word_map[lang][word].append(docnumber)
-                else:
-                    word_map[lang] = {}
-                    word_map[lang][word] = []
-                    word_map[lang][word].append(docnumber)
-            docnumber = docnumber + 1
-
-    for map_lang, map_vocabulary in list(word_map.items()):
-        for map_word, map_doc in list(map_vocabulary.items()):
-            if options.maxo == -1 or len(word_map[map_lang][map_word]) <= options.maxo:
-                sorted_docs = sorted(word_map[map_lang][map_word], reverse=True)
-                for doc_list_idx in range(0, len(sorted_docs) - 1):
-                    sorted_docs[doc_list_idx] = str(sorted_docs[doc_list_idx] - sorted_docs[doc_list_idx + 1])
-                sorted_docs[len(sorted_docs) - 1] = str(sorted_docs[len(sorted_docs) - 1])
-                print(map_lang + "\t" + map_word + "\t" + ":".join(reversed(sorted_docs)))
+# Tokenisers are started once (in every worker process) and documents are streamed through them
+if options.tokenised is None:
+    tokeniser1 = text_processor(options.wordtokeniser1, WORDS)
+    tokeniser2 = text_processor(options.wordtokeniser2, WORDS)
+
+# Morphological analysers are started once for all the documents in their language
+morphanalysers = {}
+if options.morphanal1 is not None:
+    morphanalysers[options.lang1] = MorphologicalAnalyser(options.morphanal1)
+if options.morphanal2 is not None:
+    morphanalysers[options.lang2] = MorphologicalAnalyser(options.morphanal2)
+
+# Partial indexes are written to a directory of this run, which is removed with everything in it even if indexing
+# fails, including the files of chunks indexed by the workers but not collected yet
+partial_dir = tempfile.mkdtemp(dir=options.tmpdir, prefix="buildidx.")
+partial_files = []
+pool = None
+stop_reading = threading.Event()
+try:
+    with open_xz_or_gzip_or_plain(options.tokenised or options.text) as text_reader:
+        with open_xz_or_gzip_or_plain(options.lang) as lang_reader:
+            if options.workers > 1:
+                semaphore = threading.BoundedSemaphore(options.workers * 2)
+                pool = multiprocessing.Pool(options.workers)
+                results = pool.imap(index_chunk, read_chunks(text_reader, lang_reader, semaphore))
+            else:
+                semaphore = None
+                results = map(index_chunk, read_chunks(text_reader, lang_reader))
+
+            for partial_file, latencies in results:
+                if semaphore is not None:
+                    semaphore.release()
+                partial_files.append(partial_file)
+                if pool is not None:
+                    for lang, (lang_latencies, persistent) in latencies.items():
+                        morphanalysers[lang].latencies.extend(lang_latencies)
+                        morphanalysers[lang].processor.persistent &= persistent
+
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    # Partial indexes are merged by language and word; chunks are in document order, so the documents of every word
+    # are already sorted when the lists of every chunk are concatenated
+    partial_indexes = [read_partial_index(partial_file) for partial_file in partial_files]
+    binary_index = BinaryIndexWriter(options.binary_output) if options.binary_output is not None else None
+    try:
+        for (map_lang, map_word), entries in groupby(heapq.merge(*partial_indexes, key=lambda entry: entry[:2]),
+                                                    key=lambda entry: entry[:2]):
+            docs = [int(doc) for entry in entries for doc in entry[2].split(":")]
+            if binary_index is not None:
+                if options.maxo == -1 or len(docs) <= options.maxo:
+                    binary_index.add(map_lang, map_word, docs)
+            elif options.maxo == -1 or len(docs) <= options.maxo:
+                deltas = [str(docs[0])] + [str(docs[k] - docs[k - 1]) for k in range(1, len(docs))]
+                print(map_lang + "\t" + map_word + "\t" + ":".join(deltas))
+    except BaseException:
+        # An incomplete binary index is not left behind
+        if binary_index is not None:
+            binary_index.file.close()
+            os.remove(options.binary_output)
+        raise
+    finally:
+        for partial_index in partial_indexes:
+            partial_index.close()
+    if binary_index is not None:
+        binary_index.close()
+finally:
+    if pool is not None:
+        # If anything failed, the pool may be waiting for the semaphore to read more chunks: it is released, so the
+        # pool finds that there are no more, and the workers still running are stopped
+        stop_reading.set()
+        try:
+            while True:
+                semaphore.release()
+        except ValueError:
+            pass
+        pool.terminate()
+        pool.join()
+    shutil.rmtree(partial_dir, ignore_errors=True)
+
+for morph_lang, morphanalyser in morphanalysers.items():
+    sys.stderr.write("Morphological analyser for " + morph_lang + ": " + morphanalyser.report() + "\n")
+    morphanalyser.close()
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+
+#
+# Extracts once, after bitextor-warc2preprocess, everything the document alignment features need from every document
+# (links, images, structure of the HTML and URL) and writes it to a feature sidecar, so features/bitextor-features.py
+# can rescore candidates reading it instead of the HTML (see utils/featurestore.py).
+#
+
+import os
+import sys
+import argparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/utils")
+from utils.common import open_xz_or_gzip_or_plain
+from utils.docfeatures import decode_html
+from utils.featurestore import FeatureStoreWriter
+
+oparser = argparse.ArgumentParser(
+    description="Script that extracts the links, images, HTML structure and URL of every document produced by "
+                "bitextor-warc2preprocess and stores them in a feature sidecar keyed by document id")
+oparser.add_argument("--html", help="File produced during pre-processing containing all HTML files in a WARC file",
+                     dest="html", required=True)
+oparser.add_argument("--url", help="File produced during pre-processing containing all the URLs in a WARC file",
+                     dest="url", required=True)
+oparser.add_argument("-o", "--output", dest="output", required=True, help="Feature sidecar file")
+options = oparser.parse_args()
+
+with open_xz_or_gzip_or_plain(options.html) as hd, open_xz_or_gzip_or_plain(options.url) as ud:
+    with FeatureStoreWriter(options.output) as writer:
+        for url in ud:
+            writer.add(url, decode_html(next(hd, None)))
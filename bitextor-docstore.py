@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+#
+# Converts the output of bitextor-warc2preprocess (one XZ file per field, with a line per document and HTML and text
+# encoded in base64) into a single document store with random access by document id, and back.
+#
+# Fields: url, lang, encoding, mime, normalized_html, plain_text and, if boilerpipe was used, deboilerplate_html
+#
+
+import os
+import sys
+import base64
+import argparse
+import lzma
+from contextlib import ExitStack
+from itertools import zip_longest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/utils")
+from utils.common import open_xz_or_gzip_or_plain
+from utils.docstore import DocumentStoreWriter, DocumentStoreReader
+
+FIELDS = ["url", "lang", "encoding", "mime", "normalized_html", "plain_text", "deboilerplate_html"]
+BASE64_FIELDS = {"normalized_html", "plain_text", "deboilerplate_html"}
+
+
+def pack(input_dir, prefix, output, block_size):
+    fields = [field for field in FIELDS if os.path.isfile(os.path.join(input_dir, prefix + field + ".xz"))]
+    with ExitStack() as stack:
+        files = [stack.enter_context(open_xz_or_gzip_or_plain(os.path.join(input_dir, prefix + field + ".xz")))
+                 for field in fields]
+        complete = True
+        with DocumentStoreWriter(output, fields, block_size) as writer:
+            for lines in zip_longest(*files):
+                # All the files must have a line per document
+                if None in lines:
+                    complete = False
+                    break
+                document = []
+                for field, line in zip(fields, lines):
+                    if field in BASE64_FIELDS:
+                        document.append(base64.b64decode(line.strip()).decode("utf-8"))
+                    else:
+                        document.append(line.strip())
+                writer.add(document)
+    if not complete:
+        # The document store written until then would look complete, so it is removed
+        os.remove(output)
+        sys.stderr.write("Pre-processing files in " + input_dir + " have different numbers of documents\n")
+        sys.exit(1)
+
+
+def unpack(input, output_dir, prefix):
+    with DocumentStoreReader(input) as reader:
+        files = {field: lzma.open(os.path.join(output_dir, prefix + field + ".xz"), "w") for field in reader.fields}
+        for document in reader:
+            for field in reader.fields:
+                if field in BASE64_FIELDS:
+                    files[field].write(base64.b64encode(document[field].encode("utf-8")) + b"\n")
+                else:
+                    files[field].write(document[field].encode("utf-8") + b"\n")
+        for field in files:
+            files[field].close()
+
+
+oparser = argparse.ArgumentParser(
+    description="Script that converts the files produced by bitextor-warc2preprocess into a document store (a single "
+                "file with random access to every document by its id) and a document store back into those files")
+oparser.add_argument("mode", choices=["pack", "unpack"],
+                     help="'pack' builds a document store from the pre-processing files; 'unpack' writes the "
+                          "pre-processing files from a document store")
+oparser.add_argument("--dir", dest="dir", required=True,
+                     help="Directory containing (pack) or where to write (unpack) the pre-processing files")
+oparser.add_argument("--prefix", dest="prefix", default="",
+                     help="Prefix of the names of the pre-processing files; if not specified it is empty string")
+oparser.add_argument("--store", dest="store", required=True, help="Document store file")
+oparser.add_argument("--block-size", dest="block_size", type=int, default=16,
+                     help="Number of documents compressed together in each block of the document store (16 by "
+                          "default); larger blocks compress better but make random access slower")
+options = oparser.parse_args()
+
+if options.mode == "pack":
+    pack(options.dir, options.prefix, options.store, options.block_size)
+else:
+    unpack(options.store, options.dir, options.prefix)
@@ -11,12 +11,22 @@
 # doc_id    [doc_id:score]+
 #
 
+import os
 import sys
 import argparse
+import lzma
+import multiprocessing
 from collections import defaultdict
 from operator import itemgetter
 import re
 
+import numpy as np
+from scipy.sparse import csr_matrix
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/utils")
+from utils.binidx import is_binary_index, BinaryIndexReader
+from utils.compileddic import open_dictionary
+
 
 def read_lett(f, docs):
     file = open(f, "r")
@@ -52,9 +62,48 @@ def fill_index(file, lang1, lang2, index1, index2):
 
 
 #
-# Loading bilingual lexicon (.dic)
+# Same as fill_index, for indexes in binary format; posting lists are read from the memory-mapped file
+#
+def fill_index_binary(path, lang1, lang2, index1, index2):
+    with BinaryIndexReader(path) as reader:
+        for lang, index in [(lang1, index1), (lang2, index2)]:
+            for word_id in reader.words(lang):
+                word = reader.word(word_id)
+                for doc in reader.docs(word_id).tolist():
+                    index[doc + 1].add(word)
+
+
+#
+# Same as fill_index_binary for the sparse engine: the matrix of documents by words of a language is built straight
+# from the posting lists of the memory-mapped file, without a set of words for every document. Returns the documents
+# (in order of first appearance in the index, as fill_index_binary adds them), the vocabulary (word -> column) and the
+# matrix
+#
+def binary_word_matrix(reader, lang):
+    words = reader.words(lang)
+    offsets = reader.posting_offsets[words.start:words.stop + 1].astype(np.int64) if len(words) > 0 \
+        else np.zeros(1, dtype=np.int64)
+    lengths = np.diff(offsets)
+    # Words without documents are not in any document of the text index either
+    word_ids = np.arange(words.start, words.stop)[lengths > 0]
+    postings = reader.postings[offsets[0]:offsets[-1]]
+    docs, first, inverse = np.unique(postings, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    doc_rows = np.empty(len(docs), dtype=np.int64)
+    doc_rows[order] = np.arange(len(docs))
+    # Coordinates of the matrix: the row of every document of the postings, and the column of its word repeated over
+    # the length of the posting list
+    rows = doc_rows[inverse.ravel()]
+    cols = np.repeat(np.arange(len(word_ids)), lengths[lengths > 0])
+    matrix = csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(len(docs), len(word_ids)))
+    vocabulary = {reader.word(int(word_id)): col for col, word_id in enumerate(word_ids)}
+    return (docs[order].astype(np.int64) + 1).tolist(), vocabulary, matrix
+
+
 #
-def load_dictionaries(dictionary, lang1, lang2, dic):
+# Loading bilingual lexicon (.dic); reverse_dic, if given, gets the translations from lang1 to lang2
+#
+def load_dictionaries(dictionary, lang1, lang2, dic, reverse_dic=None):
     col_dic1 = -1
     col_dic2 = -1
     file = open(dictionary, "r")
@@ -70,9 +119,27 @@ def load_dictionaries(dictionary, lang1, lang2, dic):
         fields = i.strip().split("\t")
         if len(fields) == 2:
             dic[fields[col_dic2]].append(fields[col_dic1])
+            if reverse_dic is not None:
+                reverse_dic[fields[col_dic1]].append(fields[col_dic2])
     file.close()
 
 
+#
+# Same as load_dictionaries, from a compiled dictionary (see utils/compileddic.py); only the translations of the words
+# in the indexes are read
+#
+def load_compiled_dictionary(compiled, lang1, lang2, words_lang1, words_lang2, dic, reverse_dic=None):
+    col_dic1 = compiled.column(lang1)
+    col_dic2 = compiled.column(lang2)
+    for words, column, direction_dic in [(words_lang2, col_dic2, dic), (words_lang1, col_dic1, reverse_dic)]:
+        if direction_dic is None:
+            continue
+        for word in words:
+            translations = compiled.translate(column, word)
+            if translations:
+                direction_dic[word] = translations
+
+
 #
 # Function that provides the set of translated words in a segments using a bilingual lexicon
 #
@@ -91,17 +158,214 @@ def translate_words(index, dic, dictp, translatedindex):
 # The initial lexicon is extended by adding all those words that appear exactly the same in
 # both sides (they are likely to be proper nouns, codes, dates, etc. that do not need to be translated).
 #
-def feed_dict_with_identical_words(index1, index2, dic):
-    words_lang1 = set()
-    for key, words in list(index1.items()):
-        words_lang1 = words_lang1.union(words)
+def feed_dict_with_identical_words(words_lang1, words_lang2, *dics):
+    for w in words_lang1.intersection(words_lang2):
+        for dic in dics:
+            dic[w].append(w)
 
-    words_lang2 = set()
-    for key, words in list(index2.items()):
-        words_lang2 = words_lang2.union(words)
 
-    for w in words_lang1.intersection(words_lang2):
-        dic[w].append(w)
+#
+# Vectorised version of the comparison of every document in language 1 with every document in language 2: documents
+# are rows of sparse matrices of words (the words of language 1 in lang1 documents and the translations of the words
+# into language 1 in lang2 documents), so the number of words shared by all the pairs is a matrix product, which
+# (as an inverted index) only touches the pairs that share some word. The matrices of words of both languages and the
+# relation between them are built once: the other direction uses the transposed relation, as the reverse lexicon is
+# the same one read the other way round. Words that appear in too many documents can be left out when looking for the
+# pairs to compare (they are still counted in the scores of the pairs found). If documents have to belong to the same
+# host, every host is a separate block. Rows of language 1 are processed in batches to limit the memory used by the
+# product, and blocks can be scored in parallel. Scores, ties and n-best lists are exactly the ones of the loop below.
+#
+def word_matrix(index, vocabulary):
+    rows = []
+    cols = []
+    for row, words in enumerate(index.values()):
+        for word in words:
+            rows.append(row)
+            cols.append(vocabulary.setdefault(word, len(vocabulary)))
+    return csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(len(index), len(vocabulary)))
+
+
+def build_translations(vocabulary1, vocabulary2, dic, reverse_dic=None):
+    """Returns the relation between the words of language 2 and their translations in language 1 (columns of the
+    matrices of words), and which words of language 2 (and of language 1, with the reverse lexicon) have
+    translations"""
+    trows = []
+    tcols = []
+    for word, word_id in vocabulary2.items():
+        for translation in dic.get(word, []):
+            if translation in vocabulary1:
+                trows.append(word_id)
+                tcols.append(vocabulary1[translation])
+    translations = csr_matrix((np.ones(len(trows), dtype=np.int32), (trows, tcols)),
+                              shape=(len(vocabulary2), len(vocabulary1)))
+    translations.data[:] = 1
+
+    has_translation2 = np.array([len(dic.get(word, [])) > 0 for word in vocabulary2], dtype=np.int64)
+    has_translation1 = None
+    if reverse_dic is not None:
+        has_translation1 = np.array([len(reverse_dic.get(word, [])) > 0 for word in vocabulary1], dtype=np.int64)
+    return translations, has_translation2, has_translation1
+
+
+def host_groups(docs1, docs2, hosts=None):
+    """Returns the pairs (rows in language 1, rows in language 2) of the documents to compare: all of them or, with a
+    host function, the ones with the same host"""
+    if hosts is None:
+        return [(np.arange(len(docs1)), np.arange(len(docs2)))]
+    rows1 = defaultdict(list)
+    rows2 = defaultdict(list)
+    for row, doc in enumerate(docs1):
+        rows1[hosts(doc)].append(row)
+    for row, doc in enumerate(docs2):
+        rows2[hosts(doc)].append(row)
+    return [(np.array(rows1[host]), np.array(rows2[host])) for host in rows1 if host in rows2]
+
+
+def top_candidates(columns, scores, n):
+    """Positions of the n best scores, ties sorted by column as the stable sort of the loop does"""
+    if len(scores) > n:
+        threshold = -np.partition(-scores, n - 1)[n - 1]
+        selected = np.flatnonzero(scores >= threshold)
+        columns = columns[selected]
+        scores = scores[selected]
+    else:
+        selected = np.arange(len(scores))
+    return selected[np.lexsort((columns, -scores))[:n]]
+
+
+class SparseScorer(object):
+
+    def __init__(self, docs1, docs2, matrix1, matrix2, translations, has_translation, max_df=1.0, n=10):
+        """Scores documents in language 1 (rows of matrix1) against documents in language 2 (rows of matrix2), whose
+        words are translated into language 1 with the relation translations (words in language 2 x words in language
+        1); has_translation tells which words in language 2 have some translation"""
+        self.docs1 = docs1
+        self.docs2 = docs2
+        self.n = n
+        self.matrix1 = matrix1
+        self.translated2 = matrix2.dot(translations)
+        self.translated2.data[:] = 1
+        self.dict_words2 = matrix2.dot(has_translation)
+        self.vocab1 = np.diff(matrix1.indptr).astype(np.int64)
+        self.vocab2 = np.diff(matrix2.indptr).astype(np.int64)
+
+        # Document frequency of every word in both languages (words in language 2 once translated)
+        df = np.bincount(self.matrix1.indices, minlength=self.matrix1.shape[1]) + \
+            np.bincount(self.translated2.indices, minlength=self.translated2.shape[1])
+        frequent = df > max_df * (len(self.docs1) + len(self.docs2))
+        self.frequent_words = np.flatnonzero(frequent)
+        self.candidate_words = np.flatnonzero(~frequent)
+
+    def score_block(self, rows, cols):
+        """Returns the document in language 1 and the list of 'doc_id:score' n-best candidates of every row, compared
+        with the documents in language 2 of cols"""
+        matrix1 = self.matrix1[rows]
+        translated2 = self.translated2[cols]
+        if len(self.frequent_words) == 0:
+            overlap = matrix1.dot(translated2.T.tocsr())
+            candidate_rows = np.repeat(np.arange(overlap.shape[0]), np.diff(overlap.indptr))
+            candidate_cols = overlap.indices
+            shared = overlap.data
+        else:
+            # Pairs are found with the rest of the words; frequent words they share are added afterwards
+            candidates = matrix1[:, self.candidate_words].dot(translated2[:, self.candidate_words].T.tocsr())
+            candidate_rows = np.repeat(np.arange(candidates.shape[0]), np.diff(candidates.indptr))
+            candidate_cols = candidates.indices
+            frequent1 = matrix1[:, self.frequent_words][candidate_rows]
+            frequent2 = translated2[:, self.frequent_words][candidate_cols]
+            shared = candidates.data + np.asarray(frequent1.multiply(frequent2).sum(axis=1)).ravel()
+
+        valid = (shared > 0) & (self.dict_words2[cols[candidate_cols]] > 0)
+        candidate_rows = candidate_rows[valid]
+        candidate_cols = cols[candidate_cols[valid]]
+        v1 = self.vocab1[rows[candidate_rows]]
+        v2 = self.vocab2[candidate_cols]
+        scores = (np.minimum(v1, v2).astype(np.float64) / np.maximum(v1, v2).astype(np.float64)) * (
+                shared[valid].astype(np.float64) / self.dict_words2[candidate_cols].astype(np.float64))
+
+        result = []
+        bounds = np.searchsorted(candidate_rows, np.arange(len(rows) + 1))
+        for row in range(len(rows)):
+            row_cols = candidate_cols[bounds[row]:bounds[row + 1]]
+            row_scores = scores[bounds[row]:bounds[row + 1]]
+            best = top_candidates(row_cols, row_scores, self.n)
+            result.append((self.docs1[rows[row]],
+                           [str(self.docs2[col]) + ":" + str(score)
+                            for col, score in zip(row_cols[best].tolist(), row_scores[best].tolist())]))
+        return result
+
+
+#
+# Blocks are scored by workers forked after building the scorers and the host groups, which they inherit: tasks only
+# have the direction, the group and the rows of the batch
+#
+def score_block(task):
+    direction, group, start, stop = task
+    rows, cols = groups[group] if direction == 0 else groups[group][::-1]
+    return direction, scorers[direction].score_block(rows[start:stop], cols)
+
+
+def score_loop(index_text1, index_text2, dic, documents=None):
+    found = {}
+    dict_words = {}
+    translated_index_text2 = {}
+
+    # Translating all the words in the segments in language 2 into language 1 using the bilingual lexicon
+    translate_words(index_text2, dic, dict_words, translated_index_text2)
+
+    for i in index_text1:
+        if documents is not None:
+            rx = re.match('(https?://)([^/]+)([^\?]*)(\?.*)?', documents[i])
+            ihost = rx.group(2)
+
+        similar = {}
+        for j in index_text2:
+            validpair = True
+            if documents is not None:
+                rx = re.match('(https?://)([^/]+)([^\?]*)(\?.*)?', documents[j])
+                jhost = rx.group(2)
+                if jhost != ihost:
+                    validpair = False
+            if validpair:
+                c3 = index_text1[i].intersection(translated_index_text2[j])
+                if len(c3) > 0 and int(dict_words[j]) > 0:
+                    max_vocab = max(len(index_text1[i]), len(index_text2[j]))
+                    min_vocab = min(len(index_text1[i]), len(index_text2[j]))
+                    num_intersect_words = len(c3)
+                    num_trans_words_text2 = dict_words[j]
+                    similar[j] = (float(min_vocab) / float(max_vocab)) * (
+                                float(num_intersect_words) / float(num_trans_words_text2))
+
+        if len(similar) > 0:
+            similar = sorted(list(similar.items()), key=itemgetter(1), reverse=True)
+        found[i] = []
+        for j in similar:
+            found[i].append(str(j[0]) + ":" + str(j[1]))
+    return found
+
+
+#
+# For each document, we obtain the 10-best candidates with highest score.
+#
+def write_ridx(found, writer):
+    for i in found:
+        if len(found[i]) > 10:
+            counter = 10
+        else:
+            counter = len(found[i])
+        first = True
+        candidatestring = str(i) + "\t"
+        for j in range(counter):
+            if first:
+                candidatestring += str(found[i][j])
+                first = False
+            else:
+                candidatestring += "\t" + str(found[i][j])
+        writer.write(candidatestring + "\n")
+
+
+def url_host(url):
+    return re.match('(https?://)([^/]+)([^\?]*)(\?.*)?', url).group(2)
 
 
 oparser = argparse.ArgumentParser(
@@ -110,8 +374,8 @@ oparser = argparse.ArgumentParser(
                 "used to compare documents in both languages")
 oparser.add_argument('idx', metavar='FILE', nargs='?',
                      help='File produced by bitextor-lett2idx containing an index of the different words for every '
-                          'language in the website and the list of documents in which they appear (if undefined, '
-                          'the script will read from the standard input)',
+                          'language in the website and the list of documents in which they appear, as text or in '
+                          'binary format (if undefined, the script will read a text index from the standard input)',
                      default=None)
 oparser.add_argument('-d',
                      help='Dictionary containing translations of words for the languages of the website; it is used '
@@ -125,78 +389,129 @@ oparser.add_argument("--lang1", help="Two-characters-code for language 1 in the
                      required=True)
 oparser.add_argument("--lang2", help="Two-characters-code for language 2 in the pair of languages", dest="lang2",
                      required=True)
+oparser.add_argument("--engine", dest="engine", choices=["sparse", "loop"], default="sparse",
+                     help="Computation of the scores: 'sparse' (default) compares all the documents at once with sparse "
+                          "matrix products; 'loop' compares every pair of documents (slower, same results)")
+oparser.add_argument("--batch-size", dest="batch_size", type=int, default=1000,
+                     help="Number of documents in language 1 compared at once by the sparse engine (1000 by default); "
+                          "the memory used grows with it")
+oparser.add_argument("--max-df", dest="max_df", type=float, default=1.0,
+                     help="Words found in more than this fraction of the documents (of both languages, once translated) "
+                          "are not used to look for pairs of documents to compare with the sparse engine, although they "
+                          "are counted in the scores of the pairs compared; 1.0 (default) compares every pair of "
+                          "documents sharing some word")
+oparser.add_argument("--workers", dest="workers", type=int, default=1,
+                     help="Number of processes scoring blocks of documents with the sparse engine (batches of "
+                          "documents and, with -l, hosts); the output does not depend on this value")
+oparser.add_argument("--output1", dest="output1", default=None,
+                     help="File where the RIDX of the documents in language 1 is written (compressed with XZ if the name "
+                          "ends in .xz); if undefined, it is written to the standard output")
+oparser.add_argument("--output2", dest="output2", default=None,
+                     help="Bidirectional mode: also write the RIDX of the documents in language 2 (with candidates in "
+                          "language 1) to this file, loading the index and the dictionary only once for both")
+oparser.add_argument("--compiled-dic", dest="compiled_dic", default=None,
+                     help="Compiled version of the dictionary, read with memory mapping; it is built from the dictionary "
+                          "if it does not exist and rebuilt if the dictionary has changed, so it can be shared by all "
+                          "the runs using the same dictionary")
 options = oparser.parse_args()
 
-index_text1 = defaultdict(set)
-index_text2 = defaultdict(set)
 dic = defaultdict(list)
-lista_words = []
-found = {}
-dict_words = {}
-translated_index_text2 = {}
-
-# Loading bilingual lexicon
-load_dictionaries(options.dictionary, options.lang1, options.lang2, dic)
+reverse_dic = defaultdict(list) if options.output2 is not None else None
 
-if options.idx is None:
-    reader = sys.stdin;
+# Loading IDX file
+index_text1 = None
+index_text2 = None
+if options.idx is not None and is_binary_index(options.idx) and options.engine == "sparse":
+    # The matrices of the sparse engine are built straight from the posting lists of the binary index
+    with BinaryIndexReader(options.idx) as reader:
+        docs1, vocabulary1, matrix1 = binary_word_matrix(reader, options.lang1)
+        docs2, vocabulary2, matrix2 = binary_word_matrix(reader, options.lang2)
+    words_lang1 = set(vocabulary1)
+    words_lang2 = set(vocabulary2)
 else:
-    reader = open(options.idx, "r")
+    index_text1 = defaultdict(set)
+    index_text2 = defaultdict(set)
+    if options.idx is not None and is_binary_index(options.idx):
+        fill_index_binary(options.idx, options.lang1, options.lang2, index_text1, index_text2)
+    else:
+        if options.idx is None:
+            reader = sys.stdin;
+        else:
+            reader = open(options.idx, "r")
+        fill_index(reader, options.lang1, options.lang2, index_text1, index_text2)
+    words_lang1 = set().union(*index_text1.values())
+    words_lang2 = set().union(*index_text2.values())
 
-# Loading IDX file
-fill_index(reader, options.lang1, options.lang2, index_text1, index_text2)
+# Loading bilingual lexicon
+compiled = None
+if options.compiled_dic is not None:
+    compiled = open_dictionary(options.dictionary, options.compiled_dic)
+    # Languages missing in the header of the dictionary are only handled by the text version
+    if compiled.column(options.lang1) == compiled.column(options.lang2):
+        compiled.close()
+        compiled = None
+if compiled is not None:
+    load_compiled_dictionary(compiled, options.lang1, options.lang2, words_lang1, words_lang2, dic, reverse_dic)
+    compiled.close()
+else:
+    load_dictionaries(options.dictionary, options.lang1, options.lang2, dic, reverse_dic)
 
 # Extending the lexicon with words that are identical in both sides
-feed_dict_with_identical_words(index_text1, index_text2, dic)
-
-# Translating all the words in the segments in language 2 into language 1 using the bilingual lexicon
-translate_words(index_text2, dic, dict_words, translated_index_text2)
+if reverse_dic is not None:
+    feed_dict_with_identical_words(words_lang1, words_lang2, dic, reverse_dic)
+else:
+    feed_dict_with_identical_words(words_lang1, words_lang2, dic)
 
+documents = None
 if options.lett is not None:
     documents = {}
     read_lett(options.lett, documents)
 
-for i in index_text1:
-    if options.lett is not None:
-        rx = re.match('(https?://)([^/]+)([^\?]*)(\?.*)?', documents[i])
-        ihost = rx.group(2)
-
-    similar = {}
-    for j in index_text2:
-        validpair = True
-        if options.lett is not None:
-            rx = re.match('(https?://)([^/]+)([^\?]*)(\?.*)?', documents[j])
-            jhost = rx.group(2)
-            if jhost != ihost:
-                validpair = False
-        if validpair:
-            c3 = index_text1[i].intersection(translated_index_text2[j])
-            if len(c3) > 0 and int(dict_words[j]) > 0:
-                max_vocab = max(len(index_text1[i]), len(index_text2[j]))
-                min_vocab = min(len(index_text1[i]), len(index_text2[j]))
-                num_intersect_words = len(c3)
-                num_trans_words_text2 = dict_words[j]
-                similar[j] = (float(min_vocab) / float(max_vocab)) * (
-                            float(num_intersect_words) / float(num_trans_words_text2))
-
-    if len(similar) > 0:
-        similar = sorted(list(similar.items()), key=itemgetter(1), reverse=True)
-    found[i] = []
-    for j in similar:
-        found[i].append(str(j[0]) + ":" + str(j[1]))
+# Directions to compute: documents in language 1 with candidates in language 2 and, in bidirectional mode, the other
+# way round, with the same indexes and the reverse lexicon
+outputs = [options.output1] if reverse_dic is None else [options.output1, options.output2]
 
-# For each document, we obtain the 10-best candidates with highest score.
-for i in found:
-    if len(found[i]) > 10:
-        counter = 10
+if options.engine == "sparse":
+    if index_text1 is not None:
+        docs1 = list(index_text1)
+        docs2 = list(index_text2)
+        vocabulary1 = {}
+        vocabulary2 = {}
+        matrix1 = word_matrix(index_text1, vocabulary1)
+        matrix2 = word_matrix(index_text2, vocabulary2)
+    # Documents are written in the same order as the loop does, even if they have no candidates
+    found = [{i: [] for i in docs} for docs in [docs1, docs2][:len(outputs)]]
+    # Matrices are built once for both directions, and workers are forked after building them and the host groups, so
+    # they share them; blocks of both directions are scored at the same time
+    translations, has_translation2, has_translation1 = build_translations(vocabulary1, vocabulary2, dic, reverse_dic)
+    scorers = [SparseScorer(docs1, docs2, matrix1, matrix2, translations, has_translation2, max_df=options.max_df)]
+    if reverse_dic is not None:
+        scorers.append(SparseScorer(docs2, docs1, matrix2, matrix1, translations.T.tocsr(), has_translation1,
+                                    max_df=options.max_df))
+    groups = host_groups(docs1, docs2, None if documents is None else lambda doc: url_host(documents[doc]))
+    tasks = ((direction, group, start, start + options.batch_size) for direction in range(len(scorers))
+             for group, group_rows in enumerate(groups) for start in range(0, len(group_rows[direction]),
+                                                                           options.batch_size))
+    if options.workers > 1:
+        pool = multiprocessing.get_context("fork").Pool(options.workers)
+        results = pool.imap_unordered(score_block, tasks)
     else:
-        counter = len(found[i])
-    first = True
-    candidatestring = str(i) + "\t"
-    for j in range(counter):
-        if first:
-            candidatestring += str(found[i][j])
-            first = False
-        else:
-            candidatestring += "\t" + str(found[i][j])
-    print(candidatestring)
+        pool = None
+        results = map(score_block, tasks)
+    for direction, result in results:
+        for i, candidates in result:
+            found[direction][i] = candidates
+    if pool is not None:
+        pool.close()
+        pool.join()
+else:
+    found = [score_loop(index_text1, index_text2, dic, documents)]
+    if reverse_dic is not None:
+        found.append(score_loop(index_text2, index_text1, reverse_dic, documents))
+
+for direction_found, output in zip(found, outputs):
+    if output is None:
+        write_ridx(direction_found, sys.stdout)
+    else:
+        with (lzma.open(output, "wt") if output[-3:] == ".xz" else open(output, "w")) as writer:
+            write_ridx(direction_found, writer)
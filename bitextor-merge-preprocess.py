@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+#
+# Merges the output of several runs of bitextor-warc2preprocess (for example, one for each of the WARC files produced
+# by bitextor-splitWARC) into a single set of pre-processing files, so document ids (line numbers) are global.
+#
+# Every input directory has to contain the same fields. The mapping file has a line for every document written:
+#   input directory   document id in the input directory   document id in the output
+#
+
+import os
+import sys
+import base64
+import hashlib
+import argparse
+import lzma
+from contextlib import ExitStack
+from itertools import zip_longest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/utils")
+from utils.common import XZBlockWriter
+
+FIELDS = ["url", "lang", "encoding", "mime", "normalized_html", "plain_text", "deboilerplate_html"]
+
+oparser = argparse.ArgumentParser(
+    description="Script that concatenates the files produced by bitextor-warc2preprocess in several directories, "
+                "renumbering the documents so their ids are consistent in the result")
+oparser.add_argument("input_dirs", nargs="+", help="Directories with the pre-processing files, in the order in which "
+                                                   "their documents have to be numbered")
+oparser.add_argument("--output-dir", dest="outDir", required=True, help="Output directory")
+oparser.add_argument("--prefix", dest="prefix", default="",
+                     help="Prefix of the names of the pre-processing files (both input and output); if not specified "
+                          "it is empty string")
+oparser.add_argument("--mapping", dest="mapping", default=None,
+                     help="Write the mapping from the document ids in each input directory to the ids in the output "
+                          "(compressed with XZ if the name ends in .xz)")
+oparser.add_argument("--deduplicate", action="store_true", default=False,
+                     help="Discard documents whose HTML (de-boiled HTML, if available) is the same as the one of a "
+                          "document already written, as bitextor-warc2preprocess does inside every run")
+options = oparser.parse_args()
+
+fields = [field for field in FIELDS
+          if os.path.isfile(os.path.join(options.input_dirs[0], options.prefix + field + ".xz"))]
+for input_dir in options.input_dirs:
+    for field in fields:
+        if not os.path.isfile(os.path.join(input_dir, options.prefix + field + ".xz")):
+            sys.stderr.write("File " + options.prefix + field + ".xz not found in " + input_dir + "\n")
+            sys.exit(1)
+hash_field = "deboilerplate_html" if "deboilerplate_html" in fields else "normalized_html"
+
+mapping = None
+if options.mapping is not None:
+    mapping = lzma.open(options.mapping, "wt") if options.mapping[-3:] == ".xz" else open(options.mapping, "w")
+
+outFiles = {field: XZBlockWriter(os.path.join(options.outDir, options.prefix + field + ".xz")) for field in fields}
+seen_md5 = set()
+docid = 0
+for input_dir in options.input_dirs:
+    with ExitStack() as stack:
+        files = [stack.enter_context(lzma.open(os.path.join(input_dir, options.prefix + field + ".xz"), "rb"))
+                 for field in fields]
+        local_docid = 0
+        for lines in zip_longest(*files):
+            local_docid += 1
+            # All the files of a directory must have a line per document
+            if None in lines:
+                sys.stderr.write("Pre-processing files in " + input_dir + " have different numbers of documents\n")
+                sys.exit(1)
+            if options.deduplicate:
+                digest = hashlib.md5(base64.b64decode(lines[fields.index(hash_field)].strip())).digest()
+                if digest in seen_md5:
+                    continue
+                seen_md5.add(digest)
+            docid += 1
+            for field, line in zip(fields, lines):
+                outFiles[field].write(line)
+            if mapping is not None:
+                mapping.write(input_dir + "\t" + str(local_docid) + "\t" + str(docid) + "\n")
+
+for field in fields:
+    outFiles[field].close()
+if mapping is not None:
+    mapping.close()
@@ -1,25 +1,78 @@
 #!/usr/bin/env python3
 
+import os
 import sys
-import warc
 import argparse
+import lzma
+import multiprocessing
+from functools import partial
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/utils")
+from utils.warcindex import EXTENSIONS, iter_raw_records, compress_record
+
+
+def compress_star(compression, record):
+    raw, uri, content_type = record
+    return len(raw), compress_record(raw, compression), uri, content_type
+
 
 oparser = argparse.ArgumentParser(
-    description="Script that splits a WARC file into several WARC files by setting a maximum number of records")
+    description="Script that splits a WARC file into several WARC files by setting a maximum number of records and/or "
+                "a maximum size. Records are copied without parsing them again and, if the output is compressed, every "
+                "record is compressed separately, so ranges of records can be read from the WARC files produced "
+                "using the index")
 oparser.add_argument('-o', '--output-dir', dest='outDir', help='Output directory', required=True)
 oparser.add_argument('-m', '--max', dest='maxrecords', help='Maximum number of records that a WARC file can contain; if 0 is set, a WARC file per record will be created', default=-1, type=int)
+oparser.add_argument('-b', '--max-bytes', dest='maxbytes', default=-1, type=int,
+                     help='Maximum size (in bytes, before compression) of each WARC file; records are never split, so '
+                          'a WARC file is only larger than this if it contains a single record')
+oparser.add_argument('-c', '--compression', dest='compression', choices=["gzip", "xz", "none"], default="gzip",
+                     help='Compression of the WARC files produced (gzip by default)')
+oparser.add_argument('-i', '--index', dest='index', default=None,
+                     help='Write an index with the WARC file, offset, length, URI and content type of every record '
+                          '(compressed with XZ if the name ends in .xz); with no maximum number of records or size, a '
+                          'single WARC file with the index of all its records is produced')
+oparser.add_argument('--workers', dest='workers', type=int, default=1,
+                     help='Number of processes used to compress the records; records are written in the same order '
+                          'regardless of this value')
 options = oparser.parse_args()
 
-recordcounter = 1
-filecounter = 0
-fout = warc.WARCFile(options.outDir + "/" + str(filecounter) + ".warc.gz", "w")
+records = iter_raw_records(sys.stdin.buffer)
+if options.workers > 1 and options.compression != "none":
+    pool = multiprocessing.Pool(options.workers)
+    compressed = pool.imap(partial(compress_star, options.compression), records, chunksize=16)
+else:
+    pool = None
+    compressed = map(partial(compress_star, options.compression), records)
+
+index = None
+if options.index is not None:
+    index = lzma.open(options.index, "wt") if options.index[-3:] == ".xz" else open(options.index, "w")
 
-fin = warc.WARCFile(fileobj=sys.stdin.buffer)
-for record in fin:
-    fout.write_record(record)
-    if options.maxrecords >= 0 and recordcounter % options.maxrecords == 0:
+filecounter = 0
+filename = str(filecounter) + EXTENSIONS[options.compression]
+fout = open(options.outDir + "/" + filename, "wb")
+shardrecords = 0
+shardbytes = 0
+for size, data, uri, content_type in compressed:
+    # A new WARC file is started when the current one is full, but never for the first record of a file
+    if shardrecords > 0 and ((options.maxrecords >= 0 and shardrecords >= max(options.maxrecords, 1)) or
+                             (options.maxbytes >= 0 and shardbytes + size > options.maxbytes)):
         fout.close()
         filecounter += 1
-        fout = warc.WARCFile(options.outDir + "/" + str(filecounter) + ".warc.gz", "w")
-    recordcounter += 1
+        filename = str(filecounter) + EXTENSIONS[options.compression]
+        fout = open(options.outDir + "/" + filename, "wb")
+        shardrecords = 0
+        shardbytes = 0
+    if index is not None:
+        index.write("\t".join([filename, str(fout.tell()), str(len(data)), uri, content_type]) + "\n")
+    fout.write(data)
+    shardrecords += 1
+    shardbytes += size
 fout.close()
+
+if pool is not None:
+    pool.close()
+    pool.join()
+if index is not None:
+    index.close()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+#
+# 1. Read the plain text and the language of every document produced by bitextor-warc2preprocess
+# 2. Split the text of the documents in lang1 and lang2 into sentences and tokenise the sentences into words
+# 3. Write both results, so the rest of the pipeline does not need to run the sentence splitters and tokenisers again
+#
+# Output format (one line per document, in the same order as plain_text.xz, so document ids are the same):
+#   sentences.xz: sentences of the document (one per line) encoded in base64
+#   tokenised.xz: words of each sentence separated by spaces (one sentence per line, in the same order as in
+#                 sentences.xz) encoded in base64
+# Documents in other languages get empty lines.
+#
+
+import os
+import sys
+import base64
+import argparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/utils")
+from utils.common import open_xz_or_gzip_or_plain, XZBlockWriter
+from external_processor import text_processor, WORDS, SENTENCES
+
+
+def tokenise_sentences(sentences, word_tokeniser):
+    """Tokenises the sentences, making sure there is a line of words for every sentence"""
+    tokenised = word_tokeniser.process(sentences).rstrip("\n")
+    if tokenised.count("\n") != sentences.count("\n"):
+        # Tools that join or split lines are run on every sentence separately
+        tokenised = "\n".join(word_tokeniser.process(sentence).replace("\n", " ").strip()
+                              for sentence in sentences.split("\n"))
+    return tokenised
+
+
+oparser = argparse.ArgumentParser(
+    description="Script that splits into sentences and tokenises the text of the documents produced by "
+                "bitextor-warc2preprocess once, so the indexing, document alignment and segment alignment steps can "
+                "read the result instead of running the sentence splitters and tokenisers on every document again")
+oparser.add_argument('--text', dest='text', required=True,
+                     help='File produced by bitextor-warc2preprocess containing the text of all the records in the '
+                          'WARC file encoded as base 64 (each line corresponds to a record)')
+oparser.add_argument('--lang', dest='lang', required=True,
+                     help='File produced by bitextor-warc2preprocess containing the language of each of the records '
+                          'in the WARC file (each line corresponds to a record)')
+oparser.add_argument("--lang1", help="Two-characters-code for language 1 in the pair of languages", dest="lang1",
+                     required=True)
+oparser.add_argument("--lang2", help="Two-characters-code for language 2 in the pair of languages", dest="lang2",
+                     required=True)
+oparser.add_argument("--sentence-splitter1", dest="senttok1", required=True,
+                     help="Sentence splitter for language 1 (a command, or py:module:callable[:argument])")
+oparser.add_argument("--sentence-splitter2", dest="senttok2", required=True,
+                     help="Sentence splitter for language 2 (a command, or py:module:callable[:argument])")
+oparser.add_argument("--word-tokeniser1", dest="wordtok1", required=True,
+                     help="Word tokeniser for language 1 (a command, or py:module:callable[:argument])")
+oparser.add_argument("--word-tokeniser2", dest="wordtok2", required=True,
+                     help="Word tokeniser for language 2 (a command, or py:module:callable[:argument])")
+oparser.add_argument("--sentences", dest="sentences", required=True, help="Output file with the sentences")
+oparser.add_argument("--tokenised", dest="tokenised", required=True, help="Output file with the tokenised sentences")
+options = oparser.parse_args()
+
+processors = {options.lang1: (text_processor(options.senttok1, SENTENCES), text_processor(options.wordtok1, WORDS)),
+              options.lang2: (text_processor(options.senttok2, SENTENCES), text_processor(options.wordtok2, WORDS))}
+
+sentences_writer = XZBlockWriter(options.sentences)
+tokenised_writer = XZBlockWriter(options.tokenised)
+with open_xz_or_gzip_or_plain(options.text) as text_reader, open_xz_or_gzip_or_plain(options.lang) as lang_reader:
+    for line in text_reader:
+        lang = next(lang_reader, None).strip()
+        sentences = ""
+        tokenised = ""
+        if lang in processors:
+            sentence_splitter, word_tokeniser = processors[lang]
+            # Same processing as in bitextor-align-segments, so it can use these files without changing its output
+            text = base64.b64decode(line.strip()).decode("utf-8").replace("\t", " ")
+            sentences = sentence_splitter.process(text).strip()
+            if sentences:
+                tokenised = tokenise_sentences(sentences, word_tokeniser)
+        sentences_writer.write(base64.b64encode(sentences.encode("utf-8")) + b"\n")
+        tokenised_writer.write(base64.b64encode(tokenised.encode("utf-8")) + b"\n")
+sentences_writer.close()
+tokenised_writer.close()
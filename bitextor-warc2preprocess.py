@@ -7,6 +7,7 @@ import sys
 import argparse
 import cchardet
 import hashlib
+import codecs
 import os
 import magic
 import re
@@ -14,6 +15,7 @@ import re
 import ftfy
 import pycld2 as cld2
 from lxml.html.clean import Cleaner
+import lxml.html
 import string
 from bs4 import BeautifulSoup
 from lxml import etree
@@ -21,6 +23,34 @@ from boilerpipe.extract import Extractor
 import alcazar.bodytext
 import logging
 import lzma
+import multiprocessing
+import threading
+import time
+import json
+import resource
+from collections import Counter
+from contextlib import contextmanager
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/utils")
+from utils.minhash import MinHasher, MinHashLSH
+from utils.hashstore import PersistentHashStore
+from utils.common import XZBlockWriter
+
+# CPU time of the calling thread (the main process reads the WARC in a separate thread when there are several workers)
+thread_time = getattr(time, "thread_time", time.process_time)
+
+
+@contextmanager
+def timed(counters, stage):
+    """Adds the wall and CPU time spent in the block to the counters of the stage"""
+    wall = time.perf_counter()
+    cpu = thread_time()
+    try:
+        yield
+    finally:
+        counters["wall_" + stage] += time.perf_counter() - wall
+        counters["cpu_" + stage] += thread_time() - cpu
+
 
 def guess_lang_from_data2(data):
     reliable, text_bytes, detected_languages = cld2.detect(
@@ -28,22 +58,311 @@ def guess_lang_from_data2(data):
     return detected_languages[0][1]
 
 
+def declared_encoding(data):
+    """Returns the charset declared in the HTTP headers or in a meta tag at the beginning of the payload, if it is
+    known by Python"""
+    match = re.search(rb"""charset\s*=\s*["']?\s*([A-Za-z0-9_.:-]+)""", data[:8192], flags=re.IGNORECASE)
+    if match:
+        encoding = match.group(1).decode("ascii")
+        try:
+            codecs.lookup(encoding)
+            return encoding
+        except LookupError:
+            pass
+    return None
+
+
+# Names given by cchardet to the charsets whose Python name is different (see cchardet_name)
+CCHARDET_NAMES = {"ascii": "ASCII", "cp932": "SHIFT_JIS", "euc_jp": "EUC-JP", "iso2022_jp": "ISO-2022-JP",
+                  "gb2312": "GB18030", "gbk": "GB18030", "hz": "HZ-GB-2312", "cp950": "BIG5", "euc_kr": "UHC",
+                  "cp949": "UHC", "iso2022_kr": "ISO-2022-KR", "cp866": "IBM866", "cp855": "IBM855",
+                  "cp874": "TIS-620"}
+
+
+def cchardet_name(encoding):
+    """Returns the name cchardet gives to a charset known by Python (for example, WINDOWS-1252 for cp1252), so the
+    names in the encoding file are the same whichever way the charset was found"""
+    name = codecs.lookup(encoding).name
+    if name in CCHARDET_NAMES:
+        return CCHARDET_NAMES[name]
+    if re.match(r"cp125[0-8]$", name):
+        return "WINDOWS-" + name[2:]
+    if name.startswith("iso8859-"):
+        return "ISO-8859-" + name[8:]
+    return name.upper()
+
+
 def convert_encoding(data):
+    """Decodes the payload of a record. Returns the encoding (None if it could not be identified), the decoded text and
+    the path taken to find the encoding: 'declared' (charset in the HTTP headers or a meta tag), 'utf-8' (strict UTF-8
+    decoding) or 'cchardet' (detection on the whole payload, the slowest one). Encodings are named as cchardet names
+    them (ASCII for payloads without non-ASCII bytes); a declared charset is trusted, though, so it can be different
+    from the one cchardet would detect, and UTF-8 payloads are decoded as UTF-8 even if cchardet would misdetect them"""
+    if len(data) == 0:
+        return None, '', "empty"
+
+    encoding = declared_encoding(data)
+    try:
+        utf8text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        utf8text = None
+
+    if utf8text is not None and len(utf8text) == len(data) and b"\x1b" not in data:
+        # Only ASCII bytes (and no escape sequences of the ISO-2022 charsets)
+        return "ASCII", utf8text, "declared" if encoding is not None else "utf-8"
+
+    if encoding is not None:
+        if codecs.lookup(encoding).name == "utf-8":
+            if utf8text is not None:
+                return "UTF-8", utf8text, "declared"
+        elif utf8text is None:
+            # Single-byte charsets decode anything, so a declared one is not trusted if the payload is valid UTF-8
+            # with non-ASCII characters (a usual mistake in web servers)
+            if codecs.lookup(encoding).name == "iso8859-1" and re.search(rb"[\x80-\x9f]", data):
+                # Control characters of ISO-8859-1 in a web page mean WINDOWS-1252, as browsers and cchardet decide
+                try:
+                    return "WINDOWS-1252", data.decode("cp1252"), "declared"
+                except UnicodeDecodeError:
+                    pass
+            try:
+                return cchardet_name(encoding), data.decode(encoding), "declared"
+            except (UnicodeDecodeError, LookupError):
+                pass
+
+    if utf8text is not None:
+        return "UTF-8", utf8text, "utf-8"
+
     encoding = cchardet.detect(data)['encoding']
 
     if encoding == None:
         encoding = "utf-8"
 
-    if len(data) > 0:
-        # We convert, even if the text is detected to be UTF8 so, if it is an error and conversion fails, the error
-        # is catched here
-        for enc in [encoding, 'utf-8', 'iso-8859-1', 'windows‑1252']:
-            try:
-                return enc, data.decode(enc)
-            except:
-                pass
+    # We convert, even if the text is detected to be UTF8 so, if it is an error and conversion fails, the error
+    # is catched here
+    for enc in [encoding, 'utf-8', 'iso-8859-1', 'windows‑1252']:
+        try:
+            return enc, data.decode(enc), "cchardet"
+        except:
+            pass
+
+    return None, '', "cchardet"
+
+
+def split_http_payload(payload):
+    """Returns the HTTP headers (None if the payload is not an HTTP response) and the body of a WARC payload"""
+    if payload[:5] == b"HTTP/":
+        end = payload.find(b"\r\n\r\n")
+        if end >= 0:
+            return payload[:end], payload[end + 4:]
+    return None, payload
+
+
+def is_text_mime(mime):
+    if mime is None:
+        return False
+    mime = mime.split(";")[0].strip().lower()
+    return mime.startswith("text/") or "html" in mime or mime.endswith("xml")
+
+
+def prefilter_mime(content_type, payload):
+    """Cheap MIME check run before decoding and cleaning the record: the record is discarded only if neither the
+    declared content type (HTTP headers or WARC header) nor a magic sniff of the first bytes of the body look like
+    text. Returns the sniffed MIME type (None if the record has to be discarded) and the body of the record"""
+    http_headers, body = split_http_payload(payload)
+    declared = None
+    if http_headers is not None:
+        match = re.search(rb"^content-type:\s*([^\r\n]+)", http_headers, flags=re.IGNORECASE | re.MULTILINE)
+        if match:
+            declared = match.group(1).decode("iso-8859-1")
+    elif content_type is not None and not content_type.startswith("application/http"):
+        declared = content_type
+    mime = magic.from_buffer(body[:options.prefilter_bytes], mime=True)
+    if not is_text_mime(declared) and not is_text_mime(mime):
+        return None, body
+    return mime, body
+
 
-    return None, ''
+def prefilter_lang(body, encoding):
+    """Cheap language check on a bounded prefix of the body of the record: it is discarded only if CLD2 reliably
+    identifies the prefix and none of the languages detected is among the searched languages"""
+    prefix = body[:options.prefilter_bytes].decode(encoding, errors="ignore")
+    try:
+        reliable, text_bytes, detected_languages = cld2.detect(prefix, isPlainText=False)
+    except Exception:
+        return True
+    if not reliable or detected_languages[0][1] == "un":
+        return True
+    return any(detected[1] in languages for detected in detected_languages)
+
+
+
+# The cleaner is created once per process and shared by all the records
+cleaner = Cleaner(style=True, links=True, add_nofollow=True, page_structure=False, safe_attrs_only=False)
+
+
+def process_record(url, content_type, payload):
+    """Runs the per-record pipeline on the payload of a WARC record. Returns a tuple with the URL, the MD5 of the
+    de-boiled HTML, the MinHash fingerprint of the text (if near-duplicate detection is enabled), the lines to be
+    written in each output file, the reason why the record was discarded (lines is None in that case) and a Counter
+    with the events of the record to be reported"""
+    counters = Counter()
+    counters["bytes"] += len(payload)
+    # Records that are clearly not text are discarded before any decoding or HTML normalisation
+    if options.prefilter:
+        with timed(counters, "magic"):
+            mime, body = prefilter_mime(content_type, payload)
+        if mime is None:
+            logging.info("MIME of document " + url + " is not text. Discarded by the pre-filter.")
+            return url, None, None, None, "prefilter_mime", counters
+
+    # We convert into UTF8 first of all
+    with timed(counters, "decode"):
+        orig_encoding, text, encoding_path = convert_encoding(payload)
+    counters["encoding_" + encoding_path] += 1
+    if orig_encoding is None:
+        logging.info("Encoding of document " + url + " could not be identified")
+
+    if len(text) == 0:
+        return url, None, None, None, "empty", counters
+
+    if options.prefilter and len(languages) > 0:
+        with timed(counters, "langid"):
+            keep = prefilter_lang(body, orig_encoding)
+    else:
+        keep = True
+    if not keep:
+        logging.info("Language of document " + url + " is not among searched languages. Discarded by the "
+                     "pre-filter.")
+        return url, None, None, None, "prefilter_lang", counters
+
+    # HTML is then normalized
+    tree = ""
+    document = None
+    try:
+        if options.single_parse:
+            # The record is parsed only once: the same lxml tree is cleaned in place, serialised for the output
+            # files and, later, used to extract the text
+            with timed(counters, "ftfy"):
+                fixedtext = ftfy.fix_text(re.sub('encoding *= *"[^"]+"', '', text, flags=re.IGNORECASE),
+                                          fix_entities=False, fix_character_width=False)
+            with timed(counters, "clean"):
+                document = lxml.html.fromstring(fixedtext)
+                cleaner(document)
+                tree = lxml.html.tostring(document, encoding="unicode")
+        else:
+            with timed(counters, "clean"):
+                cleanhtml = cleaner.clean_html(re.sub('encoding *= *"[^"]+"', '', text, flags=re.IGNORECASE))
+            with timed(counters, "ftfy"):
+                tree = ftfy.fix_text(cleanhtml, fix_entities=False, fix_character_width=False)
+        #document = html5lib.parse(fixedtext, treebuilder="lxml", namespaceHTMLElements=False)
+        #tree = etree.tostring(document, encoding="utf-8")
+    except Exception as ex:
+        sys.stderr.write(str(ex)+"\n")
+        return url, None, None, None, "cleaning_error", counters
+    cleantree = tree.replace("&#160;", " ")
+    cleantree = cleantree.replace("\t", " ")
+
+    # lang id
+    #printable_str = ''.join(x for x in cleantree if x in string.printable)
+    with timed(counters, "langid"):
+        lang = guess_lang_from_data2(tree)
+    if len(languages) > 0 and lang not in languages:
+        logging.info("Language of document " + url + ": " + lang + ". Not among searched languages.")
+        return url, None, None, None, "lang", counters
+
+    # If enabled, remove boilerplate HTML
+    if options.boilerpipe:
+        with timed(counters, "boilerpipe"):
+            extractor = Extractor(extractor='ArticleExtractor', html=cleantree)
+            deboiled = extractor.getHTML()
+        document = None
+    else:
+        deboiled = cleantree
+
+    # We compute MD5 on the HTML (either normalized one or after boilerpipe if enabled): if we get duplicate
+    # files we discard them
+    with timed(counters, "md5"):
+        c = hashlib.md5()
+        c.update(deboiled.encode())
+    # print("hash", c.hexdigest(), url)
+
+    # In sequential mode duplicates are discarded before extracting the text; worker processes cannot see
+    # seen_md5 updates, so they extract it anyway and the main process discards the duplicates in input order.
+    # Content found in the persistent hash store (processed in previous runs or other websites) is always discarded
+    # before extracting the text
+    if c.hexdigest() in seen_md5 or (hash_store is not None and c.digest() in hash_store):
+        return url, c.hexdigest(), None, None, None, counters
+
+    with timed(counters, "text_extraction"):
+        # If enabled get text with Alcazar library
+        if options.alcazar:
+            btext = alcazar.bodytext.parse_article(deboiled)
+            if btext.body_text:
+                plaintext = btext.body_text
+            else:
+                plaintext = ""
+        # Otherwise use lxml on the tree already built (or on the de-boiled HTML, if boilerpipe changed it)
+        elif options.single_parse:
+            if document is None:
+                document = lxml.html.fromstring(deboiled)
+            etree.strip_elements(document, "script", "style", "img", with_tail=False)
+            plaintext = document.text_content().replace("\t", " ")
+            plaintext = re.sub(r"\n+", "\n",
+                               re.sub(r" *\n *", "\n", re.sub(r" +", " ", re.sub(r"\r", "", plaintext))))
+        # Otherwise use beautifulsoup
+        else:
+            soup = BeautifulSoup(deboiled, "lxml")
+            for script in soup(["script", "style", "img"]):
+                script.extract()  # rip it out
+
+            plaintext = soup.get_text()
+            plaintext = re.sub(r"\n+", "\n",
+                               re.sub(r" *\n *", "\n", re.sub(r" +", " ", re.sub(r"\r", "", plaintext))))
+
+    if len(plaintext) == 0:
+        return url, c.hexdigest(), None, None, "no_text", counters
+
+    # Guessing MIME of the file (checked on original content), unless the pre-filter already did it
+    if not options.prefilter:
+        with timed(counters, "magic"):
+            mime = magic.from_buffer(text, mime=True)
+
+    # The fingerprint for near-duplicate detection is computed here, so it runs in the worker processes
+    fingerprint = None
+    if options.near_duplicates is not None:
+        with timed(counters, "minhash"):
+            fingerprint = minhasher.fingerprint(html.unescape(plaintext))
+
+    with timed(counters, "encode"):
+        lines = {"mime": mime.encode(),
+                 "url": url.encode(),
+                 "lang": lang.encode(),
+                 "encoding": orig_encoding.encode(),
+                 "normalized_html": base64.b64encode(cleantree.encode()),
+                 "plain_text": base64.b64encode(html.unescape(plaintext).encode())}
+        if options.boilerpipe:
+            lines["deboilerplate_html"] = base64.b64encode(deboiled.encode())
+
+    return url, c.hexdigest(), fingerprint, lines, None, counters
+
+
+def process_record_star(args):
+    return process_record(*args)
+
+
+def read_records(warc_file, semaphore=None):
+    records = iter(warc_file)
+    while True:
+        # When records are sent to worker processes, the semaphore bounds the number of records read in advance
+        if semaphore is not None:
+            semaphore.acquire()
+        with timed(read_counters, "read"):
+            record = next(records, None)
+            if record is not None:
+                payload = record.payload.read()
+        if record is None:
+            return
+        yield record.url, record.header.get("Content-Type"), payload
 
 
 oparser = argparse.ArgumentParser(
@@ -56,15 +375,46 @@ oparser.add_argument("--boilerpipe", action="store_true", default=False,
                      help="Use boilerpipe bodytext to do the de-boiling")
 oparser.add_argument("--alcazar", action="store_true", default=False,
                      help="Use alcazar bodytext extract relevant text from HTML. By default BeautifulSoup4is used")
+oparser.add_argument("--single-parse", action="store_true", default=False, dest="single_parse",
+                     help="Parse every record only once with lxml and reuse the tree for cleaning, language "
+                          "identification and text extraction, instead of parsing it again with BeautifulSoup4")
 oparser.add_argument('--output-dir', dest='outDir', help='Output directory', required=True)
 oparser.add_argument('--prefix', dest='prefix', help='Prefix of the file name; if not specified it is empty string',
                      required=False, default="")
 oparser.add_argument('--lang1', dest='l1', help='Language l1 in the crawl', default=None)
 oparser.add_argument('--lang2', dest='l2', help='Language l2 in the crawl', default=None)
+oparser.add_argument('--prefilter', action='store_true', default=False,
+                     help='Discard records before HTML normalisation if neither their declared content type nor a '
+                          'magic sniff of their first bytes are text, or if CLD2 reliably identifies a prefix of the '
+                          'record in a language other than --lang1/--lang2')
+oparser.add_argument('--prefilter-bytes', dest='prefilter_bytes', type=int, default=65536,
+                     help='Number of bytes of each record used by the pre-filter (65536 by default)')
+oparser.add_argument('--near-duplicates', dest='near_duplicates', type=float, default=None,
+                     help='Discard documents whose plain text is a near duplicate of a document already kept, i.e. the '
+                          'Jaccard similarity of their word 3-grams estimated with MinHash is at least this threshold '
+                          '(for example, 0.9); by default only exact duplicates are discarded')
+oparser.add_argument('--hash-store', dest='hash_store', default=None,
+                     help='Persistent store of content hashes (MD5 of the de-boiled HTML) shared across runs and '
+                          'websites: documents whose hash is in the store are discarded before extracting their text, '
+                          'and the hashes of the documents kept are appended to it')
+oparser.add_argument('--hash-store-memory', dest='hash_store_memory', type=int, default=256,
+                     help='Memory (in MB) of the Bloom filter in front of the persistent hash store; the larger it '
+                          'is, the fewer hashes that are not in the store are looked up on disk (256 by default). '
+                          'Documents are only discarded if their hash is really in the store')
+oparser.add_argument('--workers', dest='workers', type=int, default=1,
+                     help='Number of processes used to pre-process WARC records; output files are written in the '
+                          'same order as the records in the input WARC regardless of this value')
+oparser.add_argument('--stats', dest='stats', default=None,
+                     help='Write to this file a JSON object with the wall and CPU time spent in each step of the '
+                          'pre-processing (summed over all the records and workers), the number of records discarded '
+                          'for each reason, the encoding detection paths taken and the throughput of the run')
 options = oparser.parse_args()
 
 logging.basicConfig(level=logging.INFO if options.verbose else logging.ERROR)
 
+start_wall = time.perf_counter()
+read_counters = Counter()
+
 f = warc.WARCFile(fileobj=sys.stdin.buffer)
 
 seen_md5 = {}
@@ -76,105 +426,112 @@ if options.l1 is not None:
 if options.l2 is not None:
     languages.append(options.l2)
 
-urlFile = lzma.open(options.outDir + "/" + options.prefix + "url.xz", "w")
-langFile = lzma.open(options.outDir + "/" + options.prefix + "lang.xz", "w")
-encodingFile = lzma.open(options.outDir + "/" + options.prefix + "encoding.xz", "w")
-mimeFile = lzma.open(options.outDir + "/" + options.prefix + "mime.xz", "w")
-normHtmlFile = lzma.open(options.outDir + "/" + options.prefix + "normalized_html.xz", "w")
-plainTextFile = lzma.open(options.outDir + "/" + options.prefix + "plain_text.xz", "w")
+# The store is loaded before creating the worker processes, so they can check it too
+hash_store = None
+if options.hash_store is not None:
+    hash_store = PersistentHashStore(options.hash_store, options.hash_store_memory * 1024 * 1024)
+
+minhasher = MinHasher()
+if options.near_duplicates is not None:
+    lsh = MinHashLSH(options.near_duplicates, minhasher.num_perm)
+
+outputs = ["url", "lang", "encoding", "mime", "normalized_html", "plain_text"]
 # Boilerpipe cleaning is optional
 if options.boilerpipe:
-    deboilFile = lzma.open(options.outDir + "/" + options.prefix + "deboilerplate_html.xz", "w")
-
-for record in f:
-    # We convert into UTF8 first of all
-    orig_encoding, text = convert_encoding(record.payload.read())
-    url = record.url
-    if orig_encoding is None:
-        logging.info("Encoding of document " + url + " could not be identified")
+    outputs.append("deboilerplate_html")
+outFiles = {}
+for output in outputs:
+    # Files are written in independent XZ blocks, so documents can be read later without decompressing everything
+    outFiles[output] = XZBlockWriter(options.outDir + "/" + options.prefix + output + ".xz")
 
-    if len(text) > 0:
-        # HTML is then normalized
-        cleaner = Cleaner(style=True, links=True, add_nofollow=True, page_structure=False, safe_attrs_only=False)
+if options.workers > 1:
+    # Records are processed in the worker processes and results are collected in input order, so line numbers
+    # (document ids) and duplicate detection do not depend on the number of workers
+    semaphore = threading.BoundedSemaphore(options.workers * 64)
+    pool = multiprocessing.Pool(options.workers)
+    results = pool.imap(process_record_star, read_records(f, semaphore), chunksize=16)
+else:
+    semaphore = None
+    pool = None
+    results = map(process_record_star, read_records(f))
 
-        tree=""
-        try:
-            cleanhtml = cleaner.clean_html(re.sub('encoding *= *"[^"]+"', '', text, flags=re.IGNORECASE))
-            tree = ftfy.fix_text(cleanhtml, fix_entities=False, fix_character_width=False)
-            #document = html5lib.parse(fixedtext, treebuilder="lxml", namespaceHTMLElements=False)
-            #tree = etree.tostring(document, encoding="utf-8")
-        except Exception as ex:
-            sys.stderr.write(str(ex)+"\n")
+dropped = Counter()
+counters = Counter()
+written = 0
+for result in results:
+    if semaphore is not None:
+        semaphore.release()
+    url, md5, fingerprint, lines, reason, record_counters = result
+    counters.update(record_counters)
+    counters["records"] += 1
+    # checking for duplicate content (duplicates are discarded)
+    if md5 in seen_md5:
+        logging.info("Repeated file:\t" + url + "\tfirst occurrence\t" + seen_md5[md5])
+        dropped["duplicate"] += 1
+        continue
+    if hash_store is not None and md5 is not None and bytes.fromhex(md5) in hash_store:
+        logging.info("File already processed:\t" + url)
+        dropped["hash_store"] += 1
+        continue
+    if lines is None:
+        dropped[reason] += 1
+        continue
+    seen_md5[md5] = url
+    # checking for near-duplicate content (near duplicates of documents already kept are discarded)
+    if fingerprint is not None:
+        with timed(counters, "near_duplicates"):
+            kept = lsh.query(fingerprint)
+            if kept is None:
+                lsh.insert(url, fingerprint)
+        if kept is not None:
+            logging.info("Near-duplicate file:\t" + url + "\tkept document\t" + kept)
+            dropped["near_duplicate"] += 1
             continue
-        cleantree = tree.replace("&#160;", " ")
-        cleantree = cleantree.replace("\t", " ")
+    with timed(counters, "compression"):
+        for output in outputs:
+            outFiles[output].write(lines[output] + b"\n")
+    written += 1
+    if hash_store is not None:
+        hash_store.add(bytes.fromhex(md5))
 
-        # lang id
-        #printable_str = ''.join(x for x in cleantree if x in string.printable)
-        lang = guess_lang_from_data2(tree)
-        if len(languages) > 0 and lang not in languages:
-            logging.info("Language of document " + url + ": " + lang + ". Not among searched languages.")
-        else:
-            # If enabled, remove boilerplate HTML
-            if options.boilerpipe:
-                extractor = Extractor(extractor='ArticleExtractor', html=cleantree)
-                deboiled = extractor.getHTML()
-            else:
-                deboiled = cleantree
+if pool is not None:
+    pool.close()
+    pool.join()
 
-            # We compute MD5 on the HTML (either normalized one or after boilerpipe if enabled): if we get duplicate
-            # files we discard them
-            c = hashlib.md5()
-            c.update(deboiled.encode())
-            # print("hash", c.hexdigest(), url)
+with timed(counters, "compression"):
+    for output in outputs:
+        outFiles[output].close()
+if hash_store is not None:
+    hash_store.close()
 
-            # checking for duplicate content (duplicates are discarded)
-            if c.hexdigest() in seen_md5:
-                logging.info("Repeated file:\t" + url + "\tfirst occurrence\t" + seen_md5[c.hexdigest()])
-                pass
-            else:
-                # If enabled get text with Alcazar library
-                if options.alcazar:
-                    btext = alcazar.bodytext.parse_article(deboiled)
-                    if btext.body_text:
-                        plaintext = btext.body_text
-                    else:
-                        plaintext = ""
-                # Otherwise use beautifulsoup
-                else:
-                    soup = BeautifulSoup(deboiled, "lxml")
-                    for script in soup(["script", "style", "img"]):
-                        script.extract()  # rip it out
-
-                    plaintext = soup.get_text()
-                    plaintext = re.sub(r"\n+", "\n",
-                                       re.sub(r" *\n *", "\n", re.sub(r" +", " ", re.sub(r"\r", "", plaintext))))
-
-                if len(plaintext) > 0:
-                    # Guessing MIME of the file (checked on original content)
-                    mime = magic.from_buffer(text, mime=True)
-                    mimeFile.write(mime.encode() + b"\n")
-
-                    urlFile.write(url.encode() + b"\n")
-                    langFile.write(lang.encode() + b"\n")
-                    encodingFile.write(orig_encoding.encode() + b"\n")
-
-                    b64norm = base64.b64encode(cleantree.encode())
-                    normHtmlFile.write(b64norm + b"\n")
-
-                    if options.boilerpipe:
-                        b64deboil = base64.b64encode(deboiled.encode())
-                        deboilFile.write(b64deboil + b"\n")
-
-                    b64text = base64.b64encode(html.unescape(plaintext).encode())
-                    plainTextFile.write(b64text + b"\n")
-
-urlFile.close()
-langFile.close()
-encodingFile.close()
-mimeFile.close()
-normHtmlFile.close()
-plainTextFile.close()
-# Boilerpipe cleaning is optional
-if options.boilerpipe:
-    deboilFile.close()
+for reason, count in sorted(dropped.items()):
+    logging.info("Records discarded (" + reason + "): " + str(count))
+if hash_store is not None:
+    logging.info("Hash store lookups that were false positives of the Bloom filter: " +
+                 str(hash_store.false_positives))
+for path in ["declared", "utf-8", "cchardet", "empty"]:
+    logging.info("Records by encoding detection path (" + path + "): " + str(counters["encoding_" + path]))
+
+if options.stats is not None:
+    # CPU time of the whole run includes the worker processes, which have already been joined
+    wall = time.perf_counter() - start_wall
+    usage_self = resource.getrusage(resource.RUSAGE_SELF)
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = usage_self.ru_utime + usage_self.ru_stime + usage_children.ru_utime + usage_children.ru_stime
+    counters.update(read_counters)
+    stages = ["read", "magic", "decode", "clean", "ftfy", "langid", "boilerpipe", "md5", "text_extraction", "minhash",
+              "encode", "near_duplicates", "compression"]
+    stats = {"workers": options.workers,
+             "records": {"read": counters["records"], "written": written, "discarded": dict(dropped)},
+             "bytes_read": counters["bytes"],
+             "hash_store_false_positives": hash_store.false_positives if hash_store is not None else 0,
+             "encoding_paths": {path: counters["encoding_" + path]
+                                for path in ["declared", "utf-8", "cchardet", "empty"]},
+             "time": {"wall": wall, "cpu": cpu,
+                      "stages": {stage: {"wall": counters["wall_" + stage], "cpu": counters["cpu_" + stage]}
+                                 for stage in stages}},
+             "throughput": {"records_per_second": counters["records"] / wall if wall > 0 else 0.0,
+                            "bytes_per_second": counters["bytes"] / wall if wall > 0 else 0.0}}
+    with open(options.stats, "w") as stats_file:
+        json.dump(stats, stats_file, indent=2, sort_keys=True)
+        stats_file.write("\n")
@@ -9,7 +9,7 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
 from common import open_xz_or_gzip_or_plain
 
-def print_docs(docs_dict):
+def print_docs(docs_dict, docids=False):
     not_found = []
 
     for k in docs_dict:
@@ -24,7 +24,12 @@ def print_docs(docs_dict):
             continue
 
         en_text, fr_text = docs_dict[k]['en_text'], docs_dict[k]['fr_text']
-        print("{0}\t{1}\t{2}\t{3}\t".format(en_url, fr_url, en_text, fr_text))
+        if docids:
+            # Line numbers of the documents, so they can be found even if several documents have the same URL
+            print("{0}\t{1}\t{2}\t{3}\t{4}\t{5}".format(en_url, fr_url, en_text, fr_text, docs_dict[k]['en_docid'],
+                                                       docs_dict[k]['fr_docid']))
+        else:
+            print("{0}\t{1}\t{2}\t{3}\t".format(en_url, fr_url, en_text, fr_text))
 
     #if len(not_found):
     #    sys.stderr.write("Number of documents without matches: {0}\n".format(len(not_found)))
@@ -48,17 +53,19 @@ def load_docs(matches_filepath, url_filepath, text_filepath, threshold):
             map_f2e[f] = e
 
     with open_xz_or_gzip_or_plain(text_filepath) as f_text, open_xz_or_gzip_or_plain(url_filepath) as f_url:
-        for line in f_text:
+        for docid, line in enumerate(f_text, 1):
             text = line.strip()
             url = next(f_url, None).strip()
 
             if url in map_e2f:
                 key = (url, map_e2f[url])
                 docs_dict[key]['en_text'] = text
+                docs_dict[key]['en_docid'] = docid
 
             elif url in map_f2e:
                 key = (map_f2e[url], url)
                 docs_dict[key]['fr_text'] = text
+                docs_dict[key]['fr_docid'] = docid
 
     return docs_dict
 
@@ -71,8 +78,10 @@ if __name__ == "__main__":
                         required=True)
     parser.add_argument('--threshold', help='documents with lower TF-IDF score will be skipped', default=0.1,
                         type=float, required=False)
+    parser.add_argument('--docids', help='write the ids of both documents (their line numbers in the files of URLs '
+                                         'and plain text) after their texts', action='store_true')
 
     args = parser.parse_args()
 
     docs = load_docs(args.matches, args.url, args.plaintext, args.threshold)
-    print_docs(docs)
+    print_docs(docs, args.docids)
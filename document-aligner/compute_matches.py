@@ -50,13 +50,20 @@ if __name__ == "__main__":
         '--lang2', help='path to the extracted text', required=True)
     parser.add_argument(
         '--lang1', help='path to the translated foreign text', required=True)
+    parser.add_argument(
+        '--lang2_tokenised', help='path to the tokenised version of the extracted text (written by extract_lett.py '
+                                  'from the output of bitextor-tokenise); if given, the extracted text is not '
+                                  'tokenised again, and --word_tokeniser must be the word tokeniser that produced '
+                                  'it, so the translated text is tokenised in the same way', default=None)
     parser.add_argument('--min_count', type=int, default=2)
     parser.add_argument('--ngram_size', type=int, default=2)
     parser.add_argument('--tfidfsmooth', type=int, default=14)
     parser.add_argument('--output_matches', help='output file', required=True)
     parser.add_argument('--threshold', type=float, default=0.1)
     parser.add_argument('--batch_size', type=int, default=10000)
-    parser.add_argument('--word_tokeniser', help='Word tokeniser executable path', required=True)
+    parser.add_argument('--word_tokeniser', help='Word tokeniser executable path, or py:module:callable[:argument] '
+                                                 'for a tokeniser run in-process; with --lang2_tokenised, the word '
+                                                 'tokeniser of lang2', required=True)
 
     args = parser.parse_args()
 
@@ -85,7 +92,7 @@ if __name__ == "__main__":
                                       threshold=args.threshold,
                                       batch_size=args.batch_size)
 
-        urls, m_csr = scorer.score(args.lang2, args.lang1)
+        urls, m_csr = scorer.score(args.lang2, args.lang1, args.lang2_tokenised)
         #sys.stderr.write(str(m_csr)+"\n")
         if m_csr is None:
             sys.stderr.write("WARNING: Documents do not contain any useful information to be used in alignment.\n")
@@ -9,7 +9,7 @@ from numpy import float32, isnan
 from scipy.sparse import vstack as sp_vstack
 from scipy.sparse import csr_matrix, lil_matrix
 from sklearn.metrics.pairwise import pairwise_distances
-from external_processor import ExternalTextProcessor
+from external_processor import text_processor, WORDS
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../utils")
 from common import open_xz_or_gzip_or_plain
@@ -24,10 +24,12 @@ def _ngram_helper(words, n, hash_values):
         return map(hash, ngrams)
     return ngrams
 
-#Given a document ('page'), tokenizes it and return its 'n'-grams
-def ngrams_from_text(n, hash_values, ignore_set, word_tokeniser_cmd, page):
-    proc = ExternalTextProcessor(word_tokeniser_cmd.split(' '))
-    segments = proc.process(page).split("\n")
+#Given a document ('page'), tokenizes it (unless word_tokeniser is None, for pages already tokenised) and return its 'n'-grams
+def ngrams_from_text(n, hash_values, ignore_set, word_tokeniser, page):
+    if word_tokeniser is None:
+        segments = page.split("\n")
+    else:
+        segments = word_tokeniser.process(page).split("\n")
 #    segments = page.split("\n")
     words = []
     for s in segments:
@@ -42,8 +44,9 @@ def ngrams_from_text(n, hash_values, ignore_set, word_tokeniser_cmd, page):
 #Only extract_single is being used
 class ExtractionMapper(object):
 
-    def __init__(self, extraction_function=None):
+    def __init__(self, extraction_function=None, tokenised_extraction_function=None):
         self.ef = extraction_function
+        self.tef = tokenised_extraction_function
 
     def extract(self, corpus, pool=None):
         if pool is not None:
@@ -53,6 +56,10 @@ class ExtractionMapper(object):
     def extract_single(self, page):
         return self.ef(page)
 
+    #Same as extract_single, for pages already tokenised
+    def extract_single_tokenised(self, page):
+        return self.tef(page)
+
     def extract_source(self, corpus):
         return self.extract(corpus)
 
@@ -63,9 +70,13 @@ class ExtractionMapper(object):
 class WordExtractor(ExtractionMapper):
 
     def __init__(self, word_tokeniser_cmd, n=1, hash_values=False, ignore_set=None):
+        #The tokeniser is started once and every page is streamed through it
+        word_tokeniser = text_processor(word_tokeniser_cmd, WORDS)
         super(WordExtractor, self).__init__(
             extraction_function=partial(ngrams_from_text,
-                                        n, hash_values, ignore_set, word_tokeniser_cmd))
+                                        n, hash_values, ignore_set, word_tokeniser),
+            tokenised_extraction_function=partial(ngrams_from_text,
+                                                  n, hash_values, ignore_set, None))
 
 
 class DocumentVectorExtractor(object):
@@ -111,12 +122,14 @@ class DocumentVectorExtractor(object):
                 prevtext = text
         yield prevurl, prevtext
     #Given all source and target corpus file objects, counts how many times a word is found in different documents (source and target together, given that target is translated into source language) (AKA, idf)
-    def estimate_idf(self, source_corpus, target_corpus):
+    #If source_tokenised is True, source pages are already tokenised
+    def estimate_idf(self, source_corpus, target_corpus, source_tokenised=False):
         counts = Counter()
         self.ndocs = 0
         self.ndocs_sl = 0
+        source_extract = self.ef.extract_single_tokenised if source_tokenised else self.ef.extract_single
         for url, page in self.iterate_corpus(source_corpus):
-            counts.update(set(self.ef.extract_single(page)))
+            counts.update(set(source_extract(page)))
             self.ndocs += 1
             self.ndocs_sl += 1
         self.ndocs_tl = 0
@@ -162,13 +175,14 @@ class DocumentVectorExtractor(object):
         #sys.stderr.write("{0} terms, {1} ignored\n".format(
         #    len(self.term2idx), len(self.ignored_terms)))
     #Given a corpus file object and the number of documents it contains, counts word frequencies in each document (tf), returning the resulting tf-idf matrix and document urls
-    def extract(self, corpus, lencorpus):
+    def extract(self, corpus, lencorpus, tokenised=False):
         m = lil_matrix((lencorpus, len(self.term2idx)), dtype=float32)
         doc_idx = 0
         url_list=[]
+        extract = self.ef.extract_single_tokenised if tokenised else self.ef.extract_single
         for url, page in self.iterate_corpus(corpus):
             url_list.append(url)
-            counts = Counter(self.ef.extract_single(page))
+            counts = Counter(extract(page))
             if not counts:
                 continue
             local_max_count = float(max(counts.values()))
@@ -248,7 +262,11 @@ class CosineDistanceScorer(object):
         # return nothing. file does not exist
         return None
 
-    def score(self, source_filepath, target_filepath):
+    #If source_tokenised_filepath is given, it is read instead of source_filepath and its pages are not tokenised again
+    def score(self, source_filepath, target_filepath, source_tokenised_filepath=None):
+        source_tokenised = source_tokenised_filepath is not None
+        if source_tokenised:
+            source_filepath = source_tokenised_filepath
         source_filepath = self.munge_file_path(source_filepath)
         target_filepath = self.munge_file_path(target_filepath)
         urls = [[],[]]
@@ -256,14 +274,14 @@ class CosineDistanceScorer(object):
         with open_xz_or_gzip_or_plain(source_filepath) as source_file:
             with open_xz_or_gzip_or_plain(target_filepath) as target_file:
                 #start = time.time()
-                self.vector_extractor.estimate_idf(source_file, target_file)
+                self.vector_extractor.estimate_idf(source_file, target_file, source_tokenised)
                 #sys.stderr.write(
                 #    "IDF estimation took {0:.5f} seconds\n".format(time.time() - start))
 
         #start = time.time()
         #Calculate tf and obtain tf-idf with urls
         with open_xz_or_gzip_or_plain(source_filepath) as source_file:
-            urls[0], source_matrix = self.vector_extractor.extract(source_file,self.vector_extractor.ndocs_sl)
+            urls[0], source_matrix = self.vector_extractor.extract(source_file,self.vector_extractor.ndocs_sl,source_tokenised)
         with open_xz_or_gzip_or_plain(target_filepath) as target_file:
             urls[1], target_matrix = self.vector_extractor.extract(target_file,self.vector_extractor.ndocs_tl)
         #sys.stderr.write(
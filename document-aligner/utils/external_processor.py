@@ -1,14 +1,247 @@
-
+import atexit
+import importlib
+import queue
 import subprocess
+import sys
+import threading
+import time
+
+# Line written after every document in persistent mode with framing='sentinel' (sentence splitters). Moses sentence
+# splitter copies lines that look like a single XML tag to their output unchanged; tools that escape it (&lt; &gt;),
+# split it into several tokens or escape its hyphen (@-@, as Moses tokeniser with -a) are also recognised
+SENTINEL = "<bitextor-eod>"
+
+# Separators of the items returned as a list by in-process word tokenisers and sentence splitters
+WORDS = " "
+SENTENCES = "\n"
+
+
+def text_processor(spec, separator, persistent=True):
+    """Returns the processor for a tokeniser or sentence splitter given in the command line: either
+    'py:module:callable[:argument]' for one run in-process (see PythonTextProcessor) or an external command. Word
+    tokenisers write a line for every line read, so their documents are delimited by the number of lines; sentence
+    splitters write any number of lines, so a sentinel line is written after every document"""
+    if spec.startswith("py:"):
+        return PythonTextProcessor(spec[3:], separator)
+    return ExternalTextProcessor(spec.split(' '), persistent=persistent,
+                                 framing="lines" if separator == WORDS else "sentinel")
+
+
+def is_sentinel(line):
+    line = line.replace(" ", "").strip()
+    return line.replace("&lt;", "<").replace("&gt;", ">").replace("@-@", "-") == SENTINEL
+
+
+class PythonTextProcessor(object):
+    """Runs a Python callable on every line of the documents, without starting any process. The spec is
+    'module:callable' or 'module:callable:argument': in the second case, the callable is called once with the argument
+    (a language code, a model path...) to build the object that processes the text. The callable (or an object with
+    a tokenize() or split() method) receives a line and returns either a string or a list of items, joined with the
+    separator (WORDS for tokenisers, SENTENCES for sentence splitters). Examples: py:simpletokenisers:tokenise,
+    py:nltk:word_tokenize, py:sentence_splitter:SentenceSplitter:en"""
+
+    def __init__(self, spec, separator):
+        fields = spec.split(":", 2)
+        if len(fields) < 2:
+            raise ValueError("In-process text processor '{0}' is not 'module:callable[:argument]'".format(spec))
+        function = getattr(importlib.import_module(fields[0]), fields[1])
+        if len(fields) == 3:
+            function = function(fields[2])
+        for method in ["tokenize", "split"]:
+            if hasattr(function, method):
+                function = getattr(function, method)
+                break
+        self.function = function
+        self.separator = separator
+
+    def process(self, input_text):
+        # The output is the one of a command-line tool: a line (or more, for sentence splitters) for every line read
+        lines = input_text.split("\n")
+        if lines[-1] == "":
+            lines.pop()
+        output = []
+        for line in lines:
+            result = self.function(line)
+            output.append(result if isinstance(result, str) else self.separator.join(result))
+        return "".join(line + "\n" for line in output)
+
+    def close(self):
+        pass
 
 
 class ExternalTextProcessor(object):
+    """Runs a text processing tool (tokeniser, sentence splitter...) on documents. By default a new process is started
+    for every document; in persistent mode a single process is kept alive and documents are streamed through it, which
+    requires a tool that does not buffer its output (for example, Moses tokeniser with -b). Documents are delimited in
+    the output either by a sentinel line copied by the tool (framing='sentinel') or by the number of lines, for tools
+    that write a line for every line read (framing='lines') or by a null character, for tools that flush their output
+    when they read one (framing='null', as Apertium tools with -z). If the persistent process stops or does not write
+    anything for 'timeout' seconds, it is killed and the processor falls back to a process per document"""
 
-    def __init__(self, cmd):
+    def __init__(self, cmd, persistent=False, framing="sentinel", timeout=30):
         self.cmd = cmd
+        self.persistent = persistent
+        self.framing = framing
+        self.timeout = timeout
+        self.proc = None
+        self.lines = None
+        self.error_chunks = None
+        # Standard error written while processing the last document
+        self.errors = ""
 
     def process(self, input_text):
+        self.errors = ""
+        if self.persistent:
+            try:
+                output = self._process_persistent(input_text)
+                self.errors = self._drain_errors()
+                return output
+            except (IOError, queue.Empty, ValueError) as ex:
+                if isinstance(ex, queue.Empty):
+                    reason = "no output for {0} s: it buffers its output or {1}".format(self.timeout, {
+                        "sentinel": "does not copy the line " + SENTINEL + " written after every document",
+                        "lines": "does not write a line for every line read",
+                        "null": "does not flush its output when it reads a null character"}[self.framing])
+                else:
+                    reason = type(ex).__name__
+                sys.stderr.write("WARNING: persistent process '{0}' failed ({1}); starting a new process for every "
+                                 "document\n".format(" ".join(self.cmd), reason))
+                self.persistent = False
+                self.close()
+
         proc = subprocess.Popen(self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         outs, errs = proc.communicate(input=bytes(input_text, encoding='utf-8'))
+        self.errors = errs.decode('utf-8', errors='replace')
 
         return outs.decode('utf-8')
+
+    def _start(self):
+        self.proc = subprocess.Popen(self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE)
+        # Output is read in a separate thread, so the tool never blocks writing while a long document is being sent
+        # and reads can time out if the tool buffers its output. Standard error is read in another one, so the tool
+        # never blocks writing errors either
+        self.lines = queue.Queue()
+        self.error_chunks = queue.Queue()
+        for target, stream, items in [(self._read_records if self.framing == "null" else self._read_output,
+                                       self.proc.stdout, self.lines),
+                                      (self._read_errors, self.proc.stderr, self.error_chunks)]:
+            reader = threading.Thread(target=target, args=(stream, items))
+            reader.daemon = True
+            reader.start()
+        atexit.register(self.close)
+
+    @staticmethod
+    def _read_output(stdout, lines):
+        for line in stdout:
+            lines.put(line.decode('utf-8'))
+        lines.put(None)
+
+    @staticmethod
+    def _read_records(stdout, records):
+        buffered = b""
+        while True:
+            chunk = stdout.read1(65536)
+            if not chunk:
+                break
+            buffered += chunk
+            while b"\0" in buffered:
+                record, buffered = buffered.split(b"\0", 1)
+                records.put(record.decode('utf-8'))
+        records.put(None)
+
+    @staticmethod
+    def _read_errors(stderr, chunks):
+        while True:
+            chunk = stderr.read1(65536)
+            if not chunk:
+                break
+            chunks.put(chunk)
+
+    def _drain_errors(self):
+        """Returns what the persistent process has written to its standard error since the last call: the errors of
+        the document just processed (errors written after its output are only seen with the next document)"""
+        chunks = []
+        while True:
+            try:
+                chunks.append(self.error_chunks.get_nowait())
+            except queue.Empty:
+                return b"".join(chunks).decode('utf-8', errors='replace')
+
+    def _readline(self):
+        line = self.lines.get(timeout=self.timeout)
+        if line is None:
+            raise IOError("process finished")
+        return line
+
+    def _process_persistent(self, input_text):
+        if self.proc is None:
+            self._start()
+        if input_text and not input_text.endswith("\n"):
+            input_text += "\n"
+
+        if self.framing == "null":
+            self.proc.stdin.write(input_text.replace("\0", "").encode('utf-8') + b"\0")
+            self.proc.stdin.flush()
+            return self._readline()
+
+        if self.framing == "lines":
+            self.proc.stdin.write(input_text.encode('utf-8'))
+            self.proc.stdin.flush()
+            return "".join(self._readline() for _ in range(input_text.count("\n")))
+
+        self.proc.stdin.write((input_text + SENTINEL + "\n").encode('utf-8'))
+        self.proc.stdin.flush()
+        output = []
+        while True:
+            line = self._readline()
+            if is_sentinel(line):
+                return "".join(output)
+            output.append(line)
+
+    def close(self):
+        if self.proc is not None:
+            proc = self.proc
+            self.proc = None
+            try:
+                proc.stdin.close()
+                proc.wait(timeout=self.timeout)
+            except (IOError, subprocess.TimeoutExpired):
+                proc.kill()
+                proc.wait()
+
+
+class MorphologicalAnalyser(object):
+    """Apertium morphological analyser run on whole documents. A single analyser process is kept for all the documents
+    and they are delimited with null characters, so the analyser script has to run the Apertium tools with -z
+    (null-flush mode); otherwise, after the timeout, a new process is started for every document, as in the past.
+    analyse() returns None if the analyser wrote any errors while analysing the document. The time spent in every
+    document is kept for report()"""
+
+    def __init__(self, analyser_path, timeout=30):
+        self.processor = ExternalTextProcessor(["/bin/bash", analyser_path], persistent=True, framing="null",
+                                               timeout=timeout)
+        self.latencies = []
+
+    def analyse(self, text):
+        start = time.perf_counter()
+        output = self.processor.process(text)
+        self.latencies.append(time.perf_counter() - start)
+        if len(self.processor.errors.strip()) != 0:
+            return None
+        return output
+
+    def report(self):
+        """Returns a line with the number of documents analysed and the mean, median, 95th percentile and maximum
+        analysis time per document"""
+        if not self.latencies:
+            return "0 documents analysed"
+        latencies = sorted(self.latencies)
+        return "{0} documents analysed ({1}); time per document (ms): mean {2:.1f}, median {3:.1f}, " \
+               "95th percentile {4:.1f}, max {5:.1f}".format(
+                   len(latencies), "single process" if self.processor.persistent else "a process per document",
+                   1000 * sum(latencies) / len(latencies), 1000 * latencies[len(latencies) // 2],
+                   1000 * latencies[int(len(latencies) * 0.95)], 1000 * latencies[-1])
+
+    def close(self):
+        self.processor.close()
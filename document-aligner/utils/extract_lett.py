@@ -14,7 +14,7 @@ import sys
 import html
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../../utils")
-from external_processor import ExternalTextProcessor
+from external_processor import text_processor, SENTENCES
 from common import open_xz_or_gzip_or_plain
 
 def filter_digits_and_punctuation(original_text):
@@ -26,19 +26,49 @@ def filter_digits_and_punctuation(original_text):
     return True
 
 
-def split_sentences(original_text, sentence_splitter_cmd):
-    proc = ExternalTextProcessor(sentence_splitter_cmd.split())
-    output = html.unescape(proc.process(original_text.replace("\n\n", "\n")))
+def split_sentences(original_text, sentence_splitter):
+    output = html.unescape(sentence_splitter.process(original_text.replace("\n\n", "\n")))
 
     return [n for n in output.split("\n") if filter_digits_and_punctuation(n)]
 
 
+def unescape_line(line):
+    # Escaped new lines would add lines to only one of the files, so they become spaces
+    return html.unescape(line).replace("\n", " ")
+
+
+def read_sentences(encoded_sentences, encoded_tokenised=None):
+    """Returns the sentences (and their tokenised version, or None) of a document in the files produced by
+    bitextor-tokenise, filtered as in split_sentences. Both are split into lines before unescaping them, so every
+    sentence keeps its tokenised line"""
+    sentences = base64.b64decode(encoded_sentences.strip()).decode("utf-8").split("\n")
+    if encoded_tokenised is None:
+        tokenised = [None] * len(sentences)
+    else:
+        tokenised = base64.b64decode(encoded_tokenised.strip()).decode("utf-8").split("\n")
+        if len(tokenised) != len(sentences):
+            raise ValueError("Sentences and tokenised sentences of a document have different numbers of lines "
+                             "({0} and {1})".format(len(sentences), len(tokenised)))
+        tokenised = [unescape_line(t) for t in tokenised]
+    sentences = [unescape_line(s) for s in sentences]
+    # Paragraph marks written by Moses sentence splitter are discarded
+    return [(s, t) for s, t in zip(sentences, tokenised) if s != "<P>" and filter_digits_and_punctuation(s)]
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--langs", dest="languages",
                         help="Languages to be extracted (comma-separated)", required=True)
     parser.add_argument("--splitter", dest="splitter",
-                        help="Sentence splitting script", required=True)
+                        help="Sentence splitting script, or py:module:callable[:argument] for a sentence "
+                             "splitter run in-process", required=False, default=None)
+    parser.add_argument("--sentences", dest="sentences", default=None,
+                        help="File produced by bitextor-tokenise with the sentences of every document; if it is "
+                             "given, it is read instead of running the sentence splitter")
+    parser.add_argument("--tokenised", dest="tokenised", default=None,
+                        help="File produced by bitextor-tokenise with the tokenised sentences of every document; if "
+                             "it is given with --sentences, <lang>.extracted.tokenised.gz files are written too, with "
+                             "the tokenised version of every line in <lang>.extracted.gz")
     parser.add_argument("--output_prefix", dest="output_prefix", default="",
                         help="Prefix for output files within directory", required=False)
     parser.add_argument("--output_dir", dest="output_dir", default=".",
@@ -57,36 +87,54 @@ if __name__ == "__main__":
                         help='File containing the list of urls of the documents in a WARC file')
 
     args = parser.parse_args()
+    if args.splitter is None and args.sentences is None:
+        parser.error("either --splitter or --sentences is required")
 
     langs_parse = args.languages.strip().split(',')
+    # The sentence splitter is started once and every document is streamed through it
+    if args.sentences is None:
+        splitter = text_processor(args.splitter, SENTENCES)
     # print("langs_parse", langs_parse)
 
     lang_file = {}
+    tokenised_file = {}
     for l in langs_parse:
         if not l.strip():
             continue
         if args.xz:
             lang_file[l] = lzma.open(os.path.join(
                 args.output_dir, "{0}{1}.extracted.xz".format(args.output_prefix, l)), "wb")
+            if args.sentences is not None and args.tokenised is not None:
+                tokenised_file[l] = lzma.open(os.path.join(
+                    args.output_dir, "{0}{1}.extracted.tokenised.xz".format(args.output_prefix, l)), "wb")
         else:
             lang_file[l] = gzip.open(os.path.join(
                 args.output_dir, "{0}{1}.extracted.gz".format(args.output_prefix, l)), "wb")
+            if args.sentences is not None and args.tokenised is not None:
+                tokenised_file[l] = gzip.open(os.path.join(
+                    args.output_dir, "{0}{1}.extracted.tokenised.gz".format(args.output_prefix, l)), "wb")
 
-    with open_xz_or_gzip_or_plain(args.textFile) as text_reader, \
+    with open_xz_or_gzip_or_plain(args.sentences or args.textFile) as text_reader, \
             open_xz_or_gzip_or_plain(args.langFile) as lang_reader, \
-            open_xz_or_gzip_or_plain(args.urlFile) as url_reader:
+            open_xz_or_gzip_or_plain(args.urlFile) as url_reader, \
+            open_xz_or_gzip_or_plain(args.tokenised or os.devnull) as tokenised_reader:
         for line in text_reader:
-            text = base64.b64decode(line.strip()).decode("utf-8")
             lang = next(lang_reader, None).strip()
             uri = next(url_reader, None).strip()
+            tokenised_line = next(tokenised_reader, None) if tokenised_file else None
 
             if lang not in langs_parse:
                 continue
 
-            if not text:
-                continue
+            if args.sentences is not None:
+                extracted = read_sentences(line, tokenised_line)
+            else:
+                text = base64.b64decode(line.strip()).decode("utf-8")
+                if not text:
+                    continue
+                extracted = [(sentence, None) for sentence in split_sentences(text, splitter)]
 
-            for extracted_line in split_sentences(text, args.splitter):
+            for extracted_line, tokenised_extracted_line in extracted:
                 extracted_line = extracted_line.strip()
                 if not extracted_line:
                     continue
@@ -102,7 +150,12 @@ if __name__ == "__main__":
 
                 lang_file[lang].write("{0}\t{1}\n".format(
                     uri, extracted_line).encode("utf-8"))
+                if tokenised_file:
+                    tokenised_file[lang].write("{0}\t{1}\n".format(
+                        uri, tokenised_extracted_line.strip()).encode("utf-8"))
 
         # print("lang_file", lang_file)
         for f in lang_file:
             lang_file[f].close()
+        for f in tokenised_file:
+            tokenised_file[f].close()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+#
+# 1. Reads the HTML and the URL of every document once, extracting everything the features need (or reads it from the
+#    feature sidecar written by bitextor-docfeatures)
+# 2. Reads RIDX file
+# 3. Adds to every candidate the six features computed, in the same order, by the chain of scripts
+#    bitextor-imagesetoverlap, bitextor-structuredistance, bitextor-urlsdistance, bitextor-mutuallylinked,
+#    bitextor-urlscomparison and bitextor-urlsetoverlap, with the same values
+#
+# Output format (input of bitextor-rank):
+# num_doc_lang1    [num_doc_lang2:score:imgoverlap:structuredistance:urldistance:mutuallylinked:urlscomparison:urlsoverlap]+
+#
+
+import os
+import sys
+import argparse
+
+pathname = os.path.dirname(sys.argv[0])
+sys.path.append(pathname + "/../utils")
+from common import open_xz_or_gzip_or_plain
+from docfeatures import TagEncoder, decode_html, extract_document, score_pair, structure_similarity, \
+    BoundedStructureSimilarity, read_ridx, chunks, imap_ordered
+from featurestore import FeatureStoreReader
+
+
+def read_documents(html_file, url_file, docs, wanted):
+    encoder = TagEncoder()
+    with open_xz_or_gzip_or_plain(html_file) as hd:
+        with open_xz_or_gzip_or_plain(url_file) as ud:
+            fileid = 1
+            for url in ud:
+                html_base64enc = next(hd, None)
+                if fileid in wanted:
+                    docs[fileid] = extract_document(url, decode_html(html_base64enc), encoder)
+                fileid += 1
+
+
+class SidecarDocuments(dict):
+    """Documents read from a feature sidecar the first time they are needed"""
+
+    def __init__(self, store):
+        dict.__init__(self)
+        self.store = store
+
+    def __missing__(self, docid):
+        doc = self.store.get(docid)
+        self[docid] = doc
+        return doc
+
+
+def score_chunk(chunk):
+    """Returns the output of a chunk of RIDX lines and the structure distance statistics of the chunk (documents and
+    similarity are globals, so forked workers share them)"""
+    bounded = isinstance(similarity, BoundedStructureSimilarity)
+    before = similarity.stats() if bounded else None
+    output = []
+    for fields in chunk:
+        line = [str(fields[0])]
+        doc = documents[int(fields[0])]
+        for j in range(1, len(fields)):
+            candidate = fields[j]
+            candidateid = int(fields[j].split(":")[0])
+            line.append(candidate + ":" + ":".join(score_pair(doc, documents[candidateid], similarity)))
+        output.append("\t".join(line) + "\n")
+    return "".join(output), [a - b for a, b in zip(similarity.stats(), before)] if bounded else None
+
+
+oparser = argparse.ArgumentParser(
+    description="Script that rescores the aligned-document candidates provided by script bitextor-idx2ridx by adding "
+                "all the features (image set overlap, structure distance, URL distance, mutual linking, URL "
+                "comparison and URL set overlap) in a single pass over the HTML of the documents.")
+oparser.add_argument('ridx', metavar='RIDX', nargs='?',
+                     help='File with extension .ridx (reverse index) from bitextor-idx2ridx (if not provided, '
+                          'the script will read from the standard input)',
+                     default=None)
+oparser.add_argument("--html", help="File produced during pre-processing containing all HTML files in a WARC file",
+                     dest="html")
+oparser.add_argument("--url", help="File produced during pre-processing containing all the URLs in a WARC file",
+                     dest="url")
+oparser.add_argument("--sidecar", dest="sidecar",
+                     help="Feature sidecar produced by bitextor-docfeatures, read instead of the HTML and URL files")
+oparser.add_argument("--structure-min-similarity", dest="structure_min_similarity", type=float, default=None,
+                     help="Only compute exactly the structure similarities of at least this value; for the rest, an "
+                          "upper bound (below this value) is written, which is much faster for long structures. How "
+                          "often the cutoff fired is reported in the standard error")
+oparser.add_argument("--workers", dest="workers", type=int, default=1,
+                     help="Number of processes computing the features of chunks of RIDX lines; output is written in "
+                          "the same order regardless of this value")
+oparser.add_argument("--chunk-size", dest="chunk_size", type=int, default=100,
+                     help="Number of RIDX lines given to a process at once (100 by default)")
+options = oparser.parse_args()
+if options.sidecar is None and (options.html is None or options.url is None):
+    oparser.error("either --sidecar or both --html and --url are required")
+
+if options.ridx is None:
+    reader = sys.stdin
+else:
+    reader = open(options.ridx, "r")
+
+# Only the documents in the RIDX file are kept
+lines, referenced = read_ridx(reader)
+if options.sidecar is not None:
+    documents = SidecarDocuments(FeatureStoreReader(options.sidecar))
+    if options.workers > 1:
+        # Documents are read before starting the workers, so they are shared instead of read by every worker
+        for docid in sorted(referenced):
+            documents[docid]
+else:
+    documents = {}
+    read_documents(options.html, options.url, documents, referenced)
+
+if options.structure_min_similarity is not None:
+    similarity = BoundedStructureSimilarity(options.structure_min_similarity)
+else:
+    similarity = structure_similarity
+
+# read_ridx only keeps the lines where the document has at least one candidate
+stats = [0, 0, 0, 0]
+for output, chunk_stats in imap_ordered(score_chunk, chunks(lines, options.chunk_size), options.workers):
+    sys.stdout.write(output)
+    if chunk_stats is not None:
+        stats = [a + b for a, b in zip(stats, chunk_stats)]
+
+if options.structure_min_similarity is not None:
+    sys.stderr.write(similarity.report(stats) + "\n")
@@ -9,13 +9,18 @@ import base64
 pathname = os.path.dirname(sys.argv[0])
 sys.path.append(pathname + "/../utils")
 from common import open_xz_or_gzip_or_plain
+from docfeatures import read_ridx
 
-def extract_urls(html_file, url_file, docs):
+def extract_urls(html_file, url_file, docs, wanted):
     with open_xz_or_gzip_or_plain(html_file) as hd:
         with open_xz_or_gzip_or_plain(url_file) as ud:
             fileid = 1
             for url in ud:
-                html_content = base64.b64decode(next(hd, None)).decode("utf-8")
+                html_base64enc = next(hd, None)
+                if fileid not in wanted:
+                    fileid += 1
+                    continue
+                html_content = base64.b64decode(html_base64enc).decode("utf-8")
                 links = re.findall('''href\s*=\s*['"]\s*([^'"]+)['"]''', html_content, re.S)
                 docs[fileid] = [url, set(list(links))]
                 fileid += 1
@@ -39,23 +44,22 @@ if options.ridx is None:
 else:
     reader = open(options.ridx, "r")
 
-index = {}
+# Only the documents in the RIDX file are kept
+lines, referenced = read_ridx(reader)
 documents = {}
-extract_urls(options.html, options.url, documents)
-
-for i in reader:
-    fields = i.strip().split("\t")
-    # The document must have at least one candidate
-    if len(fields) > 1:
-        sys.stdout.write(str(fields[0]))
-        url_doc = documents[int(fields[0])][0]
-        for j in range(1, len(fields)):
-            candidate = fields[j]
-            candidateid = int(fields[j].split(":")[0])
-            urls_candidate = documents[candidateid][1]
-            if url_doc in urls_candidate:
-                candidate += ":1"
-            else:
-                candidate += ":0"
-            sys.stdout.write("\t" + candidate)
-        sys.stdout.write("\n")
+extract_urls(options.html, options.url, documents, referenced)
+
+# read_ridx only keeps the lines where the document has at least one candidate
+for fields in lines:
+    sys.stdout.write(str(fields[0]))
+    url_doc = documents[int(fields[0])][0]
+    for j in range(1, len(fields)):
+        candidate = fields[j]
+        candidateid = int(fields[j].split(":")[0])
+        urls_candidate = documents[candidateid][1]
+        if url_doc in urls_candidate:
+            candidate += ":1"
+        else:
+            candidate += ":0"
+        sys.stdout.write("\t" + candidate)
+    sys.stdout.write("\n")
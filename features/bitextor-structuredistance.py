@@ -1,92 +1,46 @@
 #!/usr/bin/env python3
 
 import sys
-import base64
-import math
-import html.parser
 import argparse
 import os
 
-import Levenshtein
-
-
-class Parser(html.parser.HTMLParser):
-
-    def error(self, message):
-        pass
-
-    def __init__(self):
-        html.parser.HTMLParser.__init__(self)
-        self.script = 0
-        self.output = []
-
-    def handle_starttag(self, tag, attrs):
-        if tag == "script" or tag == "noscript":
-            self.script = 1
-        else:
-            self.output.append("_" + tag + "_")
-
-    def handle_data(self, data):
-        if self.script == 0:
-            if data != "":
-                nwords = len(data.split())
-                if nwords > 0:
-                    # Replacing every word in text by a "_" symbol
-                    self.output.append("_" * int(math.log(nwords, 2)))
-
-    def handle_endtag(self, tag):
-        if tag == "script" or tag == "noscript":
-            self.script = 0
-        else:
-            self.output.append("_" + tag + "_")
-
-
 pathname = os.path.dirname(sys.argv[0])
 sys.path.append(pathname + "/../utils")
 from common import open_xz_or_gzip_or_plain
+from docfeatures import TagEncoder, decode_html, structure_representation, structure_similarity, \
+    BoundedStructureSimilarity, read_ridx, chunks, imap_ordered
 
 
-# print("pathname", pathname)
-
-def extract_structure_representations(f, docs):
+def extract_structure_representations(f, docs, wanted):
+    # Tags are encoded in order of appearance in the documents kept, but distances do not depend on the character of
+    # every tag
+    encoder = TagEncoder()
     with open_xz_or_gzip_or_plain(f) as fd:
         fileid = 1
-        dic = {}
-        charidx = 32
-        dic[''] = '_'
-
         for html_base64enc in fd:
-            p = Parser()
-            try:
-                e = base64.b64decode(html_base64enc.strip()).decode("utf8")
-                if e != "":
-                    p.feed(e)
-                    raspa = "".join(p.output)
-                    if raspa.split('_')[1][-2:] == "ml" and all(ord(char) < 128 for char in
-                                                                raspa):  # Delete entries without *ml in the first
-                        # tag to avoid things different than HTML or XML as JPGS or PDF, for example. To compute the
-                        # edit distance at the level of characters, HTML tags must be encoded as characters and not
-                        # strings:
-                        taglist = raspa.split('_')
-                        tagset = set(taglist)
-                        if '' in tagset:
-                            tagset.remove('')
-                        # Adding new tags in the raspa and the character with which they will be replaced to the
-                        # dictionary
-                        for tag in tagset:
-                            if tag not in dic:
-                                dic[tag] = chr(charidx)
-                                charidx += 1
-                                if charidx == 95:
-                                    charidx += 1
-                        translated_taglist = []
-                        for tag in taglist:
-                            translated_taglist.append(dic[tag])
-                        docs[fileid] = "".join(translated_taglist)
-            except html.parser.HTMLParseError:
-                pass
-            finally:
-                fileid += 1
+            if fileid in wanted:
+                structure = structure_representation(decode_html(html_base64enc), encoder)
+                if structure is not None:
+                    docs[fileid] = structure
+            fileid += 1
+
+
+def score_chunk(chunk):
+    """Returns the output of a chunk of RIDX lines and the cutoff statistics of the chunk (documents and similarity
+    are globals, so forked workers share them)"""
+    bounded = isinstance(similarity, BoundedStructureSimilarity)
+    before = similarity.stats() if bounded else None
+    output = []
+    for fields in chunk:
+        structure_doc = documents[int(fields[0])]
+        line = [str(fields[0])]
+        for j in range(1, len(fields)):
+            candidate = fields[j]
+            candidateid = int(fields[j].split(":")[0])
+            port = similarity(structure_doc, documents[candidateid])
+            line.append(candidate + ":" + str(port))
+        output.append("\t".join(line) + "\n")
+    return "".join(output), [a - b for a, b in zip(similarity.stats(), before)] if bounded else None
 
 
 oparser = argparse.ArgumentParser(
@@ -98,6 +52,15 @@ oparser.add_argument('ridx', metavar='RIDX', nargs='?',
                      default=None)
 oparser.add_argument("--html", help="File produced during pre-processing containing all HTML files in a WARC file",
                      dest="html", required=True)
+oparser.add_argument("--min-similarity", dest="min_similarity", type=float, default=None,
+                     help="Only compute exactly the similarities of at least this value; for the rest, an upper bound "
+                          "(below this value) is written, which is much faster for long structures. How often the "
+                          "cutoff fired is reported in the standard error")
+oparser.add_argument("--workers", dest="workers", type=int, default=1,
+                     help="Number of processes computing the distances of chunks of RIDX lines; output is written in "
+                          "the same order regardless of this value")
+oparser.add_argument("--chunk-size", dest="chunk_size", type=int, default=100,
+                     help="Number of RIDX lines given to a process at once (100 by default)")
 options = oparser.parse_args()
 
 if options.ridx is None:
@@ -105,21 +68,22 @@ if options.ridx is None:
 else:
     reader = open(options.ridx, "r")
 
+# Only the documents in the RIDX file are kept
+lines, referenced = read_ridx(reader)
 documents = {}
-extract_structure_representations(options.html, documents)
+extract_structure_representations(options.html, documents, referenced)
 
-for i in reader:
-    fields = i.strip().split("\t")
-    # The document must have at least one candidate
-    if len(fields) > 1:
-        len_s = len(documents[int(fields[0])])
-        sys.stdout.write(str(fields[0]))
-        for j in range(1, len(fields)):
-            candidate = fields[j]
-            candidateid = int(fields[j].split(":")[0])
-            len_t = len(documents[candidateid])
-            dist = Levenshtein.distance(documents[int(fields[0])], documents[candidateid])
-            port = 1 - (dist / float(max(len_s, len_t)))
-            candidate += ":" + str(port)
-            sys.stdout.write("\t" + candidate)
-        sys.stdout.write("\n")
+if options.min_similarity is not None:
+    similarity = BoundedStructureSimilarity(options.min_similarity)
+else:
+    similarity = structure_similarity
+
+# read_ridx only keeps the lines where the document has at least one candidate
+stats = [0, 0, 0, 0]
+for output, chunk_stats in imap_ordered(score_chunk, chunks(lines, options.chunk_size), options.workers):
+    sys.stdout.write(output)
+    if chunk_stats is not None:
+        stats = [a + b for a, b in zip(stats, chunk_stats)]
+
+if options.min_similarity is not None:
+    sys.stderr.write(similarity.report(stats) + "\n")
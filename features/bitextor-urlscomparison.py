@@ -9,11 +9,15 @@ import re
 pathname = os.path.dirname(sys.argv[0])
 sys.path.append(pathname + "/../utils")
 from common import open_xz_or_gzip_or_plain
+from docfeatures import read_ridx
 
-def read_urls(f, docs):
+def read_urls(f, docs, wanted):
     with open_xz_or_gzip_or_plain(f) as fd:
         fileid = 1
         for u in fd:
+            if fileid not in wanted:
+                fileid += 1
+                continue
             u = u.strip()
             rx = re.match('(https?://[^/:]+)', u)
             if rx is not None:
@@ -41,25 +45,24 @@ if options.ridx is None:
 else:
     reader = open(options.ridx, "r")
 
-index = {}
+# Only the documents in the RIDX file are kept
+lines, referenced = read_ridx(reader)
 documents = {}
-read_urls(options.url, documents)
+read_urls(options.url, documents, referenced)
 
-for i in reader:
-    fields = i.strip().split("\t")
-    # The document must have at least one candidate
-    if len(fields) > 1:
-        sys.stdout.write(str(fields[0]))
-        url_doc = documents[int(fields[0])]
-        for j in range(1, len(fields)):
-            candidate = fields[j]
-            candidateid = int(fields[j].split(":")[0])
-            url_candidate = documents[candidateid]
-            if len(url_candidate) == 0 or len(url_doc) == 0:
-                normdist = 0.0
-            else:
-                dist = Levenshtein.distance(url_doc, url_candidate)
-                normdist = dist / float(max(len(url_doc), len(url_candidate)))
-            candidate += ":" + str(normdist)
-            sys.stdout.write("\t" + candidate)
-        sys.stdout.write("\n")
+# read_ridx only keeps the lines where the document has at least one candidate
+for fields in lines:
+    sys.stdout.write(str(fields[0]))
+    url_doc = documents[int(fields[0])]
+    for j in range(1, len(fields)):
+        candidate = fields[j]
+        candidateid = int(fields[j].split(":")[0])
+        url_candidate = documents[candidateid]
+        if len(url_candidate) == 0 or len(url_doc) == 0:
+            normdist = 0.0
+        else:
+            dist = Levenshtein.distance(url_doc, url_candidate)
+            normdist = dist / float(max(len(url_doc), len(url_candidate)))
+        candidate += ":" + str(normdist)
+        sys.stdout.write("\t" + candidate)
+    sys.stdout.write("\n")
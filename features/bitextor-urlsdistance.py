@@ -10,16 +10,21 @@ import base64
 pathname = os.path.dirname(sys.argv[0])
 sys.path.append(pathname + "/../utils")
 from common import open_xz_or_gzip_or_plain
+from docfeatures import read_ridx
 
 
 # print("pathname", pathname)
 
-def extract_urls(html_file, url_file, docs):
+def extract_urls(html_file, url_file, docs, wanted):
     with open_xz_or_gzip_or_plain(html_file) as hd:
         with open_xz_or_gzip_or_plain(url_file) as ud:
             fileid = 1
             for url in ud:
-                html_content = base64.b64decode(next(hd, None)).decode("utf-8")
+                html_base64enc = next(hd, None)
+                if fileid not in wanted:
+                    fileid += 1
+                    continue
+                html_content = base64.b64decode(html_base64enc).decode("utf-8")
 
                 links = re.findall('''href\s*=\s*['"]\s*([^'"]+)['"]''', html_content, re.S)
                 rx = re.match('(https?://[^/:]+)', url)
@@ -50,25 +55,24 @@ if options.ridx is None:
 else:
     reader = open(options.ridx, "r")
 
-index = {}
+# Only the documents in the RIDX file are kept
+lines, referenced = read_ridx(reader)
 documents = {}
-extract_urls(options.html, options.url, documents)
+extract_urls(options.html, options.url, documents, referenced)
 
-for i in reader:
-    fields = i.strip().split("\t")
-    # The document must have at least one candidate
-    if len(fields) > 1:
-        sys.stdout.write(str(fields[0]))
-        urls_doc = documents[int(fields[0])]
-        for j in range(1, len(fields)):
-            candidate = fields[j]
-            candidateid = int(fields[j].split(":")[0])
-            urls_candidate = documents[candidateid]
-            if len(urls_candidate) == 0 or len(urls_doc) == 0:
-                normdist = 0.0
-            else:
-                dist = Levenshtein.distance(urls_doc, urls_candidate)
-                normdist = dist / float(max(len(urls_doc), len(urls_candidate)))
-            candidate += ":" + str(normdist)
-            sys.stdout.write("\t" + candidate)
-        sys.stdout.write("\n")
+# read_ridx only keeps the lines where the document has at least one candidate
+for fields in lines:
+    sys.stdout.write(str(fields[0]))
+    urls_doc = documents[int(fields[0])]
+    for j in range(1, len(fields)):
+        candidate = fields[j]
+        candidateid = int(fields[j].split(":")[0])
+        urls_candidate = documents[candidateid]
+        if len(urls_candidate) == 0 or len(urls_doc) == 0:
+            normdist = 0.0
+        else:
+            dist = Levenshtein.distance(urls_doc, urls_candidate)
+            normdist = dist / float(max(len(urls_doc), len(urls_candidate)))
+        candidate += ":" + str(normdist)
+        sys.stdout.write("\t" + candidate)
+    sys.stdout.write("\n")
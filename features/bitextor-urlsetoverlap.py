@@ -10,12 +10,16 @@ import base64
 pathname = os.path.dirname(sys.argv[0])
 sys.path.append(pathname + "/../utils")
 from common import open_xz_or_gzip_or_plain
+from docfeatures import read_ridx
 
 
-def extract_urls(f, docs):
+def extract_urls(f, docs, wanted):
     with open_xz_or_gzip_or_plain(f) as fd:
         fileid = 1
         for html_base64enc in fd:
+            if fileid not in wanted:
+                fileid += 1
+                continue
             # To compute the edit distance at the level of characters, HTML tags must be encoded as characters and
             # not strings:
             links = re.findall('''href\s*=\s*['"]\s*([^'"]+)['"]''', base64.b64decode(html_base64enc.strip()).decode("utf-8"), re.S)
@@ -39,25 +43,24 @@ if options.ridx is None:
 else:
     reader = open(options.ridx, "r")
 
-index = {}
+# Only the documents in the RIDX file are kept
+lines, referenced = read_ridx(reader)
 documents = {}
-extract_urls(options.html, documents)
-
-for i in reader:
-    fields = i.strip().split("\t")
-    # The document must have at least one candidate
-    if len(fields) > 1:
-        sys.stdout.write(str(fields[0]))
-        urls_doc = documents[int(fields[0])]
-        for j in range(1, len(fields)):
-            candidate = fields[j]
-            candidateid = int(fields[j].split(":")[0])
-            urls_candidate = documents[candidateid]
-            if len(urls_doc.union(urls_candidate)) > 0:
-                bagofurlsoverlap = len(urls_doc.intersection(urls_candidate)) / float(
-                    len(urls_doc.union(urls_candidate)))
-            else:
-                bagofurlsoverlap = 0
-            candidate += ":" + str(bagofurlsoverlap)
-            sys.stdout.write("\t" + candidate)
-        sys.stdout.write("\n")
+extract_urls(options.html, documents, referenced)
+
+# read_ridx only keeps the lines where the document has at least one candidate
+for fields in lines:
+    sys.stdout.write(str(fields[0]))
+    urls_doc = documents[int(fields[0])]
+    for j in range(1, len(fields)):
+        candidate = fields[j]
+        candidateid = int(fields[j].split(":")[0])
+        urls_candidate = documents[candidateid]
+        if len(urls_doc.union(urls_candidate)) > 0:
+            bagofurlsoverlap = len(urls_doc.intersection(urls_candidate)) / float(
+                len(urls_doc.union(urls_candidate)))
+        else:
+            bagofurlsoverlap = 0
+        candidate += ":" + str(bagofurlsoverlap)
+        sys.stdout.write("\t" + candidate)
+    sys.stdout.write("\n")
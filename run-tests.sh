@@ -87,6 +87,9 @@ fi
 
 mkdir -p ~/reports
 
+# Unit tests of the Python modules and scripts (tests/)
+python3 -m unittest discover -s "$(dirname $0)/tests" 2> ~/reports/unit-tests.report &
+
 snakemake --snakefile "$(dirname $0)/snakemake/Snakefile" --configfile "$(dirname $0)/snakemake/example/tests/default.en-fr.yaml" -j 4 --config bitextor="$(dirname $0)" 2> ~/reports/default.en-fr.report &
 snakemake --snakefile "$(dirname $0)/snakemake/Snakefile" --configfile "$(dirname $0)/snakemake/example/tests/external-mt.en-fr.yaml" -j 4 --config bitextor="$(dirname $0)" 2> ~/reports/external-mt.en-fr.report &
 
@@ -0,0 +1,113 @@
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+BITEXTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(BITEXTOR, "utils"))
+from binidx import BinaryIndexWriter, BinaryIndexReader, is_binary_index
+
+# Words of every language, sorted as in the index, with the document numbers (starting at 0) in which they appear
+ENTRIES = [("en", "cat", [0, 2, 5]), ("en", "dog", [1]), ("en", "zebra", []), ("fr", "chat", [3, 6]),
+           ("fr", "chien", [4]), ("fr", "élève", [3, 4, 6, 100000]), ("ru", "кошка", [7])]
+
+
+class BinaryIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "idx.bin")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, entries=ENTRIES):
+        with BinaryIndexWriter(self.path) as writer:
+            for lang, word, docs in entries:
+                writer.add(lang, word, docs)
+
+    def test_round_trip(self):
+        self.write()
+        self.assertTrue(is_binary_index(self.path))
+        with BinaryIndexReader(self.path) as reader:
+            self.assertEqual(len(reader), len(ENTRIES))
+            self.assertEqual([(lang, word, docs.tolist()) for lang, word, docs in reader], ENTRIES)
+
+    def test_random_access(self):
+        self.write()
+        with BinaryIndexReader(self.path) as reader:
+            self.assertEqual(reader.words("en"), range(0, 3))
+            self.assertEqual(reader.words("fr"), range(3, 6))
+            self.assertEqual(reader.words("de"), range(0))
+            for i in random.Random(0).sample(range(len(ENTRIES)), len(ENTRIES)):
+                self.assertEqual((reader.language(i), reader.word(i), reader.docs(i).tolist()), ENTRIES[i])
+
+    def test_empty_index(self):
+        self.write([])
+        with BinaryIndexReader(self.path) as reader:
+            self.assertEqual(list(reader), [])
+            self.assertEqual(reader.words("en"), range(0))
+
+    def test_bad_magic(self):
+        with open(self.path, "w") as writer:
+            writer.write("en\tcat\t0:2:3\n")
+        self.assertFalse(is_binary_index(self.path))
+        self.assertRaisesRegex(Exception, "is not a binary index", BinaryIndexReader, self.path)
+
+    def test_truncated(self):
+        self.write()
+        with open(self.path, "rb") as reader:
+            data = reader.read()
+        for length in range(8, len(data)):
+            with open(self.path, "wb") as writer:
+                writer.write(data[:length])
+            self.assertRaisesRegex(Exception, "is a truncated binary index", BinaryIndexReader, self.path)
+
+
+class Idx2RidxTest(unittest.TestCase):
+    """bitextor-idx2ridx finds the same candidates in the text and the binary index"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_text_and_binary_index(self):
+        generator = random.Random(1)
+        vocabulary = {"en": ["en{0}".format(i) for i in range(60)] + ["shared{0}".format(i) for i in range(10)],
+                      "fr": ["fr{0}".format(i) for i in range(60)] + ["shared{0}".format(i) for i in range(10)]}
+        postings = {}
+        for doc in range(40):
+            lang = "en" if doc % 2 == 0 else "fr"
+            for word in generator.sample(vocabulary[lang], 12):
+                postings.setdefault((lang, word), []).append(doc)
+
+        text_index = os.path.join(self.directory, "idx")
+        binary_index = os.path.join(self.directory, "idx.bin")
+        with open(text_index, "w") as text_writer, BinaryIndexWriter(binary_index) as binary_writer:
+            for (lang, word), docs in sorted(postings.items()):
+                deltas = [docs[0]] + [docs[k] - docs[k - 1] for k in range(1, len(docs))]
+                text_writer.write("{0}\t{1}\t{2}\n".format(lang, word, ":".join(str(d) for d in deltas)))
+                binary_writer.add(lang, word, docs)
+        dictionary = os.path.join(self.directory, "en-fr.dic")
+        with open(dictionary, "w") as writer:
+            writer.write("en\tfr\n")
+            for i in range(60):
+                writer.write("en{0}\tfr{1}\n".format(i, i if i % 3 else (i + 1) % 60))
+
+        outputs = []
+        for index in [text_index, binary_index]:
+            outputs.append(subprocess.run([sys.executable, os.path.join(BITEXTOR, "bitextor-idx2ridx.py"), "-d",
+                                           dictionary, "--lang1", "en", "--lang2", "fr", index],
+                                          stdout=subprocess.PIPE, check=True).stdout)
+        self.assertEqual(len(outputs[0].split(b"\n")), 21)
+        self.assertIn(b":", outputs[0])
+        self.assertEqual(outputs[0], outputs[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
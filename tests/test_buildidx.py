@@ -0,0 +1,61 @@
+import base64
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+BITEXTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TEXTS = [("en", "The cat sat on the mat.\nThe dog did not."), ("fr", "Le chat est assis.\nLe chien , non !"),
+         ("en", "A cat and a dog."), ("fr", "Un chat et un chien."), ("de", "Die Katze."), ("en", "Mat, cat; dog!")] * 5
+
+
+class BuildIdxTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.tmp_dir = os.path.join(self.directory, "tmp")
+        os.mkdir(self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, lines):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as writer:
+            writer.write("".join(line + "\n" for line in lines))
+        return path
+
+    def run_buildidx(self, texts, *args):
+        tokenised = self.write("tokenised", [base64.b64encode(text.encode("utf-8")).decode("utf-8")
+                                             if text is not None else "not base 64" for _, text in texts])
+        lang = self.write("lang", [lang for lang, _ in texts])
+        return subprocess.run([sys.executable, os.path.join(BITEXTOR, "bitextor-buildidx.py"), "--tokenised",
+                               tokenised, "--lang", lang, "--lang1", "en", "--lang2", "fr", "--tmp-dir", self.tmp_dir]
+                              + list(args), stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=60)
+
+    def test_same_index_for_any_number_of_workers(self):
+        expected = self.run_buildidx(TEXTS).stdout
+        self.assertIn(b"en\tcat\t0:2:3:1:2:3:", expected)
+        for workers, chunk_size in [(2, 1), (3, 4)]:
+            process = self.run_buildidx(TEXTS, "--workers", str(workers), "--chunk-size", str(chunk_size))
+            self.assertEqual(process.stdout, expected)
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def test_partial_indexes_are_removed_if_indexing_fails(self):
+        texts = list(TEXTS)
+        texts[20] = ("en", None)
+        binary_output = os.path.join(self.directory, "idx.bin")
+        for args in [[], ["--workers", "2", "--chunk-size", "1"], ["--workers", "3", "--chunk-size", "2",
+                                                                    "--binary-output", binary_output]]:
+            process = self.run_buildidx(texts, *args)
+            self.assertNotEqual(process.returncode, 0)
+            self.assertIn(b"Error", process.stderr)
+            self.assertEqual(os.listdir(self.tmp_dir), [])
+            self.assertFalse(os.path.exists(binary_output))
+
+
+if __name__ == "__main__":
+    unittest.main()
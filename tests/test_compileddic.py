@@ -0,0 +1,93 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils"))
+from compileddic import CompiledDictionary, compile_dictionary, is_up_to_date, open_dictionary, read_header
+
+# Lines with repeated words and translations, and lines that are not pairs of words
+DIC = "en\tfr\ncat\tchat\ndog\tchien\ncat\tchatte\nhound\tchien\ncat\tchat\nline without tab\nélève\télève\n"
+PAIRS = [("cat", "chat"), ("dog", "chien"), ("cat", "chatte"), ("hound", "chien"), ("cat", "chat"),
+         ("élève", "élève")]
+
+
+class CompiledDictionaryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, "en-fr.dic")
+        self.compiled = self.source + ".bin"
+        self.write_source(DIC)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_source(self, text):
+        with open(self.source, "w") as writer:
+            writer.write(text)
+
+    def test_round_trip(self):
+        compile_dictionary(self.source, self.compiled)
+        with CompiledDictionary(self.compiled) as dictionary:
+            self.assertEqual(dictionary.languages, ["en", "fr"])
+            self.assertEqual(list(dictionary), PAIRS)
+            self.assertEqual(dictionary.vocabulary(0), ["cat", "dog", "hound", "élève"])
+            self.assertEqual(dictionary.vocabulary(1), ["chat", "chien", "chatte", "élève"])
+
+    def test_translate(self):
+        compile_dictionary(self.source, self.compiled)
+        with CompiledDictionary(self.compiled) as dictionary:
+            self.assertEqual((dictionary.column("en"), dictionary.column("fr"), dictionary.column("de")), (0, 1, 1))
+            # Translations with repetitions and in order of appearance, as the text file gives them
+            self.assertEqual(dictionary.translate(0, "cat"), ["chat", "chatte", "chat"])
+            self.assertEqual(dictionary.translate(1, "chien"), ["dog", "hound"])
+            self.assertEqual(dictionary.translate(1, "élève"), ["élève"])
+            self.assertEqual(dictionary.translate(0, "chat"), [])
+
+    def test_empty_dictionary(self):
+        self.write_source("en\tfr\n")
+        compile_dictionary(self.source, self.compiled)
+        with CompiledDictionary(self.compiled) as dictionary:
+            self.assertEqual(list(dictionary), [])
+            self.assertEqual(dictionary.translate(0, "cat"), [])
+
+    def test_rebuilt_when_the_source_changes(self):
+        self.assertFalse(is_up_to_date(self.source, self.compiled))
+        open_dictionary(self.source).close()
+        self.assertTrue(is_up_to_date(self.source, self.compiled))
+
+        # Same contents with another modification time: the checksum is the same
+        os.utime(self.source, ns=(0, 0))
+        self.assertTrue(is_up_to_date(self.source, self.compiled))
+
+        self.write_source(DIC.replace("hound", "puppy"))
+        self.assertFalse(is_up_to_date(self.source, self.compiled))
+        with open_dictionary(self.source) as dictionary:
+            self.assertEqual(dictionary.translate(1, "chien"), ["dog", "puppy"])
+        self.assertTrue(is_up_to_date(self.source, self.compiled))
+
+    def test_bad_magic(self):
+        shutil.copy(self.source, self.compiled)
+        self.assertIsNone(read_header(self.compiled))
+        self.assertRaisesRegex(Exception, "is not a compiled dictionary", CompiledDictionary, self.compiled)
+
+    def test_truncated(self):
+        compile_dictionary(self.source, self.compiled)
+        with open(self.compiled, "rb") as reader:
+            data = reader.read()
+        for length in range(8, len(data)):
+            with open(self.compiled, "wb") as writer:
+                writer.write(data[:length])
+            self.assertIsNone(read_header(self.compiled))
+            self.assertRaisesRegex(Exception, "is a truncated compiled dictionary", CompiledDictionary,
+                                   self.compiled)
+
+        # open_dictionary builds it again
+        with open_dictionary(self.source) as dictionary:
+            self.assertEqual(list(dictionary), PAIRS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils"))
+from docfeatures import read_ridx, chunks, imap_ordered
+
+RIDX = "1\t4:0.5\t7:0.25\n2\n3\t\n5\t4:0.125\n6\t8:0.1\t9:0.1\t1:0.05\n"
+LINES = [["1", "4:0.5", "7:0.25"], ["5", "4:0.125"], ["6", "8:0.1", "9:0.1", "1:0.05"]]
+
+
+def square(number):
+    return number * number
+
+
+class ReadRidxTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check(self, reader):
+        lines, referenced = read_ridx(reader)
+        self.assertEqual(referenced, {1, 4, 5, 6, 7, 8, 9})
+        # Lines can be read again, as they are not kept in memory
+        self.assertEqual(list(lines), LINES)
+        self.assertEqual(list(lines), LINES)
+
+    def test_file(self):
+        path = os.path.join(self.directory, "ridx")
+        with open(path, "w") as writer:
+            writer.write("header\n" + RIDX)
+        with open(path, "r") as reader:
+            # Lines before the position of the reader are not read again
+            reader.readline()
+            self.check(reader)
+
+    def test_pipe(self):
+        read_fd, write_fd = os.pipe()
+
+        def write():
+            os.write(write_fd, RIDX.encode("utf-8"))
+            os.close(write_fd)
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        with os.fdopen(read_fd, "r") as reader:
+            self.assertFalse(reader.seekable())
+            self.check(reader)
+        writer.join()
+
+    def test_chunks(self):
+        self.assertEqual(list(chunks(iter(range(7)), 3)), [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(list(chunks(range(6), 3)), [[0, 1, 2], [3, 4, 5]])
+        self.assertEqual(list(chunks([], 3)), [])
+
+
+class ImapOrderedTest(unittest.TestCase):
+
+    def test_results_in_order(self):
+        read = []
+
+        def items():
+            for number in range(200):
+                read.append(number)
+                yield number
+
+        results = imap_ordered(square, items(), 2)
+        self.assertEqual(next(results), 0)
+        # Items are not all read before their results are needed
+        self.assertLessEqual(len(read), 2 * 4 + 2)
+        self.assertEqual(list(results), [square(number) for number in range(1, 200)])
+        self.assertEqual(list(imap_ordered(square, range(10), 1)), [square(number) for number in range(10)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import base64
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+BITEXTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(BITEXTOR, "document-aligner", "utils"))
+sys.path.append(os.path.join(BITEXTOR, "utils"))
+from extract_lett import read_sentences
+
+
+def encode(text):
+    return base64.b64encode(text.encode("utf-8")).decode("utf-8")
+
+
+class DocumentIdsTest(unittest.TestCase):
+    """Documents with the same URL are told apart by their ids (line numbers) when segments are aligned from the
+    files of bitextor-tokenise"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # The third document has the same URL as the first one
+        self.write("url", ["http://example.com/en", "http://example.com/fr", "http://example.com/en"])
+        self.write("text", [encode("first"), encode("deuxième"), encode("third")])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, lines):
+        with open(os.path.join(self.directory, name), "w") as writer:
+            writer.write("".join(line + "\n" for line in lines))
+        return os.path.join(self.directory, name)
+
+    def run_script(self, script, *args):
+        return subprocess.run([sys.executable, os.path.join(BITEXTOR, script)] + list(args), stdout=subprocess.PIPE,
+                              check=True).stdout.decode("utf-8").split("\n")[:-1]
+
+    def test_align_documents(self):
+        ridx1 = self.write("1.ridx", ["3\t2:0.9", "1\t"])
+        ridx2 = self.write("2.ridx", ["2\t3:0.8"])
+        args = ["--text", os.path.join(self.directory, "text"), "--url", os.path.join(self.directory, "url"), "-n", "1",
+                "-i", "converge", "-r", os.devnull, ridx1, ridx2]
+        self.assertEqual(self.run_script("bitextor-align-documents.py", *args),
+                         ["http://example.com/en\thttp://example.com/fr\t{0}\t{1}".format(encode("third"),
+                                                                                         encode("deuxième"))])
+        self.assertEqual(self.run_script("bitextor-align-documents.py", "--docids", *args),
+                         ["http://example.com/en\thttp://example.com/fr\t{0}\t{1}\t3\t2".format(encode("third"),
+                                                                                               encode("deuxième"))])
+
+    def test_build_docs(self):
+        matches = self.write("matches", ["0.9\thttp://example.com/en\thttp://example.com/fr"])
+        args = ["--matches", matches, "--plaintext", os.path.join(self.directory, "text"), "--url",
+                os.path.join(self.directory, "url")]
+        # The text of the last document with the URL is kept, and its id is written
+        self.assertEqual(self.run_script("document-aligner/build_docs.py", *args),
+                         ["http://example.com/en\thttp://example.com/fr\t{0}\t{1}\t".format(encode("third"),
+                                                                                           encode("deuxième"))])
+        self.assertEqual(self.run_script("document-aligner/build_docs.py", "--docids", *args),
+                         ["http://example.com/en\thttp://example.com/fr\t{0}\t{1}\t3\t2".format(encode("third"),
+                                                                                               encode("deuxième"))])
+
+
+class ReadSentencesTest(unittest.TestCase):
+
+    def test_sentences_keep_their_tokenised_lines(self):
+        sentences = "Fish &amp; chips.\n<P>\nA line&#10;break.\n12.\nLast sentence."
+        tokenised = "Fish &amp; chips .\n<P>\nA line&#10;break .\n12 .\nLast sentence ."
+        self.assertEqual(read_sentences(encode(sentences), encode(tokenised)),
+                         [("Fish & chips.", "Fish & chips ."), ("A line break.", "A line break ."),
+                          ("Last sentence.", "Last sentence .")])
+        self.assertEqual(read_sentences(encode(sentences)),
+                         [("Fish & chips.", None), ("A line break.", None), ("Last sentence.", None)])
+
+    def test_different_numbers_of_lines(self):
+        self.assertRaises(ValueError, read_sentences, encode("One.\nTwo."), encode("One . Two ."))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import base64
+import lzma
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+BITEXTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(BITEXTOR, "utils"))
+from docstore import DocumentStoreWriter, DocumentStoreReader
+
+FIELDS = ["url", "lang", "plain_text"]
+DOCUMENTS = [["http://example.com/{0}".format(i), "en" if i % 2 else "fr",
+              "Línea {0}\n".format(i) * (i % 7) + ("€" if i % 3 else "")] for i in range(1, 101)]
+
+
+class DocumentStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "docs.store")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, documents=DOCUMENTS, block_size=16):
+        with DocumentStoreWriter(self.path, FIELDS, block_size) as writer:
+            for document in documents:
+                writer.add(document)
+
+    def test_round_trip(self):
+        for block_size in [1, 3, 16, 1000]:
+            self.write(block_size=block_size)
+            with DocumentStoreReader(self.path) as reader:
+                self.assertEqual(len(reader), len(DOCUMENTS))
+                self.assertEqual(reader.fields, FIELDS)
+                self.assertEqual([[document[field] for field in FIELDS] for document in reader], DOCUMENTS)
+
+    def test_random_access(self):
+        self.write()
+        docids = list(range(1, len(DOCUMENTS) + 1)) * 2
+        random.Random(0).shuffle(docids)
+        with DocumentStoreReader(self.path) as reader:
+            for docid in docids:
+                self.assertEqual(reader.get(docid), dict(zip(FIELDS, DOCUMENTS[docid - 1])))
+                self.assertEqual(reader.get_field(docid, "plain_text"), DOCUMENTS[docid - 1][2])
+            for docid in [0, -1, len(DOCUMENTS) + 1]:
+                self.assertRaises(KeyError, reader.get, docid)
+
+    def test_documents_as_dicts(self):
+        self.write([{"url": "http://example.com/", "plain_text": "text"}])
+        with DocumentStoreReader(self.path) as reader:
+            self.assertEqual(reader.get(1), {"url": "http://example.com/", "lang": "", "plain_text": "text"})
+
+    def test_empty_store(self):
+        self.write([])
+        with DocumentStoreReader(self.path) as reader:
+            self.assertEqual(len(reader), 0)
+            self.assertEqual(list(reader), [])
+
+    def test_bad_magic(self):
+        with open(self.path, "wb") as writer:
+            writer.write(b"NOTASTORE" + b"\0" * 100)
+        self.assertRaisesRegex(Exception, "is not a document store", DocumentStoreReader, self.path)
+
+    def test_truncated(self):
+        self.write()
+        with open(self.path, "rb") as reader:
+            data = reader.read()
+        for length in range(8, len(data)):
+            with open(self.path, "wb") as writer:
+                writer.write(data[:length])
+            self.assertRaisesRegex(Exception, "is a truncated document store", DocumentStoreReader, self.path)
+
+
+class PackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = os.path.join(self.directory, "docs.store")
+        self.write_field("url", [document[0] for document in DOCUMENTS])
+        self.write_field("lang", [document[1] for document in DOCUMENTS])
+        self.write_field("plain_text", [base64.b64encode(document[2].encode("utf-8")).decode("utf-8")
+                                        for document in DOCUMENTS])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_field(self, field, lines, directory=None):
+        with lzma.open(os.path.join(directory or self.directory, field + ".xz"), "wt") as writer:
+            for line in lines:
+                writer.write(line + "\n")
+
+    def docstore(self, *args):
+        return subprocess.run([sys.executable, os.path.join(BITEXTOR, "bitextor-docstore.py")] + list(args),
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def test_pack_and_unpack(self):
+        self.assertEqual(self.docstore("pack", "--dir", self.directory, "--store", self.store).returncode, 0)
+        with DocumentStoreReader(self.store) as reader:
+            self.assertEqual([[document[field] for field in FIELDS] for document in reader], DOCUMENTS)
+
+        output_dir = os.path.join(self.directory, "unpacked")
+        os.mkdir(output_dir)
+        self.assertEqual(self.docstore("unpack", "--dir", output_dir, "--store", self.store).returncode, 0)
+        for field in FIELDS:
+            with lzma.open(os.path.join(self.directory, field + ".xz")) as original:
+                with lzma.open(os.path.join(output_dir, field + ".xz")) as unpacked:
+                    self.assertEqual(unpacked.read(), original.read())
+
+    def test_different_numbers_of_documents(self):
+        self.write_field("lang", [document[1] for document in DOCUMENTS[:-1]])
+        process = self.docstore("pack", "--dir", self.directory, "--store", self.store)
+        self.assertEqual(process.returncode, 1)
+        self.assertIn(b"different numbers of documents", process.stderr)
+        self.assertFalse(os.path.exists(self.store))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from external_processor import text_processor, ExternalTextProcessor, MorphologicalAnalyser, WORDS, SENTENCES
+
+# Tools that write a line for every line read and flush it, as Moses tokeniser with -b
+TOKENISER = r"""
+import re, sys
+for line in sys.stdin:
+    # Escapes and splits everything, as Moses tokeniser with -a and without -x
+    line = line.rstrip("\n").replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    line = re.sub(r"(\w)-(\w)", r"\1 @-@ \2", line)
+    sys.stdout.write(" ".join(re.findall(r"&\w+;|@-@|\w+|[^\w\s]", line)) + "\n")
+    sys.stdout.flush()
+"""
+SPLITTER = r"""
+import sys
+for line in sys.stdin:
+    if line.startswith("<"):
+        sys.stdout.write(line)
+    else:
+        for sentence in line.rstrip("\n").split(". "):
+            sys.stdout.write(sentence.strip() + "\n")
+    sys.stdout.flush()
+"""
+# Drops the lines that look like tags
+DROPPING_SPLITTER = SPLITTER.replace('sys.stdout.write(line)', 'pass')
+# Only writes its output at the end
+BUFFERING_TOKENISER = "import sys\nsys.stdout.write(sys.stdin.read().upper())\n"
+
+# Analyses documents delimited by null characters, as the Apertium tools with -z, and writes an error for the ones
+# with unknown words
+ANALYSER = r"""
+import sys, time
+buffered = b""
+while True:
+    chunk = sys.stdin.buffer.read1(65536)
+    if not chunk:
+        break
+    buffered += chunk
+    while b"\0" in buffered:
+        document, buffered = buffered.split(b"\0", 1)
+        if b"unknown" in document:
+            sys.stderr.write("Error: unknown word\n")
+            sys.stderr.flush()
+            time.sleep(0.1)
+        sys.stdout.buffer.write(b" ".join(b"^" + word + b"$" for word in document.split()) + b"\0")
+        sys.stdout.flush()
+"""
+
+DOCUMENTS = ["First sentence. Second sentence, with a well-known word.\n\nA <b>tag</b> & more.\n",
+             "Another document. Just two sentences.\n", "\n", "Last one.\n"]
+
+
+class ExternalTextProcessorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def tool(self, name, script):
+        path = os.path.join(self.directory, name + ".py")
+        with open(path, "w") as writer:
+            writer.write(script)
+        return sys.executable + " " + path
+
+    def check(self, spec, separator, timeout=30, warning=None):
+        """Checks that the persistent processor gives, for every document, the output of a process per document"""
+        persistent = text_processor(spec, separator)
+        persistent.timeout = timeout
+        single = text_processor(spec, separator, persistent=False)
+        errors = io.StringIO()
+        with contextlib.redirect_stderr(errors):
+            for document in DOCUMENTS:
+                self.assertEqual(persistent.process(document), single.process(document))
+        persistent.close()
+        if warning is None:
+            self.assertEqual(errors.getvalue(), "")
+            self.assertTrue(persistent.persistent)
+        else:
+            self.assertIn(warning, errors.getvalue())
+            self.assertFalse(persistent.persistent)
+
+    def test_word_tokenisers_are_framed_by_lines(self):
+        tokeniser = self.tool("tokeniser", TOKENISER)
+        self.assertEqual(text_processor(tokeniser, WORDS).framing, "lines")
+        self.check(tokeniser, WORDS)
+
+    def test_sentence_splitters_are_framed_by_a_sentinel(self):
+        splitter = self.tool("splitter", SPLITTER)
+        self.assertEqual(text_processor(splitter, SENTENCES).framing, "sentinel")
+        self.check(splitter, SENTENCES)
+
+    def test_escaped_and_tokenised_sentinel(self):
+        tokeniser = self.tool("tokeniser", TOKENISER)
+        processor = ExternalTextProcessor(tokeniser.split(" "), persistent=True, framing="sentinel", timeout=5)
+        self.assertEqual(processor.process("A well-known <word>.\n"), "A well @-@ known &lt; word &gt; .\n")
+        self.assertTrue(processor.persistent)
+        processor.close()
+
+    def test_sentinel_not_copied(self):
+        self.check(self.tool("splitter", DROPPING_SPLITTER), SENTENCES, timeout=1,
+                   warning="no output for 1 s: it buffers its output or does not copy the line <bitextor-eod>")
+
+    def test_buffered_output(self):
+        self.check(self.tool("tokeniser", BUFFERING_TOKENISER), WORDS, timeout=1,
+                   warning="no output for 1 s: it buffers its output or does not write a line for every line read")
+
+
+class MorphologicalAnalyserTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_documents_with_errors_are_not_analysed(self):
+        script = os.path.join(self.directory, "analyser.sh")
+        with open(os.path.join(self.directory, "analyser.py"), "w") as writer:
+            writer.write(ANALYSER)
+        with open(script, "w") as writer:
+            writer.write('exec "{0}" "{1}"\n'.format(sys.executable, os.path.join(self.directory, "analyser.py")))
+        analyser = MorphologicalAnalyser(script, timeout=5)
+        self.assertEqual(analyser.analyse("first document"), "^first$ ^document$")
+        self.assertIsNone(analyser.analyse("an unknown word"))
+        self.assertEqual(analyser.analyse("last document"), "^last$ ^document$")
+        self.assertTrue(analyser.processor.persistent)
+        analyser.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import base64
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+BITEXTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(BITEXTOR, "utils"))
+from docfeatures import TagEncoder, extract_document, score_pair
+from featurestore import FeatureStoreReader, FeatureStoreWriter
+
+# Lines of the URL file (the last one without a new line, so documents linking to it count as mutually linked) and
+# their HTML: repeated links and images, links to other documents, non-ASCII text and a document without structure
+DOCUMENTS = [
+    ("http://example.com/en/index.html\n",
+     '<html><body><p>Hello</p><a href="http://example.com/fr/index.html">fr</a><a href="/en/about.html">about</a>'
+     '<img src="logo.png"><img src="logo.png"><a href="/en/about.html">about</a></body></html>'),
+    ("http://example.com/fr/index.html\n",
+     '<html><body><p>Bonjour, élève</p><a href="http://example.com/en/index.html">en</a>'
+     '<a href="/fr/about.html">à propos</a><img src="logo.png"><img src="drapeau.png"></body></html>'),
+    ("https://other.example.org/page?id=3\n", "<html><body><div><p>Other</p></div></body></html>"),
+    ("not a url\n", ""),
+    ("http://example.com/en/about.html",
+     '<html><body><table><tr><td>About</td></tr></table><a href="http://example.com/en/about.html">self</a>'
+     '<img src="logo.png"></body></html>'),
+]
+
+
+class FeatureStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "features.bin")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, documents=DOCUMENTS):
+        with FeatureStoreWriter(self.path) as writer:
+            for url, html_content in documents:
+                writer.add(url, html_content)
+
+    def test_same_features_as_the_html(self):
+        self.write()
+        encoder = TagEncoder()
+        extracted = [extract_document(url, html_content, encoder) for url, html_content in DOCUMENTS]
+        with FeatureStoreReader(self.path) as store:
+            self.assertEqual(len(store), len(DOCUMENTS))
+            stored = list(store)
+            self.assertEqual([doc.structure for doc in stored], [doc.structure for doc in extracted])
+            self.assertIsNone(stored[3].structure)
+            # URLs with a new line are not found among the links, as in bitextor-mutuallylinked
+            self.assertEqual(stored[1].self_link, -1)
+            self.assertEqual(store.link(stored[4].self_link), "http://example.com/en/about.html")
+            mutually_linked = 0
+            for i, doc in enumerate(extracted):
+                for j, candidate_doc in enumerate(extracted):
+                    if doc.structure is None or candidate_doc.structure is None:
+                        continue
+                    features = score_pair(doc, candidate_doc)
+                    self.assertEqual(score_pair(stored[i], stored[j]), features)
+                    mutually_linked += features[3] == "1"
+            self.assertEqual(mutually_linked, 1)
+
+    def test_get(self):
+        self.write()
+        with FeatureStoreReader(self.path) as store:
+            doc = store.get(2)
+            self.assertEqual(doc.url_path, "/fr/index.html")
+            self.assertEqual({store.image(image_id) for image_id in doc.images}, {"logo.png", "drapeau.png"})
+            self.assertEqual(doc.link_string, "/en/index.html/fr/about.html")
+            for docid in [0, len(DOCUMENTS) + 1]:
+                self.assertRaises(KeyError, store.get, docid)
+
+    def test_empty_sidecar(self):
+        self.write([])
+        with FeatureStoreReader(self.path) as store:
+            self.assertEqual(list(store), [])
+
+    def test_bad_magic(self):
+        with open(self.path, "w") as writer:
+            writer.write("".join(url for url, _ in DOCUMENTS))
+        self.assertRaisesRegex(Exception, "is not a feature sidecar", FeatureStoreReader, self.path)
+
+    def test_truncated(self):
+        self.write()
+        with open(self.path, "rb") as reader:
+            data = reader.read()
+        for length in range(8, len(data)):
+            with open(self.path, "wb") as writer:
+                writer.write(data[:length])
+            self.assertRaisesRegex(Exception, "is a truncated feature sidecar", FeatureStoreReader, self.path)
+
+
+class FeaturesScriptTest(unittest.TestCase):
+    """bitextor-features gives the same output with the sidecar of bitextor-docfeatures and with the HTML"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as writer:
+            writer.write(text)
+        return path
+
+    def run_script(self, script, *args, stdin=None):
+        return subprocess.run([sys.executable, os.path.join(BITEXTOR, script)] + list(args), input=stdin,
+                              stdout=subprocess.PIPE, check=True).stdout.decode("utf-8")
+
+    def test_sidecar_and_html(self):
+        url = self.write("url", "".join(url for url, _ in DOCUMENTS))
+        html = self.write("html", "".join(base64.b64encode(html_content.encode("utf-8")).decode("utf-8") + "\n"
+                                          for _, html_content in DOCUMENTS))
+        ridx_lines = "1\t2:0.5\t5:0.25\t3:0.1\n2\t1:0.5\n3\n5\t1:0.3\t2:0.2\n"
+        ridx = self.write("ridx", ridx_lines)
+        sidecar = os.path.join(self.directory, "features.bin")
+        self.run_script("bitextor-docfeatures.py", "--html", html, "--url", url, "-o", sidecar)
+
+        expected = self.run_script("features/bitextor-features.py", "--html", html, "--url", url, ridx)
+        self.assertEqual(len(expected.split("\n")), 4)
+        self.assertEqual(self.run_script("features/bitextor-features.py", "--sidecar", sidecar, ridx), expected)
+        self.assertEqual(self.run_script("features/bitextor-features.py", "--sidecar", sidecar, "--workers", "2",
+                                         "--chunk-size", "1", ridx), expected)
+        # The RIDX read from a pipe
+        self.assertEqual(self.run_script("features/bitextor-features.py", "--sidecar", sidecar, "--workers", "2",
+                                         stdin=ridx_lines.encode("utf-8")), expected)
+
+        # The structure distance is the one of bitextor-structuredistance
+        structure = self.run_script("features/bitextor-structuredistance.py", "--html", html, ridx)
+        self.assertEqual([[candidate.split(":")[:3] for candidate in line.split("\t")[1:]]
+                          for line in structure.split("\n")],
+                         [[candidate.split(":")[:2] + [candidate.split(":")[3]] for candidate in line.split("\t")[1:]]
+                          for line in expected.split("\n")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils"))
+from hashstore import PersistentHashStore
+
+
+def digest(i):
+    return hashlib.md5(str(i).encode("utf-8")).digest()
+
+
+class PersistentHashStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "hashes")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_no_false_negatives(self):
+        # A small filter, so it is almost full, still finds every hash added
+        store = PersistentHashStore(self.path, memory=1024)
+        for i in range(5000):
+            store.add(digest(i))
+        self.assertTrue(all(digest(i) in store for i in range(5000)))
+        store.close()
+        self.assertEqual(os.path.getsize(self.path), 5000 * 16)
+
+    def test_few_false_positives_of_the_filter(self):
+        # Sized, as by default, for a million hashes (six hash functions)
+        store = PersistentHashStore(self.path, memory=1024 * 1024)
+        for i in range(10000):
+            store.add(digest(i))
+        self.assertFalse(any(digest(i) in store for i in range(10000, 20000)))
+        self.assertLess(store.false_positives, 10)
+        store.close()
+
+    def test_no_false_positives(self):
+        # A full filter finds everything, so membership is decided by the digests stored (in several buckets of the
+        # lookup table) and the ones added in this run
+        store = PersistentHashStore(self.path, memory=16)
+        for i in range(10000):
+            store.add(digest(i))
+        store.close()
+        reopened = PersistentHashStore(self.path, memory=16)
+        self.assertGreater(reopened.num_buckets, 1)
+        for i in range(10000, 10100):
+            reopened.add(digest(i))
+        self.assertTrue(all(digest(i) in reopened for i in range(10100)))
+        self.assertFalse(any(digest(i) in reopened for i in range(10100, 12000)))
+        self.assertEqual(reopened.false_positives, 1900)
+        reopened.close()
+
+    def test_hashes_are_kept_across_runs(self):
+        store = PersistentHashStore(self.path, memory=64 * 1024)
+        for i in range(1000):
+            store.add(digest(i))
+        # Opened before the hashes below are added, so it only sees the ones already stored
+        other = PersistentHashStore(self.path, memory=64 * 1024)
+        store.add(digest("new"))
+        store.close()
+        self.assertTrue(all(digest(i) in other for i in range(1000)))
+        self.assertNotIn(digest("new"), other)
+        other.close()
+
+        reopened = PersistentHashStore(self.path, memory=64 * 1024)
+        self.assertTrue(all(digest(i) in reopened for i in range(1000)))
+        self.assertIn(digest("new"), reopened)
+        reopened.close()
+
+    def test_partial_digest_at_the_end_is_ignored(self):
+        store = PersistentHashStore(self.path, memory=64 * 1024)
+        for i in range(100):
+            store.add(digest(i))
+        store.close()
+        with open(self.path, "ab") as writer:
+            writer.write(digest("interrupted")[:7])
+
+        reopened = PersistentHashStore(self.path, memory=64 * 1024)
+        self.assertTrue(all(digest(i) in reopened for i in range(100)))
+        self.assertNotIn(digest("interrupted"), reopened)
+        # Digests appended after reopening are stored at the right offsets
+        reopened.add(digest("after"))
+        reopened.close()
+        self.assertEqual(os.path.getsize(self.path), 101 * 16)
+
+        reopened = PersistentHashStore(self.path, memory=64 * 1024)
+        self.assertTrue(all(digest(i) in reopened for i in range(100)))
+        self.assertIn(digest("after"), reopened)
+        reopened.close()
+
+    def test_other_digest_sizes(self):
+        store = PersistentHashStore(self.path, memory=64 * 1024, digest_size=32)
+        hashes = [hashlib.sha256(str(i).encode("utf-8")).digest() for i in range(1000)]
+        for h in hashes:
+            store.add(h)
+        store.close()
+        reopened = PersistentHashStore(self.path, memory=64 * 1024, digest_size=32)
+        self.assertTrue(all(h in reopened for h in hashes))
+        reopened.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
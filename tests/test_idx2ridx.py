@@ -0,0 +1,88 @@
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+BITEXTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(BITEXTOR, "utils"))
+from binidx import BinaryIndexWriter
+
+
+class Idx2RidxTest(unittest.TestCase):
+    """The sparse engine finds the same candidates as the loop in both directions, for any number of workers and
+    batch size, with the text and the binary index"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        generator = random.Random(2)
+        vocabulary = {"en": ["en{0}".format(i) for i in range(80)] + ["shared{0}".format(i) for i in range(10)],
+                      "fr": ["fr{0}".format(i) for i in range(80)] + ["shared{0}".format(i) for i in range(10)]}
+        postings = {}
+        for doc in range(60):
+            lang = "en" if doc % 3 else "fr"
+            for word in generator.sample(vocabulary[lang], generator.randint(1, 20)):
+                postings.setdefault((lang, word), []).append(doc)
+        self.index = os.path.join(self.directory, "idx")
+        self.binary_index = os.path.join(self.directory, "idx.bin")
+        with open(self.index, "w") as writer, BinaryIndexWriter(self.binary_index) as binary_writer:
+            for (lang, word), docs in sorted(postings.items()):
+                deltas = [docs[0]] + [docs[k] - docs[k - 1] for k in range(1, len(docs))]
+                writer.write("{0}\t{1}\t{2}\n".format(lang, word, ":".join(str(d) for d in deltas)))
+                binary_writer.add(lang, word, docs)
+            # A word of another language, not in any document of the languages of the index
+            binary_writer.add("de", "katze", [60])
+
+        # Words with several translations, repeated translations and words without translations
+        self.dictionary = os.path.join(self.directory, "en-fr.dic")
+        with open(self.dictionary, "w") as writer:
+            writer.write("en\tfr\n")
+            for i in range(70):
+                writer.write("en{0}\tfr{1}\n".format(i, i))
+                if i % 4 == 0:
+                    writer.write("en{0}\tfr{1}\n".format(i, (i * 7) % 80))
+                if i % 10 == 0:
+                    writer.write("en{0}\tfr{0}\n".format(i))
+
+        self.lett = os.path.join(self.directory, "lett")
+        with open(self.lett, "w") as writer:
+            for doc in range(60):
+                writer.write("en\ttext/html\tutf-8\thttp://host{0}.example.com/{1}\thtml\ttext\n".format(doc % 4, doc))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_idx2ridx(self, *args, index=None):
+        output1 = os.path.join(self.directory, "1.ridx")
+        output2 = os.path.join(self.directory, "2.ridx")
+        subprocess.run([sys.executable, os.path.join(BITEXTOR, "bitextor-idx2ridx.py"), "-d", self.dictionary,
+                        "--lang1", "en", "--lang2", "fr", "--output1", output1, "--output2", output2, index or self.index]
+                       + list(args), check=True)
+        outputs = []
+        for output in [output1, output2]:
+            with open(output) as reader:
+                outputs.append(reader.read())
+        return outputs
+
+    def test_sparse_engine_and_loop(self):
+        for hosts in [[], ["-l", self.lett]]:
+            expected = self.run_idx2ridx("--engine", "loop", *hosts)
+            self.assertEqual([len(output.split("\n")) for output in expected], [41, 21])
+            self.assertIn(":", expected[1])
+            for options in [[], ["--workers", "3", "--batch-size", "7"], ["--batch-size", "1"]]:
+                self.assertEqual(self.run_idx2ridx(*(hosts + options)), expected)
+                self.assertEqual(self.run_idx2ridx(*(hosts + options), index=self.binary_index), expected)
+            self.assertEqual(self.run_idx2ridx("--engine", "loop", *hosts, index=self.binary_index), expected)
+
+    def test_frequent_words(self):
+        # Frequent words are only left out when looking for candidates
+        expected = self.run_idx2ridx()
+        self.assertEqual(self.run_idx2ridx("--max-df", "0.05", "--workers", "2", "--batch-size", "5"),
+                         self.run_idx2ridx("--max-df", "0.05"))
+        self.assertNotEqual(self.run_idx2ridx("--max-df", "0.05"), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
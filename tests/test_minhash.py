@@ -0,0 +1,70 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils"))
+from minhash import MinHasher, MinHashLSH, jaccard, choose_bands
+
+TEXT = "parallel corpora are collections of texts in one language and their translations into another language " \
+       "which are used to train machine translation systems and to build bilingual dictionaries"
+
+
+class MinHasherTest(unittest.TestCase):
+
+    def test_same_fingerprint_in_every_instance(self):
+        fingerprint = MinHasher().fingerprint(TEXT)
+        self.assertEqual(fingerprint.dtype, np.uint32)
+        self.assertEqual(len(fingerprint), 128)
+        self.assertTrue(np.array_equal(fingerprint, MinHasher().fingerprint(TEXT)))
+
+    def test_similarity(self):
+        minhasher = MinHasher()
+        fingerprint = minhasher.fingerprint(TEXT)
+        self.assertEqual(jaccard(fingerprint, minhasher.fingerprint(" ".join(TEXT.split()))), 1.0)
+        self.assertGreater(jaccard(fingerprint, minhasher.fingerprint(TEXT + " every day")), 0.7)
+        self.assertLess(jaccard(fingerprint, minhasher.fingerprint("a completely different text about something")),
+                        0.2)
+
+
+class MinHashLSHTest(unittest.TestCase):
+
+    def test_exact_duplicates_are_always_found(self):
+        minhasher = MinHasher()
+        for threshold in [0.5, 0.7, 0.8, 0.9, 1.0]:
+            lsh = MinHashLSH(threshold, minhasher.num_perm)
+            lsh.insert("first", minhasher.fingerprint(TEXT))
+            lsh.insert("second", minhasher.fingerprint(TEXT))
+            self.assertEqual(lsh.query(minhasher.fingerprint(TEXT)), "first")
+            self.assertIsNone(lsh.query(minhasher.fingerprint("a completely different text about something")))
+
+    def test_no_false_negatives_when_bands_outnumber_differences(self):
+        # When fewer positions differ than there are bands, at least one band is identical, so every fingerprint whose
+        # estimated similarity reaches the threshold is found (with 128 permutations, for thresholds of 0.8 or more)
+        generator = np.random.RandomState(0)
+        for threshold in [0.8, 0.9, 0.95]:
+            bands, rows = choose_bands(threshold, 128)
+            max_differences = int(round((1 - threshold) * 128, 6))
+            self.assertLess(max_differences, bands)
+            for _ in range(200):
+                lsh = MinHashLSH(threshold)
+                fingerprint = generator.randint(0, 1 << 32, size=128, dtype=np.uint64).astype(np.uint32)
+                lsh.insert("original", fingerprint)
+                near_duplicate = fingerprint.copy()
+                changed = generator.choice(128, size=generator.randint(0, max_differences + 1), replace=False)
+                near_duplicate[changed] += 1
+                self.assertGreaterEqual(jaccard(fingerprint, near_duplicate), threshold)
+                self.assertEqual(lsh.query(near_duplicate), "original")
+
+    def test_below_threshold_is_not_returned(self):
+        fingerprint = np.arange(128, dtype=np.uint32)
+        lsh = MinHashLSH(0.9)
+        lsh.insert("original", fingerprint)
+        different = fingerprint.copy()
+        different[:20] += 1000
+        self.assertIsNone(lsh.query(different))
+
+
+if __name__ == "__main__":
+    unittest.main()
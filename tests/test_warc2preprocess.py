@@ -0,0 +1,150 @@
+import base64
+import importlib.util
+import json
+import lzma
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+BITEXTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REQUIRED_MODULES = ["warc", "cchardet", "magic", "ftfy", "pycld2", "lxml", "bs4", "boilerpipe", "alcazar"]
+DEPENDENCIES = all(importlib.util.find_spec(module) is not None for module in REQUIRED_MODULES)
+
+PAGES = [
+    ("http://example.com/en/1", "<p>The quick brown fox jumps over the lazy dog near the river bank.</p>"),
+    ("http://example.com/en/2", "<p>Parallel corpora are collections of texts and their translations.</p>"),
+    # Exact duplicate of the first page under another URL
+    ("http://example.com/en/1?session=2", "<p>The quick brown fox jumps over the lazy dog near the river bank.</p>"),
+    ("http://example.com/fr/1", "<p>Le renard brun rapide saute par-dessus le chien paresseux.</p>"),
+    # Page without text, and a duplicate of it (only documents that are kept count as first occurrences)
+    ("http://example.com/empty/1", ""),
+    ("http://example.com/empty/2", ""),
+    ("http://example.com/fr/2", "<p>Les corpus parallèles sont des collections de textes et de leurs traductions.</p>"),
+    # Duplicates of the second and the fourth pages
+    ("http://example.com/en/2/copy", "<p>Parallel corpora are collections of texts and their translations.</p>"),
+    ("http://example.com/fr/1/copy", "<p>Le renard brun rapide saute par-dessus le chien paresseux.</p>"),
+    ("http://example.com/en/1/copy", "<p>The quick brown fox jumps over the lazy dog near the river bank.</p>"),
+]
+
+
+def warc_record(number, url, payload):
+    header = ("WARC/1.0\r\nWARC-Type: resource\r\nWARC-Target-URI: {0}\r\nWARC-Date: 2019-01-01T00:00:00Z\r\n"
+              "WARC-Record-ID: <urn:uuid:{1:032d}>\r\nContent-Type: text/html\r\n"
+              "Content-Length: {2}\r\n\r\n").format(url, number, len(payload)).encode("utf-8")
+    return header + payload + b"\r\n\r\n"
+
+
+def html_page(body, head=""):
+    return "<html><head>{0}</head><body>{1}</body></html>".format(head, body)
+
+
+def run_preprocess(warc, workers=1, options=()):
+    """Returns the decompressed output files, the lines of the standard error and the statistics of a run"""
+    output_dir = tempfile.mkdtemp()
+    stats = os.path.join(output_dir, "stats.json")
+    process = subprocess.run([sys.executable, os.path.join(BITEXTOR, "bitextor-warc2preprocess.py"), "--verbose",
+                              "--output-dir", output_dir, "--workers", str(workers), "--stats", stats] + list(options),
+                             input=warc, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    outputs = {}
+    for output in ["url", "lang", "encoding", "mime", "normalized_html", "plain_text"]:
+        with lzma.open(os.path.join(output_dir, output + ".xz")) as reader:
+            outputs[output] = reader.read().decode("utf-8").split("\n")[:-1]
+    with open(stats) as reader:
+        statistics = json.load(reader)
+    shutil.rmtree(output_dir)
+    return outputs, process.stderr.decode("utf-8").split("\n"), statistics
+
+
+@unittest.skipUnless(DEPENDENCIES, "dependencies of bitextor-warc2preprocess are not installed")
+class DuplicatesTest(unittest.TestCase):
+
+    def run_preprocess(self, workers):
+        warc = b"".join(warc_record(number, url, html_page(body).encode("utf-8"))
+                        for number, (url, body) in enumerate(PAGES))
+        outputs, log, statistics = run_preprocess(warc, workers)
+        return outputs, [line for line in log if "Repeated file" in line], statistics["records"]["discarded"]
+
+    def test_same_duplicates_for_any_number_of_workers(self):
+        outputs, repeated, discarded = self.run_preprocess(1)
+        self.assertEqual(outputs["url"], ["http://example.com/en/1", "http://example.com/en/2",
+                                          "http://example.com/fr/1", "http://example.com/fr/2"])
+        self.assertEqual(discarded.get("duplicate"), 4)
+        self.assertIn("http://example.com/fr/1/copy\tfirst occurrence\thttp://example.com/fr/1", repeated[2])
+        for workers in [2, 4]:
+            self.assertEqual(self.run_preprocess(workers), (outputs, repeated, discarded))
+
+
+@unittest.skipUnless(DEPENDENCIES, "dependencies of bitextor-warc2preprocess are not installed")
+class EncodingTest(unittest.TestCase):
+
+    TEXTS = [
+        ("utf-8", "Les corpus parallèles sont des collections de textes et de leurs traductions."),
+        ("ascii", "Parallel corpora are collections of texts and their translations."),
+        ("iso-8859-1", "Les corpus parallèles sont des collections de textes traduits à la main."),
+        ("windows-1252", "Les corpus parallèles réunissent des œuvres et leurs traductions pour 5 €."),
+        ("windows-1251", "Параллельные корпуса — это собрания текстов и их переводов на другие языки."),
+        ("koi8-r", "Параллельные корпуса состоят из текстов и их переводов, выровненных по предложениям."),
+        ("shift_jis", "対訳コーパスは、文章とその翻訳を集めたものです。機械翻訳の学習に使われます。"),
+        ("euc_kr", "병렬 말뭉치는 텍스트와 그 번역을 모은 것입니다. 기계 번역 학습에 사용됩니다."),
+    ]
+
+    def test_encodings_are_named_as_cchardet_names_them(self):
+        import cchardet
+        records = []
+        expected = []
+        texts = []
+        for encoding, text in self.TEXTS:
+            # With the charset declared in a meta tag (found without cchardet) and without it; texts are numbered, so
+            # they are not duplicates
+            for head in ['<meta charset="{0}">'.format(encoding), ""]:
+                numbered = "{0} {1}".format(text, len(records))
+                payload = html_page("<p>" + numbered + "</p>", head).encode(encoding)
+                records.append(warc_record(len(records), "http://example.com/{0}".format(len(records)), payload))
+                # Except for valid UTF-8, which cchardet misdetects in short texts
+                expected.append("UTF-8" if encoding == "utf-8" else cchardet.detect(payload)["encoding"])
+                texts.append(numbered)
+        outputs, _, _ = run_preprocess(b"".join(records))
+        self.assertEqual(outputs["encoding"], expected)
+        self.assertIn("ASCII", expected)
+        self.assertIn("WINDOWS-1252", expected)
+        self.assertEqual([base64.b64decode(line).decode("utf-8").strip() for line in outputs["plain_text"]], texts)
+
+
+@unittest.skipUnless(DEPENDENCIES, "dependencies of bitextor-warc2preprocess are not installed")
+class SingleParseTest(unittest.TestCase):
+    """--single-parse writes the same normalized HTML and text as the default path"""
+
+    PAGES = [
+        ("<h1>Title &amp; more</h1><p>First&nbsp;paragraph,\twith a tab and <b>bold</b> <i>text</i>.</p>"
+         "<script>var x = '<p>not text</p>';</script><style>p { color: red; }</style><!-- a comment -->"
+         "<p>Second paragraph<br>after a line break <img src='a.png' alt='image'>and an image.</p>",
+         '<meta charset="utf-8"><title>Page title</title><script src="x.js"></script>'),
+        ("<ul><li>One item</li><li>Another <a href='/link' onclick='f()'>link</a> item</li></ul>"
+         "<table><tr><td>Cell one</td><td>Cell two</td></tr></table>"
+         "<form action='/'><input name='q'><button>Search the whole website</button></form>"
+         "<iframe src='http://example.com/'></iframe><pre>  preformatted\n   text  </pre>", ""),
+        # Mojibake fixed by ftfy, text outside of elements and CR LF line ends
+        ("Text without a paragraph \u00c3\u00a9l\u00c3\u00a8ve.\r\n<div>Les corpus parall\u00e8les r\u00e9unissent"
+         "\r\n  des textes   et leurs traductions.</div><noscript>Enable JavaScript</noscript>", ""),
+        ("<div><p>Nested <span>elements <em>with <strong>several</strong> levels</em></span> of tags.</p>"
+         "<p>Quotes \u201clike these\u201d and entities &lt;tag&gt; &#233; &eacute;.</p></div>", "<style>x</style>"),
+    ]
+
+    def test_same_output_as_the_default_path(self):
+        warc = b"".join(warc_record(number, "http://example.com/{0}".format(number),
+                                    html_page(body, head).encode("utf-8"))
+                        for number, (body, head) in enumerate(self.PAGES))
+        outputs, _, _ = run_preprocess(warc)
+        self.assertEqual(len(outputs["plain_text"]), len(self.PAGES))
+        single_parse, _, _ = run_preprocess(warc, options=["--single-parse"])
+        for output in ["normalized_html", "plain_text"]:
+            self.assertEqual([base64.b64decode(line).decode("utf-8") for line in single_parse[output]],
+                             [base64.b64decode(line).decode("utf-8") for line in outputs[output]])
+        self.assertEqual(single_parse, outputs)
+
+
+if __name__ == "__main__":
+    unittest.main()
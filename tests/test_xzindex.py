@@ -0,0 +1,122 @@
+import lzma
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils"))
+from common import IndexedXZFile, XZBlockWriter, read_xz_blocks, get_lines
+
+LINES = ["línea {0} ".format(i).encode("utf-8") * (i % 13) + b"\n" for i in range(1, 501)]
+
+
+class IndexedXZFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "lines.xz")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, lines=LINES, block_size=1000):
+        writer = XZBlockWriter(self.path, block_size)
+        for line in lines:
+            writer.write(line)
+        writer.close()
+
+    def test_block_writer_writes_a_valid_xz_file(self):
+        self.write()
+        self.assertGreater(len(read_xz_blocks(self.path)), 10)
+        with lzma.open(self.path) as reader:
+            self.assertEqual(reader.read(), b"".join(LINES))
+
+    def test_random_access(self):
+        for block_size in [1, 1000, 1024 * 1024]:
+            self.write(block_size=block_size)
+            numbers = list(range(1, len(LINES) + 1)) * 2
+            random.Random(0).shuffle(numbers)
+            indexed = IndexedXZFile(self.path)
+            for n in numbers:
+                self.assertEqual(indexed.get_line(n), LINES[n - 1])
+            for n in [0, -1, len(LINES) + 2]:
+                self.assertRaises(IndexError, indexed.get_line, n)
+            self.assertEqual(indexed.get_lines([3, 1, 3, 500]), {1: LINES[0], 3: LINES[2], 500: LINES[499]})
+            indexed.close()
+            os.remove(self.path + ".blockidx")
+
+    def test_lines_across_blocks(self):
+        # Every write ends a block, so lines with text are split across two of them
+        self.write([part for line in LINES for part in (line[:-1], line[-1:])], block_size=1)
+        indexed = IndexedXZFile(self.path)
+        self.assertEqual([indexed.get_line(n) for n in range(1, len(LINES) + 1)], LINES)
+        indexed.close()
+
+    def test_last_line_without_end_of_line(self):
+        self.write([b"first\n", b"last"])
+        indexed = IndexedXZFile(self.path)
+        self.assertEqual(indexed.get_line(2), b"last")
+        self.assertRaises(IndexError, indexed.get_line, 3)
+        indexed.close()
+
+    def test_file_with_a_single_block(self):
+        with lzma.open(self.path, "wb") as writer:
+            writer.write(b"".join(LINES))
+        self.assertEqual(get_lines(self.path, [2, 400]), {2: LINES[1].decode("utf-8").rstrip("\n"),
+                                                          400: LINES[399].decode("utf-8").rstrip("\n")})
+
+    def test_sidecar_index(self):
+        self.write()
+        IndexedXZFile(self.path).close()
+        self.assertTrue(os.path.isfile(self.path + ".blockidx"))
+        indexed = IndexedXZFile(self.path)
+        self.assertEqual(indexed.get_line(250), LINES[249])
+        indexed.close()
+
+        # The sidecar of the previous file is not used for a new one
+        self.write(LINES[::-1], block_size=300)
+        os.utime(self.path, ns=(0, 0))
+        indexed = IndexedXZFile(self.path)
+        self.assertEqual([indexed.get_line(n) for n in range(1, len(LINES) + 1)], LINES[::-1])
+        indexed.close()
+
+    def test_truncated_sidecar_index(self):
+        self.write()
+        IndexedXZFile(self.path).close()
+        # No temporary files are left
+        self.assertEqual(sorted(os.listdir(self.directory)), ["lines.xz", "lines.xz.blockidx"])
+        with open(self.path + ".blockidx") as reader:
+            sidecar = reader.read()
+        # Cut after the signature and in the middle of a line, as an interrupted write would leave it
+        for length in [sidecar.index("\n") + 1, len(sidecar) // 2, len(sidecar) - 2]:
+            with open(self.path + ".blockidx", "w") as writer:
+                writer.write(sidecar[:length])
+            indexed = IndexedXZFile(self.path)
+            self.assertEqual([indexed.get_line(n) for n in range(1, len(LINES) + 1)], LINES)
+            indexed.close()
+            with open(self.path + ".blockidx") as reader:
+                self.assertEqual(reader.read(), sidecar)
+
+    def test_not_an_xz_file(self):
+        with open(self.path, "wb") as writer:
+            writer.write(b"".join(LINES))
+        self.assertRaisesRegex(Exception, "is not a valid XZ file", IndexedXZFile, self.path)
+
+    def test_truncated(self):
+        self.write()
+        with open(self.path, "rb") as reader:
+            data = reader.read()
+        # Files cut at the end of a stream are valid XZ files with fewer lines
+        stream_ends = set(block[0] for block in read_xz_blocks(self.path))
+        for length in range(1, len(data)):
+            with open(self.path, "wb") as writer:
+                writer.write(data[:length])
+            if length in stream_ends:
+                continue
+            self.assertRaisesRegex(Exception, "is not a valid XZ file", read_xz_blocks, self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
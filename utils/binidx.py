@@ -0,0 +1,145 @@
+import json
+import mmap
+import struct
+
+import numpy as np
+
+#
+# Binary version of the index written by bitextor-buildidx (words of every language and the documents in which they
+# appear), read with memory mapping so posting lists are never parsed.
+#
+# File format:
+#   magic (8 bytes)
+#   postings: document numbers (starting at 0, as in the text index) of every word, one after another, as 4-byte
+#             unsigned ints, in the same order as the vocabulary
+#   posting offsets: position (in number of postings) where the list of every word starts, plus the total number of
+#                    postings (8-byte unsigned ints)
+#   vocabulary: UTF-8 encoding of the words, one after another
+#   vocabulary offsets: position (in bytes) where every word starts, plus the size of the vocabulary (8-byte
+#                       unsigned ints)
+#   languages: language id of every word (2-byte unsigned ints), an index in the list of languages of the header
+#   header: JSON object with the list of languages, the number of words and the offsets of the sections
+#   footer: offset and length of the header (8-byte unsigned ints)
+#
+# Words are sorted by language and word, as in the text index.
+#
+
+MAGIC = b"BTXIDX01"
+FOOTER = struct.Struct("<QQ")
+
+
+def is_binary_index(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class BinaryIndexWriter(object):
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.posting_offsets = [0]
+        self.vocabulary = bytearray()
+        self.vocabulary_offsets = [0]
+        self.word_languages = []
+        self.languages = []
+
+    def add(self, lang, word, docs):
+        """Adds a word with the (sorted) list of document numbers in which it appears"""
+        if not self.languages or self.languages[-1] != lang:
+            self.languages.append(lang)
+        self.file.write(np.asarray(docs, dtype="<u4").tobytes())
+        self.posting_offsets.append(self.posting_offsets[-1] + len(docs))
+        self.vocabulary += word.encode("utf-8")
+        self.vocabulary_offsets.append(len(self.vocabulary))
+        self.word_languages.append(len(self.languages) - 1)
+
+    def _write_section(self, data):
+        offset = self.file.tell()
+        self.file.write(data)
+        return offset
+
+    def close(self):
+        header = {"languages": self.languages, "num_words": len(self.word_languages),
+                  "postings": len(MAGIC),
+                  "posting_offsets": self._write_section(np.asarray(self.posting_offsets, dtype="<u8").tobytes()),
+                  "vocabulary": self._write_section(bytes(self.vocabulary)),
+                  "vocabulary_offsets": self._write_section(np.asarray(self.vocabulary_offsets,
+                                                                       dtype="<u8").tobytes()),
+                  "word_languages": self._write_section(np.asarray(self.word_languages, dtype="<u2").tobytes())}
+        header_offset = self.file.tell()
+        encoded_header = json.dumps(header).encode("utf-8")
+        self.file.write(encoded_header)
+        self.file.write(FOOTER.pack(header_offset, len(encoded_header)))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class BinaryIndexReader(object):
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise Exception("{0} is not a binary index".format(path))
+        if len(self.map) < len(MAGIC) + FOOTER.size:
+            raise Exception("{0} is a truncated binary index".format(path))
+        header_offset, header_length = FOOTER.unpack(self.map[-FOOTER.size:])
+        # The header is just before the footer, which is not the case in a truncated file (an interrupted write)
+        if header_offset < len(MAGIC) or header_offset + header_length + FOOTER.size != len(self.map):
+            raise Exception("{0} is a truncated binary index".format(path))
+        header = json.loads(self.map[header_offset:header_offset + header_length].decode("utf-8"))
+        self.languages = header["languages"]
+        self.num_words = header["num_words"]
+        n = self.num_words
+        self.posting_offsets = np.frombuffer(self.map, dtype="<u8", count=n + 1, offset=header["posting_offsets"])
+        self.postings = np.frombuffer(self.map, dtype="<u4", count=int(self.posting_offsets[-1]),
+                                      offset=header["postings"])
+        self.vocabulary_offsets = np.frombuffer(self.map, dtype="<u8", count=n + 1,
+                                                offset=header["vocabulary_offsets"])
+        self.vocabulary_start = header["vocabulary"]
+        self.word_languages = np.frombuffer(self.map, dtype="<u2", count=n, offset=header["word_languages"])
+
+    def __len__(self):
+        return self.num_words
+
+    def word(self, i):
+        start = self.vocabulary_start + int(self.vocabulary_offsets[i])
+        end = self.vocabulary_start + int(self.vocabulary_offsets[i + 1])
+        return self.map[start:end].decode("utf-8")
+
+    def language(self, i):
+        return self.languages[self.word_languages[i]]
+
+    def docs(self, i):
+        """Returns a read-only array with the document numbers (starting at 0) of the word with id i"""
+        return self.postings[self.posting_offsets[i]:self.posting_offsets[i + 1]]
+
+    def words(self, lang):
+        """Returns the range of ids of the words of a language (words of a language are stored together)"""
+        if lang not in self.languages:
+            return range(0)
+        ids = np.flatnonzero(self.word_languages == self.languages.index(lang))
+        return range(int(ids[0]), int(ids[-1]) + 1) if len(ids) > 0 else range(0)
+
+    def __iter__(self):
+        """Yields the language, the word and the documents of every word in the index"""
+        for i in range(self.num_words):
+            yield self.language(i), self.word(i), self.docs(i)
+
+    def close(self):
+        # Arrays are views of the mapped file, so they have to be released before closing it
+        self.posting_offsets = self.postings = self.vocabulary_offsets = self.word_languages = None
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -2,7 +2,11 @@ try:
     import lzma
 except ImportError:
     from backports import lzma
+import bisect
 import gzip
+import os
+import re
+import tempfile
 from contextlib import contextmanager
 
 
@@ -75,3 +79,234 @@ def check_lengths(file_path_from, file_path_to, throw=True):
                             {0}: {1}, {2}: {3}".format(file_path_from, f1_lines, file_path_to, f2_lines))
 
     return f1_lines == f2_lines
+
+
+#
+# Random access to lines of XZ files
+#
+# An XZ file is a sequence of streams, and every stream a sequence of independently compressed blocks followed by an
+# index with the size of each block. The offsets of the blocks are read from the stream indexes and the number of
+# lines in each block is counted once; this information is stored in a sidecar file (<file>.blockidx) so a line can
+# be read by decompressing only the blocks that contain it. Files written with `xz -T 0` or with XZBlockWriter
+# contain many blocks; a file with a single block is still read correctly, but it is fully decompressed.
+#
+
+XZ_HEADER_SIZE = 12
+XZ_FOOTER_SIZE = 12
+XZ_MAGIC = b"\xfd7zXZ\x00"
+
+
+def _read_xz_varint(data, position):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if byte & 0x80 == 0:
+            return value, position
+
+
+def read_xz_blocks(file_path):
+    """Returns a list of tuples (offset of the stream, offset of the block, size of the block) for every block in an
+    XZ file, in order"""
+    blocks = []
+    with open(file_path, 'rb') as f:
+        f.seek(0, 2)
+        position = f.tell()
+        while position > 0:
+            if position < XZ_HEADER_SIZE + XZ_FOOTER_SIZE:
+                raise Exception("{0} is not a valid XZ file".format(file_path))
+            # Stream padding (null bytes between concatenated streams)
+            f.seek(position - 4)
+            if f.read(4) == b"\0\0\0\0":
+                position -= 4
+                continue
+            f.seek(position - XZ_FOOTER_SIZE)
+            footer = f.read(XZ_FOOTER_SIZE)
+            if footer[-2:] != b"YZ":
+                raise Exception("{0} is not a valid XZ file".format(file_path))
+            index_size = (int.from_bytes(footer[4:8], 'little') + 1) * 4
+            index_position = position - XZ_FOOTER_SIZE - index_size
+            f.seek(index_position)
+            index = f.read(index_size)
+            num_records, pointer = _read_xz_varint(index, 1)
+            sizes = []
+            for _ in range(num_records):
+                unpadded_size, pointer = _read_xz_varint(index, pointer)
+                uncompressed_size, pointer = _read_xz_varint(index, pointer)
+                sizes.append((unpadded_size + 3) // 4 * 4)
+            stream_position = index_position - sum(sizes) - XZ_HEADER_SIZE
+            # Sizes read from a truncated or corrupted file do not point to the header of a stream
+            if stream_position < 0:
+                raise Exception("{0} is not a valid XZ file".format(file_path))
+            f.seek(stream_position)
+            if f.read(6) != XZ_MAGIC:
+                raise Exception("{0} is not a valid XZ file".format(file_path))
+            block_position = stream_position + XZ_HEADER_SIZE
+            stream_blocks = []
+            for size in sizes:
+                stream_blocks.append((stream_position, block_position, size))
+                block_position += size
+            blocks = stream_blocks + blocks
+            position = stream_position
+    return blocks
+
+
+class IndexedXZFile(object):
+    """Random access to the lines of an XZ file. Line numbers start at 1, as document ids in Bitextor. Lines are
+    returned as bytes, including the end-of-line character"""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.file = open(file_path, 'rb')
+        self.blocks, self.newlines = self._load_index()
+        # Number of end-of-line characters before every block
+        self.cumulative = [0]
+        for count in self.newlines:
+            self.cumulative.append(self.cumulative[-1] + count)
+        self.cached_block = None
+        self.cached_data = None
+        self.cached_newlines = None
+
+    def _load_index(self):
+        stat = os.stat(self.file_path)
+        signature = "{0}\t{1}".format(stat.st_size, stat.st_mtime_ns)
+        sidecar = self.file_path + ".blockidx"
+        if os.path.isfile(sidecar):
+            with open(sidecar, 'r') as f:
+                # The first line has the signature of the file and the number of blocks
+                fields = f.readline().strip().rsplit("\t", 1)
+                if len(fields) == 2 and fields[0] == signature:
+                    blocks = []
+                    newlines = []
+                    try:
+                        for line in f:
+                            stream_position, block_position, size, count = map(int, line.split("\t"))
+                            blocks.append((stream_position, block_position, size))
+                            newlines.append(count)
+                        if len(blocks) == int(fields[1]):
+                            return blocks, newlines
+                    except ValueError:
+                        pass
+
+        blocks = read_xz_blocks(self.file_path)
+        newlines = []
+        for block in range(len(blocks)):
+            newlines.append(self._decompress_block(blocks[block]).count(b"\n"))
+        try:
+            # Written to a temporary file that replaces the sidecar, so readers never see a partial index
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(sidecar)), prefix=".blockidx.")
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write("{0}\t{1}\n".format(signature, len(blocks)))
+                    for (stream_position, block_position, size), count in zip(blocks, newlines):
+                        f.write("{0}\t{1}\t{2}\t{3}\n".format(stream_position, block_position, size, count))
+                # Temporary files are only readable by their owner; the sidecar is shared as the XZ file is
+                os.chmod(tmp_path, os.stat(self.file_path).st_mode & 0o666)
+                os.replace(tmp_path, sidecar)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError:
+            # The index is kept only in memory if the sidecar cannot be written (e.g. read-only directory)
+            pass
+        return blocks, newlines
+
+    def _decompress_block(self, block):
+        stream_position, block_position, size = block
+        self.file.seek(stream_position)
+        header = self.file.read(XZ_HEADER_SIZE)
+        self.file.seek(block_position)
+        # The block is decompressed as if it were the first one of its stream; the decompressor is not asked to
+        # reach the end of the stream, so the missing index is not a problem
+        return lzma.LZMADecompressor(lzma.FORMAT_XZ).decompress(header + self.file.read(size))
+
+    def _block_data(self, block):
+        if block != self.cached_block:
+            self.cached_data = self._decompress_block(self.blocks[block])
+            self.cached_block = block
+            self.cached_newlines = None
+        return self.cached_data
+
+    def _block_newlines(self, block):
+        data = self._block_data(block)
+        if self.cached_newlines is None:
+            self.cached_newlines = [match.start() for match in re.finditer(b"\n", data)]
+        return self.cached_newlines
+
+    def get_line(self, n):
+        # Line n starts after the (n-1)-th end-of-line character
+        target = n - 1
+        if n < 1 or target >= self.cumulative[-1] + 1:
+            raise IndexError(n)
+        if target == 0:
+            block, start = 0, 0
+        else:
+            block = bisect.bisect_left(self.cumulative, target) - 1
+            start = self._block_newlines(block)[target - self.cumulative[block] - 1] + 1
+        parts = []
+        while block < len(self.blocks):
+            data = self._block_data(block)
+            end = data.find(b"\n", start)
+            if end >= 0:
+                parts.append(data[start:end + 1])
+                break
+            parts.append(data[start:])
+            block += 1
+            start = 0
+        line = b"".join(parts)
+        if not line and n > self.cumulative[-1]:
+            raise IndexError(n)
+        return line
+
+    def get_lines(self, ids):
+        """Returns a dict with the lines whose numbers are in ids; every block is decompressed at most once if the
+        lines are requested in order"""
+        return {n: self.get_line(n) for n in sorted(set(ids))}
+
+    def close(self):
+        self.file.close()
+
+
+def get_lines(file_path, ids):
+    """Reads only the lines of a file whose numbers (starting at 1) are in ids and returns a dict with them, decoded
+    and without the end-of-line character. XZ files are read through their block index; other files are streamed"""
+    ids = set(ids)
+    lines = {}
+    if file_path[-3:] == ".xz":
+        indexed = IndexedXZFile(file_path)
+        for n, line in indexed.get_lines(ids).items():
+            lines[n] = line.decode('utf-8').rstrip("\n")
+        indexed.close()
+    else:
+        with open_xz_or_gzip_or_plain(file_path) as f:
+            for n, line in enumerate(f, 1):
+                if n in ids:
+                    lines[n] = line.rstrip("\n")
+    return lines
+
+
+class XZBlockWriter(object):
+    """Writes an XZ file as a sequence of streams of about block_size bytes of uncompressed data each, always ending
+    at the end of a write() call, so IndexedXZFile can decompress every part independently. The result is a valid
+    XZ file that can be read with xzcat or lzma.open"""
+
+    def __init__(self, file_path, block_size=1024 * 1024):
+        self.file = open(file_path, 'wb')
+        self.block_size = block_size
+        self.compressor = lzma.LZMACompressor(lzma.FORMAT_XZ)
+        self.written = 0
+
+    def write(self, data):
+        self.file.write(self.compressor.compress(data))
+        self.written += len(data)
+        if self.written >= self.block_size:
+            self.file.write(self.compressor.flush())
+            self.compressor = lzma.LZMACompressor(lzma.FORMAT_XZ)
+            self.written = 0
+
+    def close(self):
+        self.file.write(self.compressor.flush())
+        self.file.close()
@@ -0,0 +1,221 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+import numpy as np
+
+#
+# Compiled version of a bilingual lexicon (.dic: a header with the two languages and a pair of translations per line,
+# separated by tabs), built once and read with memory mapping by every process that needs the lexicon, so the text
+# file is not read and split again for every website and direction.
+#
+# File format:
+#   magic (8 bytes)
+#   vocabulary of each column: UTF-8 encoding of the different words, separated by new lines, in order of appearance
+#   pairs: word ids of both columns of every line of the .dic, in the same order (4-byte unsigned ints)
+#   translations of each column: ids of the words of the other column (4-byte unsigned ints) for every word, in
+#                                order of appearance in the .dic, and the offsets where the list of every word starts
+#                                (8-byte unsigned ints)
+#   header: JSON object with the languages of the .dic header, the size, modification time and SHA-1 checksum of the
+#           .dic it was built from, and the offsets of the sections
+#   footer: offset and length of the header (8-byte unsigned ints)
+#
+# The compiled file is rebuilt when the .dic changes: its size and modification time are compared with the ones in
+# the header and, if they are different, its checksum.
+#
+
+MAGIC = b"BTXDIC01"
+FOOTER = struct.Struct("<QQ")
+
+
+def source_checksum(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as reader:
+        for block in iter(lambda: reader.read(1024 * 1024), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def compile_dictionary(source, target):
+    """Builds the compiled version of the .dic source in target, which is replaced atomically"""
+    stat = os.stat(source)
+    vocabularies = [{}, {}]
+    pairs = []
+    with open(source, "r") as reader:
+        languages = reader.readline().strip().split("\t")
+        for line in reader:
+            # Same lines as bitextor-idx2ridx used from the text file
+            fields = line.strip().split("\t")
+            if len(fields) == 2:
+                pairs.append((vocabularies[0].setdefault(fields[0], len(vocabularies[0])),
+                              vocabularies[1].setdefault(fields[1], len(vocabularies[1]))))
+    pairs = np.asarray(pairs, dtype="<u4").reshape(-1, 2)
+
+    header = {"languages": languages,
+              "source": {"size": stat.st_size, "mtime": stat.st_mtime_ns, "sha1": source_checksum(source)},
+              "num_words": [len(vocabulary) for vocabulary in vocabularies], "num_pairs": len(pairs)}
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(target)), prefix=".dic.")
+    try:
+        with os.fdopen(fd, "wb") as writer:
+            writer.write(MAGIC)
+            for column in [0, 1]:
+                header["vocabulary" + str(column)] = writer.tell()
+                writer.write("\n".join(vocabularies[column]).encode("utf-8"))
+            header["vocabulary_end"] = writer.tell()
+            header["pairs"] = writer.tell()
+            writer.write(pairs.tobytes())
+            for column in [0, 1]:
+                # Stable sort, so translations keep the order of the .dic
+                order = np.argsort(pairs[:, column], kind="stable")
+                counts = np.bincount(pairs[:, column], minlength=len(vocabularies[column]))
+                header["translations" + str(column)] = writer.tell()
+                writer.write(pairs[order, 1 - column].astype("<u4").tobytes())
+                header["offsets" + str(column)] = writer.tell()
+                writer.write(np.concatenate(([0], np.cumsum(counts))).astype("<u8").tobytes())
+            header_offset = writer.tell()
+            encoded_header = json.dumps(header).encode("utf-8")
+            writer.write(encoded_header)
+            writer.write(FOOTER.pack(header_offset, len(encoded_header)))
+        # Temporary files are only readable by their owner; the compiled dictionary is shared as the .dic is
+        os.chmod(tmp_path, stat.st_mode & 0o666)
+        os.replace(tmp_path, target)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_header(path):
+    """Returns the header of a compiled dictionary, or None if the file is not one"""
+    try:
+        with open(path, "rb") as reader:
+            if reader.read(len(MAGIC)) != MAGIC:
+                return None
+            size = reader.seek(0, os.SEEK_END)
+            if size < len(MAGIC) + FOOTER.size:
+                return None
+            reader.seek(-FOOTER.size, os.SEEK_END)
+            header_offset, header_length = FOOTER.unpack(reader.read(FOOTER.size))
+            # A truncated file (an interrupted copy) is not a compiled dictionary, so it is rebuilt
+            if header_offset < len(MAGIC) or header_offset + header_length + FOOTER.size != size:
+                return None
+            reader.seek(header_offset)
+            return json.loads(reader.read(header_length).decode("utf-8"))
+    except (IOError, ValueError, struct.error):
+        return None
+
+
+def is_up_to_date(source, compiled):
+    header = read_header(compiled)
+    if header is None:
+        return False
+    stat = os.stat(source)
+    if header["source"]["size"] == stat.st_size and header["source"]["mtime"] == stat.st_mtime_ns:
+        return True
+    return header["source"]["size"] == stat.st_size and header["source"]["sha1"] == source_checksum(source)
+
+
+def open_dictionary(source, compiled=None):
+    """Returns the CompiledDictionary of the .dic source, stored in compiled (source + '.bin' by default) and built
+    first if it does not exist or the .dic has changed. If it cannot be written there, it is built in a temporary file
+    that is only used by this process"""
+    if compiled is None:
+        compiled = source + ".bin"
+    if not is_up_to_date(source, compiled):
+        try:
+            compile_dictionary(source, compiled)
+        except OSError as ex:
+            sys.stderr.write("WARNING: compiled dictionary {0} could not be written ({1}); using a temporary "
+                             "one\n".format(compiled, ex))
+            fd, tmp_path = tempfile.mkstemp(suffix=".bin")
+            os.close(fd)
+            compile_dictionary(source, tmp_path)
+            dictionary = CompiledDictionary(tmp_path)
+            # The file is mapped, so it can be removed already
+            os.unlink(tmp_path)
+            return dictionary
+    return CompiledDictionary(compiled)
+
+
+class CompiledDictionary(object):
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise Exception("{0} is not a compiled dictionary".format(path))
+        if len(self.map) < len(MAGIC) + FOOTER.size:
+            raise Exception("{0} is a truncated compiled dictionary".format(path))
+        header_offset, header_length = FOOTER.unpack(self.map[-FOOTER.size:])
+        # The header is just before the footer, which is not the case in a truncated file
+        if header_offset < len(MAGIC) or header_offset + header_length + FOOTER.size != len(self.map):
+            raise Exception("{0} is a truncated compiled dictionary".format(path))
+        header = json.loads(self.map[header_offset:header_offset + header_length].decode("utf-8"))
+        self.header = header
+        self.languages = header["languages"]
+        self.num_pairs = header["num_pairs"]
+        self.pairs = np.frombuffer(self.map, dtype="<u4", count=2 * self.num_pairs,
+                                   offset=header["pairs"]).reshape(-1, 2)
+        self.translations = []
+        self.offsets = []
+        for column in [0, 1]:
+            self.translations.append(np.frombuffer(self.map, dtype="<u4", count=self.num_pairs,
+                                                   offset=header["translations" + str(column)]))
+            self.offsets.append(np.frombuffer(self.map, dtype="<u8", count=header["num_words"][column] + 1,
+                                              offset=header["offsets" + str(column)]))
+        self.vocabulary_bounds = [header["vocabulary0"], header["vocabulary1"], header["vocabulary_end"]]
+        self.words = [None, None]
+        self.word_ids = [None, None]
+
+    def column(self, lang):
+        """Column of a language as bitextor-idx2ridx finds it in the .dic header (the last one if the language is not
+        there)"""
+        column = -1
+        for i, header_lang in enumerate(self.languages):
+            if header_lang == lang:
+                column = i
+        return column % 2
+
+    def vocabulary(self, column):
+        """Returns the list of words of a column (decoded the first time it is needed)"""
+        if self.words[column] is None:
+            if self.header["num_words"][column] == 0:
+                self.words[column] = []
+            else:
+                start, end = self.vocabulary_bounds[column], self.vocabulary_bounds[column + 1]
+                self.words[column] = self.map[start:end].decode("utf-8").split("\n")
+            self.word_ids[column] = {word: i for i, word in enumerate(self.words[column])}
+        return self.words[column]
+
+    def translate(self, column, word):
+        """Returns the list of translations (words of the other column) of a word of a column, with repetitions and in
+        order of appearance in the .dic, as the text file gives them"""
+        self.vocabulary(column)
+        word_id = self.word_ids[column].get(word)
+        if word_id is None:
+            return []
+        other_words = self.vocabulary(1 - column)
+        ids = self.translations[column][self.offsets[column][word_id]:self.offsets[column][word_id + 1]]
+        return [other_words[i] for i in ids.tolist()]
+
+    def __iter__(self):
+        """Yields the pairs of words of every line of the .dic, in the same order"""
+        words0 = self.vocabulary(0)
+        words1 = self.vocabulary(1)
+        for word_id0, word_id1 in self.pairs.tolist():
+            yield words0[word_id0], words1[word_id1]
+
+    def close(self):
+        # Arrays are views of the mapped file, so they have to be released before closing it
+        self.pairs = self.translations = self.offsets = None
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
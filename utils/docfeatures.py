@@ -0,0 +1,293 @@
+import base64
+import gc
+import html.parser
+import math
+import multiprocessing
+import re
+import tempfile
+import threading
+from functools import lru_cache
+from itertools import islice
+
+import Levenshtein
+
+#
+# Facts about the documents used by the features that rescore the candidates of bitextor-idx2ridx (see features/),
+# and the features themselves, computed exactly as the scripts in features/ always did
+#
+
+IMG_RE = re.compile('''<img [^>]*src\s*=\s*['"]\s*([^'"]+)['"]''', re.S)
+HREF_RE = re.compile('''href\s*=\s*['"]\s*([^'"]+)['"]''', re.S)
+DOMAIN_RE = re.compile('(https?://[^/:]+)')
+
+
+class StructureParser(html.parser.HTMLParser):
+    """Writes every tag as _tag_ and every text as a number of "_" that grows with the logarithm of its number of
+    words, ignoring scripts"""
+
+    def error(self, message):
+        pass
+
+    def __init__(self):
+        html.parser.HTMLParser.__init__(self)
+        self.script = 0
+        self.output = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "script" or tag == "noscript":
+            self.script = 1
+        else:
+            self.output.append("_" + tag + "_")
+
+    def handle_data(self, data):
+        if self.script == 0:
+            if data != "":
+                nwords = len(data.split())
+                if nwords > 0:
+                    # Replacing every word in text by a "_" symbol
+                    self.output.append("_" * int(math.log(nwords, 2)))
+
+    def handle_endtag(self, tag):
+        if tag == "script" or tag == "noscript":
+            self.script = 0
+        else:
+            self.output.append("_" + tag + "_")
+
+
+class TagEncoder(object):
+    """To compute the edit distance at the level of characters, HTML tags are encoded as characters and not strings;
+    every new tag gets the next character (distances do not depend on which one)"""
+
+    def __init__(self):
+        self.dic = {'': '_'}
+        self.charidx = 32
+
+    def encode(self, taglist):
+        # Adding new tags in the raspa and the character with which they will be replaced to the dictionary
+        for tag in set(taglist):
+            if tag not in self.dic:
+                self.dic[tag] = chr(self.charidx)
+                self.charidx += 1
+                if self.charidx == 95:
+                    self.charidx += 1
+        return "".join(self.dic[tag] for tag in taglist)
+
+
+def structure_representation(html_content, encoder):
+    """Returns the structure of the HTML encoded with a character per tag, or None for empty documents and documents
+    whose first tag does not end in *ml (things different than HTML or XML as JPGS or PDF, for example) or with tags
+    that are not ASCII"""
+    if html_content == "":
+        return None
+    p = StructureParser()
+    p.feed(html_content)
+    raspa = "".join(p.output)
+    if raspa.split('_')[1][-2:] == "ml" and all(ord(char) < 128 for char in raspa):
+        return encoder.encode(raspa.split('_'))
+    return None
+
+
+class RidxLines(object):
+    """Fields of the lines of a RIDX file with at least one candidate, read again from the file every time they are
+    iterated, so they are not kept in memory"""
+
+    def __init__(self, reader, start=0):
+        self.reader = reader
+        self.start = start
+
+    def __iter__(self):
+        self.reader.seek(self.start)
+        for i in self.reader:
+            fields = i.strip().split("\t")
+            if len(fields) > 1:
+                yield fields
+
+
+def read_ridx(reader):
+    """Reads a RIDX file before the documents, so only the ones that appear in it have to be kept. Returns the fields of
+    the lines with at least one candidate (the rest are not written by the features), which are read again from the
+    file when they are iterated, and the set of ids of the documents in them. A reader that cannot seek (the standard
+    input from a pipe) is copied to a temporary file"""
+    copy = None if reader.seekable() else tempfile.TemporaryFile("w+", encoding="utf-8")
+    start = reader.tell() if copy is None else 0
+    referenced = set()
+    for i in reader:
+        if copy is not None:
+            copy.write(i)
+        fields = i.strip().split("\t")
+        if len(fields) > 1:
+            referenced.add(int(fields[0]))
+            for candidate in fields[1:]:
+                referenced.add(int(candidate.split(":")[0]))
+    return RidxLines(reader if copy is None else copy, start), referenced
+
+
+def chunks(lines, size):
+    lines = iter(lines)
+    chunk = list(islice(lines, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(lines, size))
+
+
+def imap_ordered(function, items, workers):
+    """Applies function to every item, in the given number of processes, and yields the results in order. Processes
+    are forked, so they share (copy-on-write) the documents already loaded, which function reads as globals"""
+    if workers <= 1:
+        for item in items:
+            yield function(item)
+        return
+    # Objects loaded so far are not tracked by the garbage collector of the workers, which would copy their pages
+    if hasattr(gc, "freeze"):
+        gc.freeze()
+    # The pool reads the items as fast as it can; the semaphore bounds the number of items read in advance
+    semaphore = threading.BoundedSemaphore(workers * 4)
+
+    def bounded(items):
+        for item in items:
+            semaphore.acquire()
+            yield item
+
+    pool = multiprocessing.get_context("fork").Pool(workers)
+    try:
+        for result in pool.imap(function, bounded(items)):
+            semaphore.release()
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
+def decode_html(html_base64enc):
+    return base64.b64decode(html_base64enc.strip()).decode("utf-8")
+
+
+def image_set(html_content):
+    return set(IMG_RE.findall(html_content))
+
+
+def link_list(html_content):
+    return HREF_RE.findall(html_content)
+
+
+def strip_domain(url, text):
+    """Removes the protocol and host of url from text"""
+    rx = DOMAIN_RE.match(url)
+    if rx is not None:
+        return text.replace(rx.group(1), "")
+    return text
+
+
+def structure_similarity(structure1, structure2):
+    return 1 - (Levenshtein.distance(structure1, structure2) / float(max(len(structure1), len(structure2))))
+
+
+def _distance_with_cutoff_supported():
+    try:
+        Levenshtein.distance("a", "b", score_cutoff=0)
+        return True
+    except TypeError:
+        return False
+
+
+class BoundedStructureSimilarity(object):
+    """Structure similarity that is only computed exactly when it is at least min_similarity. As similarity is
+    1 - distance / longest length, the difference of lengths is a lower bound of the distance, so pairs of very
+    different lengths are discarded without computing the distance, and the distance of the rest is computed only up
+    to the maximum distance allowed (if the Levenshtein module supports score_cutoff). Discarded pairs get an upper
+    bound of their similarity, which is below min_similarity. Results are cached for repeated pairs of structures
+    (templated pages share them), and report() returns how often each cutoff fired"""
+
+    cutoff_supported = _distance_with_cutoff_supported()
+
+    def __init__(self, min_similarity, cache_size=65536):
+        self.min_similarity = min_similarity
+        self.pairs = 0
+        self.length_cutoffs = 0
+        self.distance_cutoffs = 0
+        self.similarity = lru_cache(maxsize=cache_size)(self._similarity)
+
+    def __call__(self, structure1, structure2):
+        self.pairs += 1
+        # The distance is symmetric, so both orders of a pair share the cached result
+        if structure2 < structure1:
+            structure1, structure2 = structure2, structure1
+        return self.similarity(structure1, structure2)
+
+    def _similarity(self, structure1, structure2):
+        longest = max(len(structure1), len(structure2))
+        # Maximum distance allowed (rounded up, so pairs just at the threshold are always computed exactly)
+        max_distance = int(math.floor((1 - self.min_similarity) * longest + 1e-9))
+        length_difference = abs(len(structure1) - len(structure2))
+        if length_difference > max_distance:
+            self.length_cutoffs += 1
+            return 1 - (length_difference / float(longest))
+        if self.cutoff_supported:
+            dist = Levenshtein.distance(structure1, structure2, score_cutoff=max_distance)
+            if dist > max_distance:
+                self.distance_cutoffs += 1
+        else:
+            dist = Levenshtein.distance(structure1, structure2)
+        return 1 - (dist / float(longest))
+
+    def stats(self):
+        """Returns the number of pairs, cache hits, length cutoffs and distance cutoffs"""
+        return [self.pairs, self.similarity.cache_info().hits, self.length_cutoffs, self.distance_cutoffs]
+
+    def report(self, stats=None):
+        """Returns a line with the statistics of this object or, with several processes, the sum of theirs"""
+        pairs, hits, length_cutoffs, distance_cutoffs = stats if stats is not None else self.stats()
+        return "Structure distance: {0} pairs, {1} from cache; cutoffs (similarity < {2}): {3} by length, {4} by " \
+               "distance{5}".format(pairs, hits, self.min_similarity, length_cutoffs, distance_cutoffs,
+                                    "" if self.cutoff_supported else " (not supported by this Levenshtein module)")
+
+
+class Document(object):
+    """Everything the features need from a document: its URL as a link (to find it among the links of other documents),
+    its URL without protocol and host, its sets of images and links, the concatenation of its links without the host of
+    the document, and its encoded structure (None if it has none)"""
+    __slots__ = ["self_link", "url_path", "images", "links", "link_string", "structure"]
+
+
+def extract_document(url, html_content, encoder):
+    """Builds the Document of a line of the URL file (with its new line, as bitextor-mutuallylinked and
+    bitextor-urlsdistance read it) and its decoded HTML"""
+    links = link_list(html_content)
+    doc = Document()
+    doc.self_link = url
+    doc.url_path = strip_domain(url.strip(), url.strip())
+    doc.images = image_set(html_content)
+    doc.links = set(links)
+    doc.link_string = strip_domain(url, "".join(links))
+    doc.structure = structure_representation(html_content, encoder)
+    return doc
+
+
+def score_pair(doc, candidate_doc, structure_similarity=structure_similarity):
+    """Returns the six features of a pair of documents as strings, in the order of the chain of scripts
+    imagesetoverlap, structuredistance, urlsdistance, mutuallylinked, urlscomparison and urlsetoverlap; the structure
+    similarity can be replaced (for example, by a BoundedStructureSimilarity)"""
+    if doc.structure is None or candidate_doc.structure is None:
+        # As in bitextor-structuredistance, which does not keep them
+        raise ValueError("Document without HTML structure (empty, not HTML or with non-ASCII tags) in the candidates")
+    return [str(set_overlap(doc.images, candidate_doc.images)),
+            str(structure_similarity(doc.structure, candidate_doc.structure)),
+            str(normalised_distance(doc.link_string, candidate_doc.link_string)),
+            "1" if doc.self_link in candidate_doc.links else "0",
+            str(normalised_distance(doc.url_path, candidate_doc.url_path)),
+            str(set_overlap(doc.links, candidate_doc.links))]
+
+
+def set_overlap(set1, set2):
+    union = len(set1.union(set2))
+    if union > 0:
+        return len(set1.intersection(set2)) / float(union)
+    return 0
+
+
+def normalised_distance(string1, string2):
+    if len(string1) == 0 or len(string2) == 0:
+        return 0.0
+    return Levenshtein.distance(string1, string2) / float(max(len(string1), len(string2)))
+
+
@@ -0,0 +1,148 @@
+try:
+    import lzma
+except ImportError:
+    from backports import lzma
+import json
+import struct
+
+#
+# Document store: a single file with all the fields of the documents pre-processed in a website, stored as raw UTF-8
+# (no base64) in independently compressed blocks of a fixed number of documents, so any document can be read by
+# decompressing a single block.
+#
+# File format:
+#   magic (8 bytes)
+#   block 1 ... block n: XZ-compressed concatenation of the fields of block_size documents; every field is stored
+#                        as its length in bytes (4-byte unsigned int) followed by its UTF-8 encoding
+#   index: offsets of the n blocks and of the end of the last block (8-byte unsigned ints)
+#   header: JSON object with the list of fields, the number of documents and the block size
+#   footer: offset of the index and length of the header (8-byte unsigned ints)
+#
+# Document ids start at 1, as in the rest of Bitextor (line numbers of the pre-processing files).
+#
+
+MAGIC = b"BTXDOCS1"
+FOOTER = struct.Struct("<QQ")
+LENGTH = struct.Struct("<I")
+
+
+class DocumentStoreWriter(object):
+
+    def __init__(self, path, fields, block_size=16):
+        self.fields = list(fields)
+        self.block_size = block_size
+        self.num_docs = 0
+        self.offsets = []
+        self.block = []
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+
+    def add(self, document):
+        """Adds a document, given as a dict or as a sequence with the values of the fields in order"""
+        if isinstance(document, dict):
+            document = [document.get(field, "") for field in self.fields]
+        for value in document:
+            encoded = value.encode("utf-8")
+            self.block.append(LENGTH.pack(len(encoded)))
+            self.block.append(encoded)
+        self.num_docs += 1
+        if self.num_docs % self.block_size == 0:
+            self._flush_block()
+
+    def _flush_block(self):
+        if self.block:
+            self.offsets.append(self.file.tell())
+            self.file.write(lzma.compress(b"".join(self.block), check=lzma.CHECK_NONE))
+            self.block = []
+
+    def close(self):
+        self._flush_block()
+        self.offsets.append(self.file.tell())
+        index_offset = self.file.tell()
+        self.file.write(struct.pack("<{0}Q".format(len(self.offsets)), *self.offsets))
+        header = json.dumps({"fields": self.fields, "num_docs": self.num_docs,
+                             "block_size": self.block_size}).encode("utf-8")
+        self.file.write(header)
+        self.file.write(FOOTER.pack(index_offset, len(header)))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class DocumentStoreReader(object):
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise Exception("{0} is not a document store".format(path))
+        self.file.seek(0, 2)
+        footer_offset = self.file.tell() - FOOTER.size
+        if footer_offset < len(MAGIC):
+            raise Exception("{0} is a truncated document store".format(path))
+        self.file.seek(footer_offset)
+        index_offset, header_length = FOOTER.unpack(self.file.read(FOOTER.size))
+        # A truncated file (for example, an interrupted pack) does not end with the footer
+        if not len(MAGIC) <= index_offset <= footer_offset - header_length:
+            raise Exception("{0} is a truncated document store".format(path))
+        self.file.seek(footer_offset - header_length)
+        try:
+            header = json.loads(self.file.read(header_length).decode("utf-8"))
+        except ValueError:
+            raise Exception("{0} is a truncated document store".format(path))
+        self.fields = header["fields"]
+        self.num_docs = header["num_docs"]
+        self.block_size = header["block_size"]
+        num_offsets = (footer_offset - header_length - index_offset) // 8
+        self.file.seek(index_offset)
+        self.offsets = struct.unpack("<{0}Q".format(num_offsets), self.file.read(num_offsets * 8))
+        # The last block read is kept, so reading documents in order decompresses every block once
+        self.cached_block = None
+        self.cached_documents = None
+
+    def __len__(self):
+        return self.num_docs
+
+    def _read_block(self, block):
+        if block != self.cached_block:
+            self.file.seek(self.offsets[block])
+            data = lzma.decompress(self.file.read(self.offsets[block + 1] - self.offsets[block]))
+            documents = []
+            position = 0
+            while position < len(data):
+                document = []
+                for _ in self.fields:
+                    length, = LENGTH.unpack_from(data, position)
+                    position += LENGTH.size
+                    document.append(data[position:position + length].decode("utf-8"))
+                    position += length
+                documents.append(document)
+            self.cached_block = block
+            self.cached_documents = documents
+        return self.cached_documents
+
+    def get(self, docid):
+        """Returns a dict with the fields of the document with id docid (starting at 1)"""
+        if docid < 1 or docid > self.num_docs:
+            raise KeyError(docid)
+        values = self._read_block((docid - 1) // self.block_size)[(docid - 1) % self.block_size]
+        return dict(zip(self.fields, values))
+
+    def get_field(self, docid, field):
+        return self.get(docid)[field]
+
+    def __iter__(self):
+        for docid in range(1, self.num_docs + 1):
+            yield self.get(docid)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,227 @@
+import json
+import mmap
+import struct
+from array import array
+
+import numpy as np
+
+from docfeatures import TagEncoder, Document, DOMAIN_RE, image_set, link_list, strip_domain, structure_representation
+
+#
+# Feature sidecar: the facts about every document of a website used by the features that rescore document alignment
+# candidates (see docfeatures.py and features/), extracted once from the HTML and the URLs after pre-processing, so
+# the features can be computed again (for example, to try new ranking models) without reading the HTML.
+#
+# Links and images are interned: every different link or image gets an integer id. The structure of the documents is
+# stored already encoded with a character per tag.
+#
+# File format:
+#   magic (8 bytes)
+#   structures: encoded structure of every document in UTF-8, one after another
+#   sections with the other data of the documents and the vocabularies of links and images, each of them either an
+#   array of ids (4-byte unsigned ints) or a blob of UTF-8 strings, with the offsets where the items of every
+#   document or string start (8-byte unsigned ints):
+#     structure offsets, has_structure (1 byte per document)
+#     url_paths, domains: URL without protocol and host, and protocol and host of the URL ('' if none)
+#     links: ids of the links of every document, in order of appearance and with repetitions
+#     images: sorted ids of the different images of every document
+#     self_links: id of the link equal to the URL line of every document (4-byte signed ints, -1 if no document
+#                 links to it)
+#     link_vocabulary, image_vocabulary
+#   header: JSON object with the number of documents, the dictionary of tags and the offsets of the sections
+#   footer: offset and length of the header (8-byte unsigned ints)
+#
+# Document ids start at 1, as in the rest of Bitextor (line numbers of the pre-processing files).
+#
+
+MAGIC = b"BTXFEAT1"
+FOOTER = struct.Struct("<QQ")
+
+
+class StringsBuilder(object):
+    """Blob of strings with the offsets where they start"""
+
+    def __init__(self):
+        self.blob = bytearray()
+        self.offsets = array("Q", [0])
+
+    def append(self, string):
+        self.blob += string.encode("utf-8")
+        self.offsets.append(len(self.blob))
+
+
+class IdListsBuilder(object):
+    """Lists of ids with the offsets where they start"""
+
+    def __init__(self):
+        self.ids = array("I")
+        self.offsets = array("Q", [0])
+
+    def append(self, ids):
+        self.ids.extend(ids)
+        self.offsets.append(len(self.ids))
+
+
+class FeatureStoreWriter(object):
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.encoder = TagEncoder()
+        self.structure_offsets = array("Q", [0])
+        self.has_structure = array("B")
+        self.url_paths = StringsBuilder()
+        self.domains = StringsBuilder()
+        self.links = IdListsBuilder()
+        self.images = IdListsBuilder()
+        self.urls = []
+        self.link_ids = {}
+        self.image_ids = {}
+
+    def add(self, url, html_content):
+        """Adds the next document, given the line of the URL file (with its new line) and its decoded HTML"""
+        structure = structure_representation(html_content, self.encoder)
+        encoded = structure.encode("utf-8") if structure is not None else b""
+        self.file.write(encoded)
+        self.structure_offsets.append(self.structure_offsets[-1] + len(encoded))
+        self.has_structure.append(structure is not None)
+
+        self.url_paths.append(strip_domain(url.strip(), url.strip()))
+        rx = DOMAIN_RE.match(url)
+        self.domains.append(rx.group(1) if rx is not None else "")
+        self.links.append(self.link_ids.setdefault(link, len(self.link_ids)) for link in link_list(html_content))
+        self.images.append(sorted(self.image_ids.setdefault(image, len(self.image_ids))
+                                  for image in image_set(html_content)))
+        self.urls.append(url)
+
+    def _write(self, data):
+        offset = self.file.tell()
+        self.file.write(data.tobytes() if hasattr(data, "tobytes") else bytes(data))
+        return offset
+
+    def close(self):
+        link_vocabulary = StringsBuilder()
+        for link in self.link_ids:
+            link_vocabulary.append(link)
+        image_vocabulary = StringsBuilder()
+        for image in self.image_ids:
+            image_vocabulary.append(image)
+        self_links = array("i", [self.link_ids.get(url, -1) for url in self.urls])
+
+        header = {"num_docs": len(self.urls), "tags": self.encoder.dic, "sections": {}}
+        sections = header["sections"]
+        sections["structures"] = len(MAGIC)
+        sections["structure_offsets"] = self._write(self.structure_offsets)
+        sections["has_structure"] = self._write(self.has_structure)
+        for name, strings in [("url_paths", self.url_paths), ("domains", self.domains),
+                              ("link_vocabulary", link_vocabulary), ("image_vocabulary", image_vocabulary)]:
+            sections[name] = self._write(strings.blob)
+            sections[name + "_offsets"] = self._write(strings.offsets)
+        for name, lists in [("links", self.links), ("images", self.images)]:
+            sections[name] = self._write(lists.ids)
+            sections[name + "_offsets"] = self._write(lists.offsets)
+        sections["self_links"] = self._write(self_links)
+        header["num_links"] = len(self.link_ids)
+        header["num_images"] = len(self.image_ids)
+        header["num_link_ids"] = len(self.links.ids)
+        header["num_image_ids"] = len(self.images.ids)
+
+        header_offset = self.file.tell()
+        encoded_header = json.dumps(header).encode("utf-8")
+        self.file.write(encoded_header)
+        self.file.write(FOOTER.pack(header_offset, len(encoded_header)))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class FeatureStoreReader(object):
+    """Reads the Document of any document id from the memory-mapped sidecar; links and images of the documents are
+    sets of ids and their URLs as links (self_link) are link ids, so features are the same as with the strings"""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise Exception("{0} is not a feature sidecar".format(path))
+        if len(self.map) < len(MAGIC) + FOOTER.size:
+            raise Exception("{0} is a truncated feature sidecar".format(path))
+        header_offset, header_length = FOOTER.unpack(self.map[-FOOTER.size:])
+        # The header is just before the footer, which is not the case in a truncated file (an interrupted write)
+        if header_offset < len(MAGIC) or header_offset + header_length + FOOTER.size != len(self.map):
+            raise Exception("{0} is a truncated feature sidecar".format(path))
+        header = json.loads(self.map[header_offset:header_offset + header_length].decode("utf-8"))
+        self.num_docs = n = header["num_docs"]
+        self.tags = header["tags"]
+        sections = header["sections"]
+
+        def section(name, dtype, count):
+            return np.frombuffer(self.map, dtype=dtype, count=count, offset=sections[name])
+
+        self.structure_offsets = section("structure_offsets", "<u8", n + 1)
+        self.has_structure = section("has_structure", "u1", n)
+        self.strings = {}
+        for name, count in [("url_paths", n), ("domains", n), ("link_vocabulary", header["num_links"]),
+                            ("image_vocabulary", header["num_images"])]:
+            self.strings[name] = (sections[name], section(name + "_offsets", "<u8", count + 1))
+        self.links = section("links", "<u4", header["num_link_ids"])
+        self.link_offsets = section("links_offsets", "<u8", n + 1)
+        self.images = section("images", "<u4", header["num_image_ids"])
+        self.image_offsets = section("images_offsets", "<u8", n + 1)
+        self.self_links = section("self_links", "<i4", n)
+        self.structures_start = sections["structures"]
+
+    def __len__(self):
+        return self.num_docs
+
+    def _string(self, name, i):
+        start, offsets = self.strings[name]
+        return self.map[start + int(offsets[i]):start + int(offsets[i + 1])].decode("utf-8")
+
+    def link(self, link_id):
+        return self._string("link_vocabulary", link_id)
+
+    def image(self, image_id):
+        return self._string("image_vocabulary", image_id)
+
+    def get(self, docid):
+        """Returns the Document with id docid (starting at 1)"""
+        if docid < 1 or docid > self.num_docs:
+            raise KeyError(docid)
+        i = docid - 1
+        links = self.links[self.link_offsets[i]:self.link_offsets[i + 1]].tolist()
+        doc = Document()
+        doc.self_link = int(self.self_links[i])
+        doc.url_path = self._string("url_paths", i)
+        doc.images = set(self.images[self.image_offsets[i]:self.image_offsets[i + 1]].tolist())
+        doc.links = set(links)
+        link_string = "".join(self.link(link_id) for link_id in links)
+        domain = self._string("domains", i)
+        doc.link_string = link_string.replace(domain, "") if domain else link_string
+        if self.has_structure[i]:
+            start = self.structures_start + int(self.structure_offsets[i])
+            doc.structure = self.map[start:self.structures_start + int(self.structure_offsets[i + 1])].decode("utf-8")
+        else:
+            doc.structure = None
+        return doc
+
+    def __iter__(self):
+        for docid in range(1, self.num_docs + 1):
+            yield self.get(docid)
+
+    def close(self):
+        # Arrays are views of the mapped file, so they have to be released before closing it
+        self.structure_offsets = self.has_structure = self.links = self.link_offsets = self.images = None
+        self.image_offsets = self.self_links = self.strings = None
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,131 @@
+import math
+import os
+import tempfile
+
+import numpy as np
+
+# Number of digests of every bucket of the lookup table of the stored digests, read from disk for every hit of the
+# Bloom filter
+BUCKET_DIGESTS = 4096
+
+
+class PersistentHashStore(object):
+    """Set of content hashes shared across runs and websites. Hashes are appended to a binary file (one fixed-size
+    digest after another), which is the authority on membership: a Bloom filter of bounded size is kept in memory, so
+    hashes that are not stored are rejected without reading the disk, and every hit of the filter is checked against
+    the exact digests (the ones stored when the file was opened, bucketed in a temporary lookup table on disk next to
+    the store, and the ones added since then, kept in memory). Membership tests are exact; false positives of the
+    filter only cost a lookup, and are counted in false_positives. Several processes can append to the same file;
+    each of them only sees the hashes stored when it opened the file and the ones it added itself. Every digest is
+    appended with a single unbuffered write"""
+
+    def __init__(self, path, memory=256 * 1024 * 1024, digest_size=16):
+        self.path = path
+        self.digest_size = digest_size
+        self.num_bits = memory * 8
+        self.bits = np.zeros(memory, dtype=np.uint8)
+        self.added = set()
+        self.false_positives = 0
+
+        self.writer = open(path, "ab", buffering=0)
+        size = os.fstat(self.writer.fileno()).st_size
+        if size % digest_size:
+            # A partial digest at the end of the file (an interrupted write) is removed, so the digests appended
+            # after it are read at the right offsets
+            self.writer.truncate(size - size % digest_size)
+        stored = size // digest_size
+        # The number of hash functions is optimal for twice the hashes already stored (or one million of them)
+        expected = max(2 * stored, 1000000)
+        self.num_hashes = min(16, max(1, int(round(float(self.num_bits) / expected * math.log(2)))))
+
+        # Lookup table: the stored digests grouped by bucket (the first 8 bytes of the digest modulo the number of
+        # buckets), with the offsets where every bucket starts
+        self.num_buckets = max(1, -(-stored // BUCKET_DIGESTS))
+        self.table_file = None
+        self.table = None
+        self.offsets = np.zeros(self.num_buckets + 1, dtype=np.int64)
+        if stored > 0:
+            counts = np.zeros(self.num_buckets, dtype=np.int64)
+            for digests in self._read_stored(stored):
+                self._add_many(digests)
+                counts += np.bincount(self._buckets(digests), minlength=self.num_buckets)
+            self.offsets[1:] = np.cumsum(counts)
+
+            self.table_file = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(path)),
+                                                     prefix=".hashstore.")
+            self.table_file.truncate(stored * digest_size)
+            self.table = np.memmap(self.table_file, dtype=np.uint8, mode="r+", shape=(stored, digest_size))
+            filled = self.offsets[:-1].copy()
+            for digests in self._read_stored(stored):
+                buckets = self._buckets(digests)
+                order = np.argsort(buckets, kind="stable")
+                sorted_buckets = buckets[order]
+                chunk_counts = np.bincount(buckets, minlength=self.num_buckets)
+                # Position of every digest of the chunk: where its bucket is filled up to, plus its rank in the bucket
+                ranks = np.arange(len(order)) - (np.cumsum(chunk_counts) - chunk_counts)[sorted_buckets]
+                self.table[filled[sorted_buckets] + ranks] = digests[order]
+                filled += chunk_counts
+            self.table.flush()
+
+    def _read_stored(self, stored):
+        """Yields arrays with the digests stored when the file was opened"""
+        with open(self.path, "rb") as reader:
+            remaining = stored * self.digest_size
+            while remaining > 0:
+                chunk = reader.read(min(remaining, self.digest_size * 1000000))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield np.frombuffer(chunk, dtype=np.uint8).reshape(-1, self.digest_size)
+
+    def _positions(self, h1, h2):
+        # Double hashing on the two halves of the digest, which are already uniformly distributed
+        with np.errstate(over="ignore"):
+            return [(h1 + np.uint64(i) * h2) % np.uint64(self.num_bits) for i in range(self.num_hashes)]
+
+    def _split(self, digests):
+        half = self.digest_size // 2
+        h1 = np.frombuffer(np.ascontiguousarray(digests[:, :8]).tobytes(), dtype=np.uint64)
+        h2 = np.frombuffer(np.ascontiguousarray(digests[:, half:half + 8]).tobytes(), dtype=np.uint64)
+        return h1, h2
+
+    def _buckets(self, digests):
+        h1, _ = self._split(digests)
+        return (h1 % np.uint64(self.num_buckets)).astype(np.int64)
+
+    def _add_many(self, digests):
+        h1, h2 = self._split(digests)
+        for positions in self._positions(h1, h2):
+            np.bitwise_or.at(self.bits, positions >> np.uint64(3), np.left_shift(1, positions & np.uint64(7))
+                             .astype(np.uint8))
+
+    def _stored(self, digests):
+        if self.table is None:
+            return False
+        bucket = int(self._buckets(digests)[0])
+        candidates = self.table[self.offsets[bucket]:self.offsets[bucket + 1]]
+        return bool((candidates == digests[0]).all(axis=1).any())
+
+    def __contains__(self, digest):
+        digests = np.frombuffer(digest, dtype=np.uint8).reshape(1, -1)
+        h1, h2 = self._split(digests)
+        for positions in self._positions(h1, h2):
+            position = int(positions[0])
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                return False
+        if digest in self.added or self._stored(digests):
+            return True
+        self.false_positives += 1
+        return False
+
+    def add(self, digest):
+        self._add_many(np.frombuffer(digest, dtype=np.uint8).reshape(1, -1))
+        self.added.add(bytes(digest))
+        self.writer.write(digest)
+
+    def close(self):
+        self.writer.close()
+        if self.table_file is not None:
+            # The array is a view of the mapped file, so it has to be released before closing it
+            self.table = None
+            self.table_file.close()
@@ -0,0 +1,82 @@
+import zlib
+
+import numpy as np
+
+# Mersenne prime used as modulus for the universal hash functions that simulate the permutations
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+class MinHasher(object):
+    """Computes MinHash fingerprints of texts from the set of their word n-grams (shingles). Shingles are hashed with
+    CRC32 and permutations are generated from a fixed seed, so fingerprints are the same in every process and run"""
+
+    def __init__(self, num_perm=128, shingle_size=3, seed=1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        generator = np.random.RandomState(seed)
+        self.a = generator.randint(1, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+        self.b = generator.randint(0, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text):
+        words = text.split()
+        n = self.shingle_size
+        return set(" ".join(words[i:i + n]) for i in range(max(len(words) - n + 1, 1)))
+
+    def fingerprint(self, text):
+        hashes = np.array([zlib.crc32(s.encode("utf-8")) for s in self.shingles(text)], dtype=np.uint64)
+        # Overflow in the product is intended: it is the usual approximation of (a*h+b) mod p with 64-bit integers
+        with np.errstate(over="ignore"):
+            permuted = (np.outer(hashes, self.a) + self.b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+def jaccard(fingerprint1, fingerprint2):
+    """Estimation of the Jaccard similarity of the shingle sets of two texts from their MinHash fingerprints"""
+    return float(np.count_nonzero(fingerprint1 == fingerprint2)) / len(fingerprint1)
+
+
+def choose_bands(threshold, num_perm):
+    """Chooses the number of bands and rows per band of the LSH index so that documents with a similarity around the
+    threshold are very likely to share a band; candidates are verified afterwards, so recall is favoured"""
+    bands, rows = num_perm, 1
+    for r in range(1, num_perm + 1):
+        if num_perm % r != 0:
+            continue
+        b = num_perm // r
+        if (1.0 / b) ** (1.0 / r) <= threshold - 0.1:
+            bands, rows = b, r
+    return bands, rows
+
+
+class MinHashLSH(object):
+    """Banded LSH index of MinHash fingerprints. query() returns the key of the first document inserted whose
+    estimated similarity with the fingerprint is at least the threshold, or None if there is no such document"""
+
+    def __init__(self, threshold, num_perm=128):
+        self.threshold = threshold
+        self.bands, self.rows = choose_bands(threshold, num_perm)
+        self.buckets = [{} for _ in range(self.bands)]
+        self.keys = []
+        self.fingerprints = []
+
+    def band_keys(self, fingerprint):
+        for band in range(self.bands):
+            yield fingerprint[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def query(self, fingerprint):
+        candidates = set()
+        for band, band_key in enumerate(self.band_keys(fingerprint)):
+            candidates.update(self.buckets[band].get(band_key, ()))
+        # Candidates are checked in insertion order, so the result does not depend on hash ordering
+        for candidate in sorted(candidates):
+            if jaccard(fingerprint, self.fingerprints[candidate]) >= self.threshold:
+                return self.keys[candidate]
+        return None
+
+    def insert(self, key, fingerprint):
+        docid = len(self.keys)
+        self.keys.append(key)
+        self.fingerprints.append(fingerprint)
+        for band, band_key in enumerate(self.band_keys(fingerprint)):
+            self.buckets[band].setdefault(band_key, []).append(docid)
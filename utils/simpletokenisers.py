@@ -0,0 +1,29 @@
+import re
+
+#
+# Regular-expression tokeniser and sentence splitter, fast enough to be run in-process (for example, with
+# --wordtokeniser1 py:simpletokenisers:tokenise). They are meant for indexing and document matching in languages
+# written with spaces between words, where the fidelity of Moses tools is not needed.
+#
+
+_TOKEN = re.compile(r"\w+(?:[-'’.]\w+)*|[^\w\s]", re.UNICODE)
+_SENTENCE_END = re.compile(r"[.!?…]+[\"'”»)\]]*(\s+)[\"'“«(\[¿¡]*(\w)", re.UNICODE)
+
+
+def tokenise(line):
+    """Splits a line into words and punctuation marks, separated by spaces in the result"""
+    return " ".join(_TOKEN.findall(line))
+
+
+def split_sentences(line):
+    """Splits a line after the end marks (and closing quotes or brackets) followed by space and a word starting with
+    an uppercase letter; returns the list of sentences"""
+    line = line.strip()
+    sentences = []
+    start = 0
+    for match in _SENTENCE_END.finditer(line):
+        if match.group(2).isupper():
+            sentences.append(line[start:match.start(1)])
+            start = match.end(1)
+    sentences.append(line[start:])
+    return [sentence for sentence in sentences if sentence]
@@ -0,0 +1,91 @@
+try:
+    import lzma
+except ImportError:
+    from backports import lzma
+import gzip
+import io
+import re
+
+#
+# Raw access to the records of WARC files, used to split them and to index them.
+#
+# Records are copied byte by byte (they are not parsed and serialised again) and, when they are written compressed,
+# every record is a gzip member or an XZ stream of its own, so any range of records of a WARC file can be read without
+# decompressing the rest of the file.
+#
+# Index (one line per record, tab separated):
+#   WARC file   offset   length   URI   content type
+# where offset and length are the position of the record in the (compressed) WARC file and the content type is the
+# one of the HTTP response if the record has one, or the one in the WARC headers otherwise.
+#
+
+EXTENSIONS = {"gzip": ".warc.gz", "xz": ".warc.xz", "none": ".warc"}
+
+
+def iter_raw_records(fileobj):
+    """Yields the raw bytes, the URI and the content type of each record of an uncompressed WARC stream"""
+    while True:
+        version = fileobj.readline()
+        if not version:
+            return
+        if version in (b"\r\n", b"\n"):
+            continue
+        if not version.startswith(b"WARC/"):
+            raise IOError("Bad version line: %r" % version)
+        parts = [version]
+        headers = {}
+        while True:
+            line = fileobj.readline()
+            if not line:
+                raise IOError("Unexpected end of file in the headers of a WARC record")
+            parts.append(line)
+            if line == b"\r\n":
+                break
+            name, _, value = line.partition(b":")
+            headers[name.strip().lower()] = value.strip()
+        block = fileobj.read(int(headers[b"content-length"]))
+        parts.append(block)
+        # The two line breaks that end the record
+        parts.append(fileobj.readline())
+        parts.append(fileobj.readline())
+
+        content_type = headers.get(b"content-type", b"-")
+        if block[:5] == b"HTTP/":
+            http_headers = block[:block.find(b"\r\n\r\n")]
+            match = re.search(rb"^content-type:[ \t]*([^\r\n]*)", http_headers, flags=re.IGNORECASE | re.MULTILINE)
+            if match:
+                content_type = match.group(1).strip()
+        yield (b"".join(parts), headers.get(b"warc-target-uri", b"-").decode("utf-8", errors="replace"),
+               content_type.decode("iso-8859-1"))
+
+
+def compress_record(raw, compression):
+    if compression == "gzip":
+        return gzip.compress(raw)
+    elif compression == "xz":
+        return lzma.compress(raw, format=lzma.FORMAT_XZ)
+    return raw
+
+
+def read_index(index_path):
+    """Returns a list with a tuple (WARC file, offset, length, URI, content type) for every record in an index"""
+    records = []
+    opener = lzma.open if index_path[-3:] == ".xz" else open
+    with opener(index_path, "rt") as index:
+        for line in index:
+            warc_file, offset, length, uri, content_type = line.rstrip("\n").split("\t")
+            records.append((warc_file, int(offset), int(length), uri, content_type))
+    return records
+
+
+def open_range(warc_path, offset, length):
+    """Returns a file object with the uncompressed records found in length bytes of a WARC file starting at offset;
+    it can be read with warc.WARCFile(fileobj=...). The range must start and end at record boundaries"""
+    with open(warc_path, "rb") as reader:
+        reader.seek(offset)
+        data = reader.read(length)
+    if warc_path[-3:] == ".gz":
+        data = gzip.decompress(data)
+    elif warc_path[-3:] == ".xz":
+        data = lzma.decompress(data, format=lzma.FORMAT_XZ)
+    return io.BytesIO(data)